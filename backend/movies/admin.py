@@ -9,6 +9,7 @@ from .models import Person, MoviesDirectors, MoviesActors
 from .models import OscarCategory, OscarWinsMovie, OscarWinsPerson
 from .models import Comments, Ratings, MovieList, MovieListMovies
 from .models import User
+from .counters import MOVIE_COUNTERS
 
 
 class UserAdmin(BaseUserAdmin):
@@ -44,6 +45,14 @@ class MovieAdmin(admin.ModelAdmin):
     ordering = ('id',)
     list_per_page = 50
 
+    def save_model(self, request, obj, form, change):
+        if not change:
+            return super().save_model(request, obj, form, change)
+
+        # The counters loaded with the form may be stale by now, the signals keep the stored ones current
+        obj.save(update_fields=[field.name for field in Movie._meta.concrete_fields
+                                if not field.primary_key and field.name not in MOVIE_COUNTERS])
+
     def genre(self, obj):
         return ', '.join([str(genre) for genre in obj.genres.all()])
 
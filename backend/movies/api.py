@@ -1,11 +1,11 @@
-from django.shortcuts import get_object_or_404
-from django.db.models import Count, Q, Value
-from django.db.models.functions import Concat
+from django.shortcuts import get_object_or_404, aget_object_or_404
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Exists, F, OuterRef, Q
 
-from ninja.pagination import paginate, PageNumberPagination
 from ninja import NinjaAPI, Query
 
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
 from django.contrib.auth import authenticate, login, logout
 from django.core.validators import validate_email
 from django.core.exceptions import ValidationError
@@ -14,118 +14,111 @@ from django.contrib.auth.password_validation import validate_password
 
 from django.utils import timezone
 
-from movies.models import Movie, Genre, Person, OscarWinsMovie, OscarWinsPerson, MoviesActors, MoviesDirectors
-from movies.models import User, Comments, Ratings, MovieList, MovieListMovies
+from movies.models import Movie, Genre, Person, OscarWinsPerson, MoviesActors, MoviesDirectors
+from movies.models import User, Comments, Ratings, MovieList, MovieListMovies, MovieSimilarity
+from movies.models import UserNeighborhood, UserRecommendation
 
-from movies.schemas import (MovieListSchema, GenreSchema, PersonSchema, OscarWinsMovieSchema, OscarWinsPersonSchema,
-                            ActorSchemaForMovies, DirectorSchemaForMovies, MoviePageSchema, ActorFilmographySchema,
+from movies.schemas import (MovieListSchema, GenreSchema, PersonSchema, PersonListSchema, OscarWinsPersonSchema,
+                            MoviePageSchema, ActorFilmographySchema,
                             CommentMovieSchema, CommentCreateSchema, CommentEditSchema,
-                            RatingCreateSchema, RatingEditSchema, RatingMovieSchema,
+                            RatingCreateSchema, RatingEditSchema, RatingMovieSchema, RatingBatchSchema,
+                            BatchResultSchema, ListMoviesBatchSchema,
                             RecommendedMoviesSchema, PredictedMoviesSchema, ListedMoviesSchema, ListCreateSchema,
-                            ListUpdateSchema, AddMovieToList, MovieListsSchema, MovieInList, PersonSchemaForMovies)
+                            ListUpdateSchema, AddMovieToList, MovieListsSchema, MovieInList)
 
+from movies.schemas import OscarWinSchema, CeremonySchema
 from movies.schemas import UserOut, LoginIn, Register, ProfileInfo, EditProfileInfo
 
-from collections import OrderedDict
-from sklearn.neighbors import NearestNeighbors
-from django_pandas.io import read_frame
-from django.db.models import Prefetch
-from sklearn.feature_extraction.text import CountVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import pandas as pd
+from movies.pagination import KeysetPagination, paged_schema, paginate
+from movies.pages import aget_movie_page, get_ceremony_page, oscar_wins_queryset
+from movies.cache import catalog_cached, ratings_changed
+from movies.counters import adjust_rating_summaries
+from movies.instrumentation import statement_table
+from movies.metrics import metrics
+from movies.streaming import stream_ndjson, stream_json_array, astream_ndjson, astream_json_array
+from movies.search import search_movies
+from movies.recommender import loaded_rating_matrix
 
 from ninja.security import django_auth
 
+from typing import Literal, Union
+
 app = NinjaAPI(csrf=True)
 
+MOVIE_LIST_RELATIONS = ('genres', 'directors', 'actors')
 
-@app.get("/movies", response=list[MovieListSchema], )
-@paginate(PageNumberPagination, page_size=8)
-def get_movies(request):
-    return Movie.objects.annotate(num_oscar_wins=Count('oscar_wins')).order_by('-num_oscar_wins', '-release_year')
 
+async def fetch_all(queryset):
+    return [row async for row in queryset]
 
-@app.get("/movies/{movie_id}", response=MoviePageSchema)
-def get_movie(request, movie_id):
-    movie = get_object_or_404(Movie, id=movie_id)
-
-    oscar_wins = OscarWinsMovie.objects.filter(movie_id=movie_id).values('id', 'category__name', 'year', 'ceremony', 'movie')
-
-    movies_with_actors = MoviesActors.objects.filter(movie_id=movie_id).values('actor__id', 'actor__first_name', 'actor__last_name', 'character')
-
-    movies_with_directors = MoviesDirectors.objects.filter(movie_id=movie_id).values('director__id', 'director__first_name', 'director__last_name')
-
-    actor_oscar_win = OscarWinsPerson.objects.filter(movie=movie_id).values('person__id', 'person__first_name', 'person__last_name', 'category__name')
-
-    movie_oscar_wins_data = [
-        OscarWinsMovieSchema(
-            id=win['id'],
-            category=win['category__name'],
-            year=win['year'],
-            ceremony=win['ceremony'],
-            person=next((
-                PersonSchemaForMovies(
-                    id=p['person__id'],
-                    first_name=p['person__first_name'],
-                    last_name=p['person__last_name']
-                )
-                for p in actor_oscar_win if p['category__name'] == win['category__name']), None)
-        )
-        for win in oscar_wins
-    ]
 
-    movies_with_actors_data = [
-        ActorSchemaForMovies(
-            id=actor['actor__id'], 
-            first_name=actor['actor__first_name'], 
-            last_name=actor['actor__last_name'], 
-            character=actor['character'])
-        for actor in movies_with_actors 
-    ]
+MOVIE_ORDERINGS = {
+    'oscars': ('-num_oscar_wins', '-release_year', '-id'),
+    'rating': ('-average_rating', '-num_ratings', '-id'),
+}
 
-    movies_with_directors_data = [
-        DirectorSchemaForMovies(
-            id=director['director__id'], 
-            first_name=director['director__first_name'], 
-            last_name=director['director__last_name'])
-        for director in movies_with_directors   
-    ]
 
-    return MoviePageSchema(
-        id=movie.id,
-        release_year=movie.release_year,
-        title=movie.title,
-        tagline=movie.tagline,
-        runtime=movie.runtime,
-        budget=movie.budget,
-        revenue=movie.revenue,
-        overview=movie.overview,
-        genres=movie.genres,
-        actors=movies_with_actors_data,
-        directors=movies_with_directors_data,
-        movie_oscar_wins=movie_oscar_wins_data,
-    )
+@app.get("/movies", response=list[MovieListSchema], )
+@paginate(KeysetPagination, page_size=8)
+async def get_movies(request, sort: Literal['oscars', 'rating'] = Query('oscars')):
+    return Movie.objects.order_by(*MOVIE_ORDERINGS[sort]).prefetch_related(*MOVIE_LIST_RELATIONS)
+
+
+@app.get("/movies/{movie_id}", response=MoviePageSchema)
+@catalog_cached(MoviePageSchema)
+async def get_movie(request, movie_id):
+    return await aget_movie_page(movie_id)
 
 
 @app.get("/genres", response=list[GenreSchema])
+@catalog_cached(list[GenreSchema])
 def get_genres(request):
     return Genre.objects.all()
 
 
 @app.get("/genres/{genre_id}", response=GenreSchema)
+@catalog_cached(GenreSchema)
 def get_genre(request, genre_id):
     return get_object_or_404(Genre, id=genre_id)
 
 
-@app.get("/people", response=list[PersonSchema])
-def get_people(request):
-    return Person.objects.all()
+def filter_people(queryset, name, has_oscar):
+    if name:
+        queryset = queryset.filter(Q(first_name__istartswith=name) | Q(last_name__istartswith=name))
+
+    if has_oscar is not None:
+        oscar_wins = OscarWinsPerson.objects.filter(person=OuterRef('pk'))
+        queryset = queryset.filter(Exists(oscar_wins) if has_oscar else ~Exists(oscar_wins))
+
+    return queryset
+
+
+@app.get("/people", response=list[PersonListSchema])
+@paginate(KeysetPagination, page_size=50)
+def get_people(request, name: str = Query(None), has_oscar: bool = Query(None)):
+    return filter_people(Person.objects.order_by('id'), name, has_oscar)
+
+
+@app.get("/people/stream")
+def stream_people(request, name: str = Query(None), has_oscar: bool = Query(None), format: str = Query('ndjson')):
+    people = filter_people(Person.objects.order_by('id'), name, has_oscar).values(
+        'id', 'first_name', 'last_name', 'birthday', 'place_of_birth', 'biography')
+
+    # Under ASGI a sync iterator would be read into a list before the first byte is sent
+    if isinstance(request, ASGIRequest):
+        rows, to_ndjson, to_json_array = people.aiterator(chunk_size=2000), astream_ndjson, astream_json_array
+    else:
+        rows, to_ndjson, to_json_array = people.iterator(chunk_size=2000), stream_ndjson, stream_json_array
+
+    if format == 'json':
+        return StreamingHttpResponse(to_json_array(rows), content_type='application/json')
+
+    return StreamingHttpResponse(to_ndjson(rows), content_type='application/x-ndjson')
 
 
 @app.get("/people/{person_id}", response=PersonSchema)
-def get_person(request, person_id):
-    person = get_object_or_404(Person, id=person_id)
-    
+@catalog_cached(PersonSchema)
+async def get_person(request, person_id):
     oscar_wins = OscarWinsPerson.objects.filter(person_id=person_id).values('id', 'movie', 'movie__title', 'category__name', 'year', 'ceremony').order_by('year')
 
     person_acted = MoviesActors.objects.filter(actor=person_id).values('movie__id', 'movie__title', 'movie__release_year')
@@ -134,6 +127,11 @@ def get_person(request, person_id):
 
     person_filmography = person_acted.union(person_directed, all=False).order_by('-movie__release_year')
 
+    # Async ORM calls share one connection through thread-sensitive sync_to_async, so these run one after another
+    person = await aget_object_or_404(Person, id=person_id)
+    oscar_wins = await fetch_all(oscar_wins)
+    person_filmography = await fetch_all(person_filmography)
+
     oscar_wins_data = [
         OscarWinsPersonSchema(
             id=win['id'], 
@@ -165,29 +163,56 @@ def get_person(request, person_id):
     )
 
 
-@app.get("/oscar_wins", response=list[OscarWinsMovieSchema])
-def get_oscar_wins(request):
-    return OscarWinsMovie.objects.all()
+@app.get("/oscar_wins", response=list[OscarWinSchema])
+@catalog_cached(paged_schema(OscarWinSchema))
+@paginate(KeysetPagination, page_size=50)
+def get_oscar_wins(request, year_from: int = Query(None), year_to: int = Query(None), ceremony: int = Query(None),
+                   category: int = Query(None), movie: int = Query(None)):
+    oscar_wins = oscar_wins_queryset().order_by('ceremony', 'category_id', 'id')
+
+    if year_from:
+        oscar_wins = oscar_wins.filter(year__gte=year_from)
+
+    if year_to:
+        oscar_wins = oscar_wins.filter(year__lte=year_to)
+
+    if ceremony:
+        oscar_wins = oscar_wins.filter(ceremony=ceremony)
+
+    if category:
+        oscar_wins = oscar_wins.filter(category_id=category)
+
+    if movie:
+        oscar_wins = oscar_wins.filter(movie_id=movie)
+
+    return oscar_wins
+
+
+@app.get("/ceremonies/{ceremony}", response=CeremonySchema)
+@catalog_cached(CeremonySchema)
+def get_ceremony(request, ceremony: int):
+    return get_ceremony_page(ceremony)
 
 
 @app.get("/search", response=list[MovieListSchema])
-@paginate(PageNumberPagination, page_size=8)
-def search_movies_dist(request, query: str = Query(None), 
+@paginate(KeysetPagination, page_size=8)
+async def search_movies_dist(request, query: str = Query(None), 
                        genre: list[int] = Query(None),
                        start_year: str = Query(None),
                        end_year: str = Query(None),
                        runtime_min: str = Query(None),
-                       runtime_max: str = Query(None)):
+                       runtime_max: str = Query(None),
+                       sort: Literal['oscars', 'rating'] = Query(None)):
     
-    queryset = Movie.objects.annotate(
-        actor_name=Concat('actors__first_name', Value(' '), 'actors__last_name'),
-        director_name=Concat('directors__first_name', Value(' '), 'directors__last_name'),
-        num_oscar_wins=Count('oscar_wins')
-    ).order_by('-num_oscar_wins', '-release_year')
+    result = Movie.objects.all()
 
-    result = queryset.filter(Q(title__icontains=query) | 
-                                Q(actor_name__icontains=query) | 
-                                Q(director_name__icontains=query))
+    if query:
+        result = search_movies(result, query)
+
+    if query and not sort:
+        result = result.order_by('-rank', '-similarity', *MOVIE_ORDERINGS['oscars'])
+    else:
+        result = result.order_by(*MOVIE_ORDERINGS[sort or 'oscars'])
 
     if start_year:
         result = result.filter(release_year__gte=start_year)
@@ -205,9 +230,7 @@ def search_movies_dist(request, query: str = Query(None),
     if runtime_max:
         result = result.filter(runtime__lte=runtime_max)
 
-    result = list(OrderedDict.fromkeys(result))
-
-    return result
+    return result.prefetch_related(*MOVIE_LIST_RELATIONS)
 
 
 @app.get("/me", response=UserOut)
@@ -341,23 +364,47 @@ def edit_profile_data(request, user_id, data: EditProfileInfo):
     return JsonResponse({"success": "Profile updated successfully"})
 
 
-@app.get("/movies/{movie_id}/comments", response=list[CommentMovieSchema])
-def get_comments(request, movie_id: int):
-    comments = Comments.objects.filter(movie=movie_id).select_related('user').order_by('-created_at').all()
+comment_pagination = KeysetPagination(page_size=50)
+
+
+def comment_schema(comment, local_timezone):
+    return CommentMovieSchema(
+        id=comment.id,
+        user_id=comment.user_id,
+        username=comment.user.username,
+        comment=comment.comment,
+        created_at=comment.created_at.astimezone(local_timezone).strftime("%Y-%m-%d %H:%M:%S"),
+        updated_at=comment.updated_at.astimezone(local_timezone).strftime("%Y-%m-%d %H:%M:%S")
+    )
+
 
+@app.get("/movies/{movie_id}/comments", response=Union[list[CommentMovieSchema], paged_schema(CommentMovieSchema)])
+async def get_comments(request, movie_id: int, cursor: str = Query(None)):
+    comments = Comments.objects.filter(movie=movie_id).select_related('user').order_by('-created_at', '-id')
     local_timezone = timezone.get_current_timezone()
 
-    return [
-        CommentMovieSchema(
-            id=comment.id,
-            user_id=comment.user.id,
-            username=comment.user.username,
-            comment=comment.comment,
-            created_at=comment.created_at.astimezone(local_timezone).strftime("%Y-%m-%d %H:%M:%S"),
-            updated_at=comment.updated_at.astimezone(local_timezone).strftime("%Y-%m-%d %H:%M:%S")
-        ) 
-        for comment in comments
-    ]
+    # Without a cursor only the newest page, as the plain list older clients expect. A cursor (empty for the
+    # first page) pages through the rest, with the movie's maintained comment count.
+    if cursor is None:
+        newest = await fetch_all(comments[:comment_pagination.page_size])
+
+        if not newest and not await Movie.objects.filter(id=movie_id).aexists():
+            return JsonResponse({"error": "Movie not found"}, status=404)
+
+        return [comment_schema(comment, local_timezone) for comment in newest]
+
+    count = await Movie.objects.filter(id=movie_id).values_list('num_comments', flat=True).afirst()
+
+    if count is None:
+        return JsonResponse({"error": "Movie not found"}, status=404)
+
+    page = await comment_pagination.apaginate_queryset(comments, KeysetPagination.Input(cursor=cursor))
+
+    return {
+        'items': [comment_schema(comment, local_timezone) for comment in page['items']],
+        'count': count,
+        'next': page['next'],
+    }
 
 
 @app.post("/movies/{movie_id}/comments", auth=django_auth)
@@ -413,23 +460,29 @@ def get_rating(request, movie_id: int, user_id: int):
 
 @app.post("/movies/{movie_id}/ratings", auth=django_auth)
 def add_rating(request, movie_id: int, data: RatingCreateSchema):
-    user = User.objects.get(id=data.user_id)
-    
-    Ratings.objects.create(
-        user=user,
-        movie_id=movie_id,
-        rating=data.rating
-    )
+    # The movie's rating summary is adjusted by the save signal, within this transaction. Locking the user
+    # orders this insert after a batch of theirs that may upsert the same movie, see batch_ratings.
+    try:
+        with transaction.atomic():
+            user = User.objects.select_for_update().get(id=data.user_id)
+            Ratings.objects.create(
+                user=user,
+                movie_id=movie_id,
+                rating=data.rating
+            )
+    except IntegrityError:
+        return JsonResponse({"error": "Movie already rated"}, status=409)
 
     return JsonResponse({"success": "Rating submitted successfully"})
 
 
 @app.put("/movies/{movie_id}/ratings/{rating_id}/update", auth=django_auth)
 def edit_rating(request, movie_id: int, rating_id: int, data: RatingEditSchema):
-    rating = get_object_or_404(Ratings, id=rating_id, movie_id=movie_id)
-
-    rating.rating = data.rating
-    rating.save()
+    # Locked so the previous rating the save signal reads is still current when the update lands
+    with transaction.atomic():
+        rating = get_object_or_404(Ratings.objects.select_for_update(), id=rating_id, movie_id=movie_id)
+        rating.rating = data.rating
+        rating.save()
 
     return JsonResponse({"success": "Rating edited successfully"})
 
@@ -437,124 +490,229 @@ def edit_rating(request, movie_id: int, rating_id: int, data: RatingEditSchema):
 def delete_rating(request, movie_id: int, rating_id: int):
     try:
         rating = get_object_or_404(Ratings, id=rating_id, movie_id=movie_id)
-        rating.delete()
+        with transaction.atomic():
+            rating.delete()
         return JsonResponse({"success": "Rating deleted successfully"})
     except Exception as e:
         return JsonResponse({"error": "Failed to delete rating"}, status=500)
 
 
+BATCH_MAX_ITEMS = 500
+
+
+def batch_error(movie_id, error):
+    return {'movie_id': movie_id, 'status': 'error', 'error': error}
+
+
+@app.post("/ratings/batch", response=BatchResultSchema, auth=django_auth)
+def batch_ratings(request, data: RatingBatchSchema):
+    if len(data.ratings) > BATCH_MAX_ITEMS:
+        return JsonResponse({"error": f"At most {BATCH_MAX_ITEMS} ratings per batch"}, status=400)
+
+    # A movie given twice keeps its last rating, one statement cannot upsert the same row twice
+    ratings = {item.movie_id: item.rating for item in data.ratings}
+    known_movies = set(Movie.objects.filter(id__in=ratings).values_list('id', flat=True))
+
+    results = {}
+    for movie_id, rating in ratings.items():
+        if movie_id not in known_movies:
+            results[movie_id] = batch_error(movie_id, "Movie not found")
+        elif not 1 <= rating <= 5:
+            results[movie_id] = batch_error(movie_id, "Rating must be between 1 and 5")
+
+    valid = {movie_id: rating for movie_id, rating in ratings.items() if movie_id not in results}
+    user_id = request.user.id
+
+    with transaction.atomic():
+        # The previous ratings must not change before the upsert: the stored rows are locked, and so is the user,
+        # which keeps a concurrent insert for the same movie from turning one of them into a second "created"
+        User.objects.select_for_update().filter(id=user_id).values_list('id').get()
+        rated = dict(Ratings.objects.select_for_update().filter(user_id=user_id, movie_id__in=valid)
+                     .values_list('movie_id', 'rating'))
+
+        Ratings.objects.bulk_create(
+            [Ratings(user_id=user_id, movie_id=movie_id, rating=rating) for movie_id, rating in valid.items()],
+            update_conflicts=True, unique_fields=['user', 'movie'], update_fields=['rating', 'updated_at'])
+
+        # bulk_create sends no post_save, so the rating summaries and the rating matrix are updated here
+        adjust_rating_summaries({movie_id: (rated.get(movie_id), rating) for movie_id, rating in valid.items()})
+
+        rating_matrix = loaded_rating_matrix()
+
+        if rating_matrix is not None:
+            def update_rating_matrix():
+                for movie_id, rating in valid.items():
+                    rating_matrix.set_rating(user_id, movie_id, rating)
+
+            transaction.on_commit(update_rating_matrix)
+        transaction.on_commit(ratings_changed)
+
+    for movie_id in valid:
+        results[movie_id] = {'movie_id': movie_id, 'status': 'updated' if movie_id in rated else 'created'}
+
+    return {'results': [results[movie_id] for movie_id in ratings]}
+
+
+def metadata_scores(movie_id):
+    """Cast, director and genre similarity of a movie's top-K as {movie_id: score}, computed for unindexed movies."""
+    from movies.recommender.similarity import compute_similar_movies
+
+    scores = dict(MovieSimilarity.objects.filter(movie_id=movie_id).values_list('similar_movie_id', 'score'))
+
+    if not scores:
+        get_object_or_404(Movie, id=movie_id)
+        scores = dict(compute_similar_movies(movie_id))
+
+    return scores
+
+
+def text_recommendations(movie_id, mode, text_weight):
+    from movies.recommender.similarity import DEFAULT_TOP_K
+    from movies.recommender.text import text_index
+
+    index = text_index.get()
+
+    if index is None:
+        return JsonResponse({"error": "Text similarity index is not built"}, status=404)
+
+    with metrics.recommender_timer('text'):
+        text = None
+        if movie_id not in index.row_index:
+            movie = get_object_or_404(Movie.objects.only('overview', 'tagline'), id=movie_id)
+            text = f"{movie.overview or ''} {movie.tagline or ''}"
+
+        scores = index.scores(movie_id, text)
+
+        if scores is None:
+            return []
+
+        if mode == 'blend':
+            scores = index.blend(scores, metadata_scores(movie_id), text_weight)
+
+        movie_scores = index.top(movie_id, scores, DEFAULT_TOP_K)
+        movies_by_id = Movie.objects.in_bulk([similar_id for similar_id, _ in movie_scores])
+
+    return [movies_by_id[similar_id] for similar_id, _ in movie_scores if similar_id in movies_by_id]
+
+
 @app.get("/movies/{movie_id}/recommendation", response=list[RecommendedMoviesSchema])
-def get_movie_recs(request, movie_id: int):
-    movie_queryset = Movie.objects.prefetch_related(
-        Prefetch('moviesactors_set', queryset=MoviesActors.objects.select_related('actor')),
-        Prefetch('moviesdirectors_set', queryset=MoviesDirectors.objects.select_related('director')),
-        'genres'
-    )
+def get_movie_recs(request, movie_id: int, mode: Literal['metadata', 'text', 'blend'] = Query('metadata'),
+                   text_weight: float = Query(0.5, ge=0, le=1)):
+    if mode != 'metadata':
+        recommended_movies = text_recommendations(movie_id, mode, text_weight)
 
-    actors_list, directors_list, genres_list = [], [], []
+        if isinstance(recommended_movies, JsonResponse):
+            return recommended_movies
+    else:
+        with metrics.recommender_timer('movie'):
+            similar_movies = MovieSimilarity.objects.filter(movie_id=movie_id).select_related('similar_movie').order_by('rank')
 
-    for movie in movie_queryset:
-        movie_actors = [f"{actor.actor.first_name}{actor.actor.last_name}" for actor in movie.moviesactors_set.all()]
-        movie_directors = [f"{director.director.first_name}{director.director.last_name}" for director in movie.moviesdirectors_set.all()]
-        movie_genres = [genre.name.replace(" ", "") for genre in movie.genres.all()]
-        
-        actors_list.append(', '.join(movie_actors))
-        directors_list.append(', '.join(movie_directors))
-        genres_list.append(', '.join(movie_genres))
+            recommended_movies = [similarity.similar_movie for similarity in similar_movies]
 
-    movie_df = read_frame(movie_queryset)
-    movie_df['actors'] = actors_list
-    movie_df['directors'] = directors_list
-    movie_df['genres'] = genres_list
+            if not recommended_movies:
+                get_object_or_404(Movie, id=movie_id)
 
-    columns = ['id', 'title', 'actors', 'directors', 'genres', 'release_year']
-    movie_df = movie_df[columns]
-    
-    def create_soup(x):
-        return ''.join(x['actors']) + ' ' + ''.join(x['directors']) + ' ' + ''.join(x['genres'])
-    
-    movie_df['soup'] = movie_df.apply(create_soup, axis=1)
+                from movies.recommender.similarity import compute_similar_movies
+                movie_scores = compute_similar_movies(movie_id)
+                movies_by_id = Movie.objects.in_bulk([similar_id for similar_id, _ in movie_scores])
+                recommended_movies = [movies_by_id[similar_id] for similar_id, _ in movie_scores if similar_id in movies_by_id]
 
-    count = CountVectorizer(stop_words='english', min_df=1)
-    count_matrix = count.fit_transform(movie_df['soup'])
-    cosine_sim2 = cosine_similarity(count_matrix, count_matrix)
-    
-    movie_df = movie_df.reset_index()
-    indices = pd.Series(movie_df.index, index=movie_df['id'])
+    return [
+        RecommendedMoviesSchema(
+            id=movie.id,
+            title=movie.title,
+            release_year=movie.release_year
+        )
+        for movie in recommended_movies
+    ]
+
+
+def factorization_recommendations(user_id):
+    from movies.recommender.factorization import factorization_model
+
+    model = factorization_model.get()
+
+    if model is None:
+        return JsonResponse({"error": "Recommendation model is not trained"}, status=404)
 
-    def get_recommendations(movie_id, cosine_sim):
-        idx = indices[movie_id]
-        sim_scores = list(enumerate(cosine_sim[idx]))
-        sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)
+    ratings = list(Ratings.objects.filter(user_id=user_id).values_list('movie_id', 'rating', 'updated_at'))
 
-        sim_scores = sim_scores[1:11]
+    if not ratings:
+        return JsonResponse({"error": "User ratings not found. Rate movies in order to get recommendations"}, status=404)
+
+    rated_since_training = any(updated_at and updated_at.timestamp() > model.trained_at for _, _, updated_at in ratings)
+
+    with metrics.recommender_timer('svd'):
+        return model.recommend(user_id, [(movie_id, rating) for movie_id, rating, _ in ratings], rated_since_training)
+
+
+def stored_recommendations(user_id):
+    """Recommendations precomputed by build_user_recommendations, less the movies rated since.
 
-        movie_indices = [index for index, _ in sim_scores]
+    None for users it never processed, and for users who have rated every movie stored for them since.
+    """
+    rated = Ratings.objects.filter(user_id=user_id, movie=OuterRef('movie'))
+    rows = list(UserRecommendation.objects.filter(user_id=user_id).annotate(rated=Exists(rated))
+                .select_related('movie').order_by('rank'))
 
-        return movie_df[['id', 'title', 'release_year']].iloc[movie_indices]
+    if not rows and not UserNeighborhood.objects.filter(user_id=user_id).exists():
+        return None
 
-    movie_rec_df = get_recommendations(movie_id, cosine_sim2)
+    unrated = [row for row in rows if not row.rated]
 
-    return movie_rec_df.apply(
-        lambda row: RecommendedMoviesSchema(
-            id=row['id'],
-            title=row['title'],
-            release_year=row['release_year']
-        ), 
-        axis=1)
+    if rows and not unrated:
+        return None
+
+    return [
+        PredictedMoviesSchema(
+            id=row.movie_id,
+            title=row.movie.title,
+            release_year=row.movie.release_year,
+            estimated_rating=row.estimated_rating,
+        )
+        for row in unrated
+    ]
 
 
 @app.get("/profile/{user_id}/recommendation", response=list[PredictedMoviesSchema], auth=django_auth)
-def get_user_recs(request, user_id: int):
-    all_users_ratings = Ratings.objects.all().values('user__id', 'movie__title', 'movie__id', 'rating', 'movie__release_year')
-    all_users_ratings_df = read_frame(all_users_ratings)
+def get_user_recs(request, user_id: int, mode: Literal['knn', 'svd'] = Query('knn')):
+    if mode == 'svd':
+        movie_estimates = factorization_recommendations(user_id)
 
-    if all_users_ratings_df.empty:
-        return JsonResponse({"error": "Ratings not found"}, status=404)
-    
-    user_movie_matrix = all_users_ratings_df.pivot_table(index='user__id', columns='movie__id', values='rating').fillna(0)
+        if isinstance(movie_estimates, JsonResponse):
+            return movie_estimates
+    else:
+        stored = stored_recommendations(user_id)
 
-    if user_id not in user_movie_matrix.index:
-        return JsonResponse({"error": "User ratings not found. Rate movies in order to get recommendations"}, status=404)
-    
-    knn = NearestNeighbors(metric='euclidean', algorithm='brute')
-    knn.fit(user_movie_matrix)
-    
-    user_ratings = Ratings.objects.filter(user=user_id).values('user__id', 'movie__id', 'rating')
-    user_ratings_df = read_frame(user_ratings)
-  
-    user__ratings_vector = user_movie_matrix.loc[user_id].values.reshape(1, -1)
-    
-    n_neighbors = min(10, user_movie_matrix.shape[0] // 2)
-    
-    distances, indices = knn.kneighbors(user__ratings_vector, n_neighbors=n_neighbors)
-    
-    similar_user_ids = [user_movie_matrix.index[i] for i in indices.flatten()]
-    
-    similar_users_ratings = all_users_ratings_df[all_users_ratings_df['user__id'].isin(similar_user_ids)]
-    
-    unrated_movies = similar_users_ratings[~similar_users_ratings['movie__id'].isin(user_ratings_df['movie__id'])]
-    
-    recommended_movies = unrated_movies.groupby('movie__id').agg(
-        estimated_rating=('rating', 'mean'),
-        movie__title=('movie__title', 'first'),
-        movie__release_year=('movie__release_year', 'first')
-    ).reset_index()
-    
-    recommended_movies = recommended_movies.sort_values(by='estimated_rating', ascending=False).head(20)
-    
-    if recommended_movies.empty:
+        if stored is not None:
+            return stored if stored else JsonResponse({"error": "Recommendation is not possible"}, status=400)
+
+        from movies.recommender.ratings import rating_matrix
+
+        if not rating_matrix.has_ratings():
+            return JsonResponse({"error": "Ratings not found"}, status=404)
+
+        if not rating_matrix.has_user(user_id):
+            return JsonResponse({"error": "User ratings not found. Rate movies in order to get recommendations"}, status=404)
+
+        with metrics.recommender_timer('user'):
+            movie_estimates = rating_matrix.recommend(user_id)
+
+    if not movie_estimates:
         return JsonResponse({"error": "Recommendation is not possible"}, status=400)
 
-    return recommended_movies.apply(
-        lambda row: PredictedMoviesSchema(
-            id=row['movie__id'],
-            title=row['movie__title'],
-            release_year=row['movie__release_year'],
-            estimated_rating=row['estimated_rating'],
-        ), 
-        axis=1)
-    
+    movies_by_id = Movie.objects.in_bulk([movie_id for movie_id, _ in movie_estimates])
+
+    return [
+        PredictedMoviesSchema(
+            id=movie_id,
+            title=movies_by_id[movie_id].title,
+            release_year=movies_by_id[movie_id].release_year,
+            estimated_rating=estimated_rating,
+        )
+        for movie_id, estimated_rating in movie_estimates if movie_id in movies_by_id
+    ]
+
 
 @app.get("/profile/{user_id}/lists", response=list[MovieListsSchema], auth=django_auth)
 def get_user_lists(request, user_id: int):
@@ -574,36 +732,46 @@ def get_user_lists(request, user_id: int):
     ]
 
 
-@app.get("/lists/{list_id}", response=ListedMoviesSchema, auth=django_auth)
-def get_user_list(request, list_id: int):
-    movie_list = get_object_or_404(MovieList, id=list_id)
+LIST_SORTS = {'added': 'added_at', 'year': 'release_year', 'title': 'title'}
 
-    return ListedMoviesSchema(
-        id=movie_list.id,
-        user=UserOut(
-            id=movie_list.user.id,
-            username=movie_list.user.username
-        ),
-        name=movie_list.name,
-        description=movie_list.description,
-        movies=[
-            MovieInList(
-                id=movie.id, 
-                title=movie.title, 
-                release_year=movie.release_year,
-                runtime=movie.runtime,
-                genres=[
-                    GenreSchema(
-                        id=genre.id,
-                        name=genre.name,
-                    ) for genre in movie.genres.all()
-                ],
-                overview=movie.overview,
-            ) 
-            for movie in movie_list.movies.all()
-        ]
+list_pagination = KeysetPagination(page_size=50)
+
+
+@app.get("/lists/{list_id}", response=ListedMoviesSchema, auth=django_auth)
+def get_user_list(request, list_id: int, sort: str = Query('added'), page: int = Query(None, ge=1),
+                  cursor: str = Query(None), with_count: bool = Query(False)):
+    movie_list = get_object_or_404(MovieList.objects.select_related('user'), id=list_id)
+
+    sort_field = LIST_SORTS.get(sort.lstrip('-'))
+    if sort_field is None:
+        return JsonResponse({"error": f"Unknown sort {sort}, use one of {', '.join(LIST_SORTS)} (prefix - for descending)"},
+                            status=400)
+
+    entries = (
+        MovieListMovies.objects.filter(movie_list=movie_list)
+        .annotate(release_year=F('movie__release_year'), title=F('movie__title'))
+        .select_related('movie')
+        .prefetch_related('movie__genres')
+        .order_by(f'-{sort_field}' if sort.startswith('-') else sort_field, 'id')
     )
 
+    # The whole list unless a page or cursor is asked for, which pages it like the catalog endpoints
+    count = next_cursor = None
+    if page is not None or cursor is not None:
+        result = list_pagination.paginate_queryset(
+            entries, KeysetPagination.Input(page=page or 1, cursor=cursor, with_count=with_count))
+        entries, count, next_cursor = result['items'], result['count'], result.get('next')
+
+    return {
+        'id': movie_list.id,
+        'user': movie_list.user,
+        'name': movie_list.name,
+        'description': movie_list.description,
+        'movies': [entry.movie for entry in entries],
+        'count': count,
+        'next': next_cursor,
+    }
+
 
 @app.post("/profile/{user_id}/lists/", auth=django_auth)
 def create_user_list(request, user_id: int, data: ListCreateSchema):
@@ -667,3 +835,64 @@ def remove_movie_user_list(request, list_id: int, movie_id: int):
         return JsonResponse({"success": f"Movie {movie.movie.title} removed successfully"})
     except Exception as e:
         return JsonResponse({"error": "Failed to remove movie from list"}, status=500)
+
+
+@app.post("/lists/{list_id}/movies/batch", response=BatchResultSchema, auth=django_auth)
+def batch_add_movies_user_list(request, list_id: int, data: ListMoviesBatchSchema):
+    movie_list = get_object_or_404(MovieList, id=list_id)
+
+    if movie_list.user_id != request.user.id:
+        return JsonResponse({"error": "You can only add movies to your own lists"}, status=403)
+
+    if len(data.movie_ids) > BATCH_MAX_ITEMS:
+        return JsonResponse({"error": f"At most {BATCH_MAX_ITEMS} movies per batch"}, status=400)
+
+    movie_ids = list(dict.fromkeys(data.movie_ids))
+    known_movies = set(Movie.objects.filter(id__in=movie_ids).values_list('id', flat=True))
+
+    with transaction.atomic():
+        listed = set(MovieListMovies.objects.filter(movie_list=movie_list, movie_id__in=known_movies)
+                     .values_list('movie_id', flat=True))
+
+        # Nothing to update on a movie already in the list, and its added date must stay, so conflicts are skipped
+        MovieListMovies.objects.bulk_create(
+            [MovieListMovies(movie_list=movie_list, movie_id=movie_id) for movie_id in movie_ids
+             if movie_id in known_movies and movie_id not in listed],
+            ignore_conflicts=True)
+
+    return {'results': [
+        batch_error(movie_id, "Movie not found") if movie_id not in known_movies
+        else {'movie_id': movie_id, 'status': 'exists' if movie_id in listed else 'added'}
+        for movie_id in movie_ids
+    ]}
+
+
+@app.get("/stats/db_pool", auth=django_auth)
+def get_db_pool_stats(request):
+    if not request.user.is_staff:
+        return JsonResponse({"error": "Staff only"}, status=403)
+
+    return {alias: connections[alias].pool_stats() for alias in connections if hasattr(connections[alias], 'pool_stats')}
+
+
+@app.get("/stats/recommender", auth=django_auth)
+def get_recommender_stats(request):
+    if not request.user.is_staff:
+        return JsonResponse({"error": "Staff only"}, status=403)
+
+    from movies.recommender.factorization import factorization_model
+
+    model = factorization_model.get()
+
+    return {
+        'served_version': model.version if model else None,
+        'published': factorization_model.registry.current(),
+    }
+
+
+@app.get("/stats/sql", auth=django_auth)
+def get_sql_stats(request, limit: int = 50):
+    if not request.user.is_staff:
+        return JsonResponse({"error": "Staff only"}, status=403)
+
+    return statement_table.snapshot(limit)
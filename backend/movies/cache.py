@@ -0,0 +1,142 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Manager, QuerySet
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+
+from asgiref.sync import sync_to_async
+from pydantic import TypeAdapter
+
+from functools import wraps
+import asyncio
+import time
+
+
+GENERATION_KEY = 'catalog:generation'
+RATINGS_BUMP_KEY = 'catalog:ratings-bumped'
+RATINGS_PENDING_KEY = 'catalog:ratings-pending'
+
+
+def catalog_generation():
+    generation = cache.get(GENERATION_KEY)
+
+    if generation is None:
+        # Start from the clock rather than 1, so a generation lost to eviction or expiry never reuses old cache keys
+        cache.add(GENERATION_KEY, int(time.time() * 1000), timeout=settings.CATALOG_GENERATION_TIMEOUT)
+        generation = cache.get(GENERATION_KEY)
+
+    return generation
+
+
+def bump_catalog_generation():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        catalog_generation()
+
+
+def ratings_changed():
+    # Movie pages carry rating summaries, but a flush per rating would keep the catalog cache cold,
+    # so rating writes start a new generation at most once per RATING_CACHE_INTERVAL. A write inside
+    # an interval that already bumped is left pending, for the first read after the interval to bump.
+    if cache.add(RATINGS_BUMP_KEY, True, timeout=settings.RATING_CACHE_INTERVAL):
+        bump_catalog_generation()
+    else:
+        cache.set(RATINGS_PENDING_KEY, True, timeout=None)
+
+
+def bump_pending_ratings():
+    # Only one reader wins the add. Pending is cleared before the bump, so a write landing in between
+    # is either covered by this bump or left pending for the next interval.
+    if cache.add(RATINGS_BUMP_KEY, True, timeout=settings.RATING_CACHE_INTERVAL):
+        cache.delete(RATINGS_PENDING_KEY)
+        bump_catalog_generation()
+
+
+def catalog_cached(response):
+    """Cache a read-only catalog endpoint's serialized body under the current catalog generation.
+
+    The generation doubles as the ETag, so a client revalidating with If-None-Match gets a 304 without
+    the database being touched. Responses the view builds itself (errors) are passed through uncached.
+    Coroutine views get a coroutine wrapper that goes through the cache's async API.
+    """
+    adapter = TypeAdapter(response)
+
+    def decorator(view_func):
+        if asyncio.iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def async_view_with_cache(request, *args, **kwargs):
+                etag, key = await sync_to_async(catalog_keys)(request)
+
+                if etag in parse_etags(request.headers.get('If-None-Match', '')):
+                    return not_modified(etag)
+
+                body = await cache.aget(key)
+
+                if body is None:
+                    result = await view_func(request, *args, **kwargs)
+
+                    if isinstance(result, HttpResponse):
+                        return result
+
+                    if isinstance(result, (QuerySet, Manager)):
+                        result = [item async for item in result.all()]
+
+                    body = adapter.dump_json(adapter.validate_python(result, from_attributes=True))
+                    await cache.aset(key, body, settings.CATALOG_CACHE_TIMEOUT)
+
+                return cached_response(body, etag)
+
+            return async_view_with_cache
+
+        @wraps(view_func)
+        def view_with_cache(request, *args, **kwargs):
+            etag, key = catalog_keys(request)
+
+            if etag in parse_etags(request.headers.get('If-None-Match', '')):
+                return not_modified(etag)
+
+            body = cache.get(key)
+
+            if body is None:
+                result = view_func(request, *args, **kwargs)
+
+                if isinstance(result, HttpResponse):
+                    return result
+
+                if isinstance(result, (QuerySet, Manager)):
+                    result = list(result.all())
+
+                body = adapter.dump_json(adapter.validate_python(result, from_attributes=True))
+                cache.set(key, body, settings.CATALOG_CACHE_TIMEOUT)
+
+            return cached_response(body, etag)
+
+        return view_with_cache
+
+    return decorator
+
+
+def catalog_keys(request):
+    # One round trip for the generation and the rating flags, unless pending ratings are due a bump
+    values = cache.get_many([GENERATION_KEY, RATINGS_PENDING_KEY, RATINGS_BUMP_KEY])
+
+    if RATINGS_PENDING_KEY in values and RATINGS_BUMP_KEY not in values:
+        bump_pending_ratings()
+        values.pop(GENERATION_KEY, None)
+
+    generation = values.get(GENERATION_KEY) or catalog_generation()
+    return f'"catalog-{generation}"', f'catalog:{generation}:{request.get_full_path()}'
+
+
+def not_modified(etag):
+    response = HttpResponseNotModified()
+    response['ETag'] = etag
+    return response
+
+
+def cached_response(body, etag):
+    response = HttpResponse(body, content_type='application/json; charset=utf-8')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    return response
@@ -0,0 +1,112 @@
+from django.db.models import Case, Count, F, FloatField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+from movies.models import Comments, Movie, OscarWinsMovie, Ratings
+
+
+RATING_VALUES = range(1, 6)
+
+RATING_COUNTERS = ['num_ratings', 'ratings_sum'] + [f'num_ratings_{value}' for value in RATING_VALUES]
+
+# Movie columns only written by the UPDATEs here, never from a loaded Movie instance
+MOVIE_COUNTERS = ['num_oscar_wins', *RATING_COUNTERS, 'average_rating', 'num_comments']
+
+
+def adjust_oscar_wins(movie_id, delta):
+    Movie.objects.filter(id=movie_id).update(num_oscar_wins=F('num_oscar_wins') + delta)
+
+
+def oscar_wins_count():
+    wins = OscarWinsMovie.objects.filter(movie=OuterRef('pk')).order_by().values('movie').annotate(total=Count('id'))
+    return Coalesce(Subquery(wins.values('total')), 0)
+
+
+def stale_oscar_win_counts():
+    """Ids of movies whose stored num_oscar_wins differs from their OscarWinsMovie rows."""
+    return list(Movie.objects.annotate(actual=oscar_wins_count()).exclude(num_oscar_wins=F('actual')).values_list('id', flat=True))
+
+
+def sync_oscar_win_counts(movie_ids=None):
+    movies = Movie.objects.all() if movie_ids is None else Movie.objects.filter(id__in=movie_ids)
+    return movies.update(num_oscar_wins=oscar_wins_count())
+
+
+def adjust_comment_count(movie_id, delta):
+    Movie.objects.filter(id=movie_id).update(num_comments=F('num_comments') + delta)
+
+
+def comment_count():
+    comments = Comments.objects.filter(movie=OuterRef('pk')).order_by().values('movie').annotate(total=Count('id'))
+    return Coalesce(Subquery(comments.values('total')), 0)
+
+
+def stale_comment_counts():
+    """Ids of movies whose stored num_comments differs from their Comments rows."""
+    return list(Movie.objects.annotate(actual=comment_count()).exclude(num_comments=F('actual')).values_list('id', flat=True))
+
+
+def sync_comment_counts(movie_ids=None):
+    movies = Movie.objects.all() if movie_ids is None else Movie.objects.filter(id__in=movie_ids)
+    return movies.update(num_comments=comment_count())
+
+
+def rating_deltas(old_rating, new_rating):
+    """Counter increments for one user's rating of a movie going from old to new, None meaning no rating."""
+    deltas = {
+        'num_ratings': (new_rating is not None) - (old_rating is not None),
+        'ratings_sum': (new_rating or 0) - (old_rating or 0),
+    }
+    for value in RATING_VALUES:
+        deltas[f'num_ratings_{value}'] = (new_rating == value) - (old_rating == value)
+
+    return deltas
+
+
+def average_rating(ratings_sum, num_ratings):
+    return Coalesce(Cast(ratings_sum, FloatField()) / NullIf(num_ratings, 0), 0.0)
+
+
+def adjust_rating_summaries(changes):
+    """Apply {movie_id: (old_rating, new_rating)} to the movies' rating summaries in a single UPDATE."""
+    deltas = {movie_id: rating_deltas(old, new) for movie_id, (old, new) in changes.items() if old != new}
+
+    if not deltas:
+        return
+
+    updates = {}
+    for counter in RATING_COUNTERS:
+        whens = [When(id=movie_id, then=Value(delta[counter])) for movie_id, delta in deltas.items() if delta[counter]]
+        updates[counter] = F(counter) + Case(*whens, default=Value(0)) if whens else F(counter)
+
+    # Every SET expression reads the old row, so the average is computed from the adjusted expressions
+    updates['average_rating'] = average_rating(updates['ratings_sum'], updates['num_ratings'])
+    Movie.objects.filter(id__in=deltas).update(**updates)
+
+
+def rating_aggregates():
+    ratings = Ratings.objects.filter(movie=OuterRef('pk')).order_by().values('movie')
+
+    def aggregate(expression):
+        return Coalesce(Subquery(ratings.annotate(total=expression).values('total')), 0)
+
+    aggregates = {'num_ratings': aggregate(Count('id')), 'ratings_sum': aggregate(Sum('rating'))}
+    for value in RATING_VALUES:
+        aggregates[f'num_ratings_{value}'] = aggregate(Count('id', filter=Q(rating=value)))
+
+    return aggregates
+
+
+def stale_rating_summaries():
+    """Ids of movies whose stored rating summary differs from their Ratings rows."""
+    actual = {f'actual_{counter}': expression for counter, expression in rating_aggregates().items()}
+    drifted = Q()
+    for counter in RATING_COUNTERS:
+        drifted |= ~Q(**{counter: F(f'actual_{counter}')})
+
+    return list(Movie.objects.annotate(**actual).filter(drifted).values_list('id', flat=True))
+
+
+def sync_rating_summaries(movie_ids=None):
+    movies = Movie.objects.all() if movie_ids is None else Movie.objects.filter(id__in=movie_ids)
+    aggregates = rating_aggregates()
+    return movies.update(**aggregates, average_rating=average_rating(aggregates['ratings_sum'], aggregates['num_ratings']))
@@ -0,0 +1,171 @@
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+
+from asgiref.sync import iscoroutinefunction
+
+from contextvars import ContextVar
+from functools import lru_cache
+import heapq
+import re
+import threading
+import time
+
+
+SLOWEST_PER_REQUEST = 3
+SLOWEST_PER_ROUTE = 5
+
+_request_stats = ContextVar('request_sql_stats', default=None)
+
+_IN_LIST = re.compile(r'\((?:%s, )+%s\)')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_SPACES = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=2048)
+def normalize_sql(sql):
+    """Collapse the parts of a statement that vary between calls, so calls of one query share a key."""
+    sql = _IN_LIST.sub('(%s, ...)', sql)
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('N', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+class RequestStats:
+    __slots__ = ('queries', 'db_time', 'slowest')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.slowest = []
+
+    def add(self, sql, elapsed):
+        self.queries += 1
+        self.db_time += elapsed
+
+        if len(self.slowest) < SLOWEST_PER_REQUEST:
+            heapq.heappush(self.slowest, (elapsed, sql))
+        else:
+            heapq.heappushpop(self.slowest, (elapsed, sql))
+
+    def server_timing(self, total):
+        timings = [f'db;dur={self.db_time * 1000:.2f};desc="{self.queries} queries"']
+
+        if self.slowest:
+            timings.append(f'db-slowest;dur={max(self.slowest)[0] * 1000:.2f}')
+
+        timings.append(f'total;dur={total * 1000:.2f}')
+        return ', '.join(timings)
+
+
+class StatementTable:
+    """Rolling per-process totals by normalized statement and by route, trimmed to the costliest entries."""
+
+    def __init__(self, max_statements):
+        self.max_statements = max_statements
+        self.lock = threading.Lock()
+        self.statements = {}
+        self.routes = {}
+
+    def record_statement(self, sql, elapsed):
+        key = normalize_sql(sql)
+
+        with self.lock:
+            entry = self.statements.get(key)
+
+            if entry is None:
+                entry = self.statements[key] = {'sql': key, 'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+
+            entry['calls'] += 1
+            entry['total_ms'] += elapsed * 1000
+            entry['max_ms'] = max(entry['max_ms'], elapsed * 1000)
+
+            if len(self.statements) > self.max_statements * 2:
+                keep = heapq.nlargest(self.max_statements, self.statements.values(), key=lambda entry: entry['total_ms'])
+                self.statements = {entry['sql']: entry for entry in keep}
+
+    def record_request(self, route, stats):
+        with self.lock:
+            entry = self.routes.get(route)
+
+            if entry is None:
+                entry = self.routes[route] = {'requests': 0, 'queries': 0, 'db_ms': 0.0, 'slowest': []}
+
+            entry['requests'] += 1
+            entry['queries'] += stats.queries
+            entry['db_ms'] += stats.db_time * 1000
+            entry['slowest'] = heapq.nlargest(
+                SLOWEST_PER_ROUTE,
+                entry['slowest'] + [{'ms': elapsed * 1000, 'sql': normalize_sql(sql)} for elapsed, sql in stats.slowest],
+                key=lambda statement: statement['ms'])
+
+    def snapshot(self, limit):
+        with self.lock:
+            statements = heapq.nlargest(limit, self.statements.values(), key=lambda entry: entry['total_ms'])
+            routes = {route: {**entry, 'slowest': list(entry['slowest'])} for route, entry in self.routes.items()}
+
+        return {
+            'statements': [{**entry, 'mean_ms': entry['total_ms'] / entry['calls']} for entry in statements],
+            'routes': routes,
+        }
+
+
+statement_table = StatementTable(getattr(settings, 'SQL_STATEMENT_TABLE_SIZE', 500))
+
+
+def record_query(execute, sql, params, many, context):
+    """connection.execute_wrapper hook timing every statement for the statement table and the current request."""
+    started = time.perf_counter()
+
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        statement_table.record_statement(sql, elapsed)
+
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.add(sql, elapsed)
+
+
+def install_query_recorder(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def finish_request(request, response, stats, started):
+    response['Server-Timing'] = stats.server_timing(time.perf_counter() - started)
+
+    match = getattr(request, 'resolver_match', None)
+    statement_table.record_request(match.route if match else request.path, stats)
+
+
+@sync_and_async_middleware
+def sql_instrumentation_middleware(get_response):
+    """Counts and times the SQL of each request, reported in a Server-Timing header and per route."""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            stats, started = RequestStats(), time.perf_counter()
+            token = _request_stats.set(stats)
+
+            try:
+                response = await get_response(request)
+            finally:
+                _request_stats.reset(token)
+
+            finish_request(request, response, stats, started)
+            return response
+    else:
+        def middleware(request):
+            stats, started = RequestStats(), time.perf_counter()
+            token = _request_stats.set(stats)
+
+            try:
+                response = get_response(request)
+            finally:
+                _request_stats.reset(token)
+
+            finish_request(request, response, stats, started)
+            return response
+
+    return middleware
@@ -0,0 +1,110 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client, override_settings
+
+from movies.instrumentation import normalize_sql
+from movies.models import Movie, Person, User, MovieList, OscarWinsMovie
+from movies.query_plans import explain, plan_findings, plan_summary
+
+
+def audited_paths():
+    """GET requests covering the read queries of movies/api.py, on the rows with the most related data."""
+    movie = Movie.objects.order_by('-num_ratings', '-num_comments', 'id').first()
+    person = Person.objects.annotate(credits=Count('moviesactors')).order_by('-credits', 'id').first()
+    user = User.objects.annotate(rated=Count('user_ratings')).order_by('-rated', 'id').first()
+    movie_list = MovieList.objects.annotate(size=Count('movielistmovies')).order_by('-size', 'id').first()
+    ceremony = OscarWinsMovie.objects.order_by('-ceremony').values_list('ceremony', flat=True).first()
+
+    if movie is None or user is None:
+        raise CommandError('The database has no movies or users to audit')
+
+    paths = [
+        '/api/movies',
+        '/api/movies?sort=rating',
+        f'/api/movies/{movie.id}',
+        '/api/genres',
+        f'/api/search?query={movie.title.split()[0]}',
+        f'/api/search?query={movie.title.split()[0]}&sort=rating',
+        '/api/oscar_wins?page=1',
+        f'/api/movies/{movie.id}/comments',
+        f'/api/movies/{movie.id}/comments?cursor=',
+        f'/api/movies/{movie.id}/ratings/{user.id}',
+        f'/api/movies/{movie.id}/recommendation',
+        f'/api/profile/{user.id}',
+        f'/api/profile/{user.id}/lists',
+        f'/api/profile/{user.id}/recommendation',
+    ]
+
+    if person is not None:
+        paths += ['/api/people?has_oscar=true', f'/api/people/{person.id}']
+    if ceremony is not None:
+        paths.append(f'/api/ceremonies/{ceremony}')
+    if movie_list is not None:
+        paths += [f'/api/lists/{movie_list.id}', f'/api/lists/{movie_list.id}?sort=-year&cursor=']
+
+    return user, paths
+
+
+class Command(BaseCommand):
+    help = ('Replay representative API reads and run EXPLAIN (ANALYZE, BUFFERS) on every SELECT they issue, '
+            'flagging sequential scans and row estimate misses')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Audit this API path instead of the default set (repeatable)')
+        parser.add_argument('--min-rows', type=int, default=1000,
+                            help='Flag sequential scans reading at least this many rows')
+        parser.add_argument('--estimate-factor', type=float, default=10.0,
+                            help='Flag nodes whose row estimate is off by at least this factor')
+        parser.add_argument('--analyze', action='store_true',
+                            help='Refresh planner statistics first, for databases loaded since autovacuum last ran')
+
+    def handle(self, *args, **options):
+        statements = {}
+
+        def record(execute, sql, params, many, context):
+            if not many and sql.lstrip('( ').upper().startswith(('SELECT', 'WITH')):
+                statements.setdefault(normalize_sql(sql), (sql, params, []))[2].append(path)
+            return execute(sql, params, many, context)
+
+        # Nothing the replayed requests write (sessions, last_login) outlives the audit, and a dummy cache
+        # makes the catalog endpoints reach the database
+        with transaction.atomic(), override_settings(
+                ALLOWED_HOSTS=['testserver'],
+                CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+            if options['analyze']:
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+
+            user, paths = audited_paths()
+            client = Client()
+            client.force_login(user)
+
+            with connection.execute_wrapper(record):
+                for path in options['paths'] or paths:
+                    response = client.get(path)
+
+                    if response.status_code >= 400:
+                        self.stdout.write(self.style.WARNING(f'{path}: HTTP {response.status_code}'))
+
+            flagged = 0
+
+            for sql, params, seen_in in statements.values():
+                document = explain(connection, sql, params)
+                findings = plan_findings(document, options['min_rows'], options['estimate_factor'])
+
+                routes = ', '.join(sorted(set(seen_in)))
+                self.stdout.write(f'{routes} ({plan_summary(document)})\n  {normalize_sql(sql)[:200]}')
+
+                for finding in findings:
+                    self.stdout.write(self.style.ERROR(f'  {finding}'))
+
+                flagged += bool(findings)
+
+            transaction.set_rollback(True)
+
+        if flagged:
+            raise CommandError(f'{flagged} of {len(statements)} statements have plan findings')
+
+        self.stdout.write(self.style.SUCCESS(f'{len(statements)} statements audited, no findings'))
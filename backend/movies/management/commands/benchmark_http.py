@@ -0,0 +1,97 @@
+from django.core.management.base import BaseCommand, CommandError
+
+import asyncio
+import statistics
+import time
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+DEFAULT_PATHS = [
+    '/api/movies',
+    '/api/movies/1',
+    '/api/people/1',
+    '/api/search?query=godfather',
+    '/api/movies/1/comments',
+]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def run_load(base_url, path, concurrency, total):
+    latencies = []
+    errors = 0
+    remaining = total
+
+    async def worker(session):
+        nonlocal remaining, errors
+
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+
+            try:
+                async with session.get(base_url + path) as response:
+                    await response.read()
+                    if response.status >= 400:
+                        errors += 1
+            except aiohttp.ClientError:
+                errors += 1
+
+            latencies.append(time.perf_counter() - started)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        'rps': len(latencies) / elapsed,
+        'p50': statistics.median(latencies) * 1000,
+        'p99': percentile(latencies, 0.99) * 1000,
+        'errors': errors,
+    }
+
+
+class Command(BaseCommand):
+    help = 'Load a running server with concurrent GET requests and report requests/sec and latency percentiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', default=DEFAULT_PATHS)
+        parser.add_argument('--target', action='append', dest='targets', metavar='LABEL=URL',
+                            help='Server to load, repeat to compare servers (default: local=http://127.0.0.1:8000)')
+        parser.add_argument('--concurrency', type=int, default=200)
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per path and target')
+        parser.add_argument('--warmup', type=int, default=50, help='Unmeasured requests per path and target')
+
+    def handle(self, *args, **options):
+        if aiohttp is None:
+            raise CommandError('benchmark_http needs aiohttp installed')
+
+        targets = []
+        for target in options['targets'] or ['local=http://127.0.0.1:8000']:
+            # An unlabeled URL may still hold '=' in its query string, after the scheme's ://
+            label, separator, url = target.partition('=')
+            if not separator or '://' in label:
+                label, url = '', target
+            targets.append((label or url, url.rstrip('/')))
+
+        self.stdout.write(f"{'target':<12} {'path':<40} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+
+        for path in options['paths']:
+            for label, url in targets:
+                if options['warmup']:
+                    asyncio.run(run_load(url, path, min(options['concurrency'], options['warmup']), options['warmup']))
+
+                result = asyncio.run(run_load(url, path, options['concurrency'], options['requests']))
+
+                self.stdout.write(f"{label:<12} {path:<40} {result['rps']:>9.1f} {result['p50']:>9.1f} "
+                                  f"{result['p99']:>9.1f} {result['errors']:>7}")
@@ -0,0 +1,77 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from movies.models import MovieSimilarity
+from movies.recommender.similarity import (load_movie_soups, build_feature_matrix, iter_similarity_index,
+                                           DEFAULT_TOP_K, DEFAULT_CHUNK_SIZE)
+from movies.recommender.text import load_movie_texts, build_text_matrix, save_text_index, text_index
+
+import time
+
+
+class Command(BaseCommand):
+    help = ('Build the top-K movie similarity index and the overview / tagline text index used by '
+            '/movies/{movie_id}/recommendation')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=DEFAULT_TOP_K)
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        top_k = options['top_k']
+        chunk_size = options['chunk_size']
+        batch_size = options['batch_size']
+
+        started = time.perf_counter()
+
+        movie_ids, soups = load_movie_soups()
+
+        if not movie_ids:
+            self.stdout.write(self.style.ERROR('No movies found.'))
+            return
+
+        feature_matrix = build_feature_matrix(soups)
+
+        rows_written = 0
+        batch = []
+
+        with transaction.atomic():
+            MovieSimilarity.objects.all().delete()
+
+            for row, neighbors, scores in iter_similarity_index(feature_matrix, top_k, chunk_size):
+                batch.extend(
+                    MovieSimilarity(movie_id=movie_ids[row],
+                                    similar_movie_id=movie_ids[neighbor],
+                                    rank=rank,
+                                    score=float(score))
+                    for rank, (neighbor, score) in enumerate(zip(neighbors, scores), start=1)
+                )
+
+                if len(batch) >= batch_size:
+                    MovieSimilarity.objects.bulk_create(batch)
+                    rows_written += len(batch)
+                    batch = []
+
+            if batch:
+                MovieSimilarity.objects.bulk_create(batch)
+                rows_written += len(batch)
+
+        text_movie_ids, texts = load_movie_texts()
+
+        try:
+            text_matrix, vectorizer = build_text_matrix(texts)
+        except ValueError as error:
+            # Raised by the vectorizer when no overview or tagline term survives its document frequency cut
+            self.stdout.write(self.style.WARNING(f'Text index not built: {error}'))
+        else:
+            save_text_index(settings.MOVIE_TEXT_INDEX_DIR, text_movie_ids, text_matrix, vectorizer)
+            text_index.clear()
+
+            self.stdout.write(f'Text index built with {len(vectorizer.vocabulary_)} terms')
+
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Similarity index built for {len(movie_ids)} movies ({rows_written} rows) in {elapsed:.1f}s'))
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from movies.recommender import workers
+from movies.recommender.batch import compute_shard, delete_recommendations, load_ratings_snapshot, users_to_process
+from movies.recommender.ratings import DEFAULT_NEIGHBORS, DEFAULT_RECOMMENDATIONS
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import multiprocessing
+import os
+import time
+
+
+class Command(BaseCommand):
+    help = 'Precompute the recommendations served by /profile/{user_id}/recommendation, sharded over a process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--changed-only', action='store_true',
+                            help='Only users never processed or whose own or neighbors\' ratings changed since')
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--shard-size', type=int, default=500)
+        parser.add_argument('--neighbors', type=int, default=DEFAULT_NEIGHBORS)
+        parser.add_argument('--limit', type=int, default=DEFAULT_RECOMMENDATIONS)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        user_ids, obsolete = users_to_process(options['changed_only'])
+
+        if obsolete:
+            delete_recommendations(obsolete)
+
+        shard_size = options['shard_size']
+        shards = [user_ids[start:start + shard_size] for start in range(0, len(user_ids), shard_size)]
+        arguments = (shards, repeat(options['neighbors']), repeat(options['limit']))
+
+        if options['workers'] > 1 and len(shards) > 1:
+            # Spawned rather than forked, so workers do not inherit this process' connections and pool threads
+            connections.close_all()
+
+            with ProcessPoolExecutor(max_workers=min(options['workers'], len(shards)), initializer=workers.setup_worker,
+                                     mp_context=multiprocessing.get_context('spawn')) as executor:
+                written = list(executor.map(workers.compute_shard, *arguments))
+        else:
+            load_ratings_snapshot()
+            written = list(map(compute_shard, *arguments))
+
+        users = sum(shard_users for shard_users, _ in written)
+        recommendations = sum(shard_recommendations for _, shard_recommendations in written)
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{recommendations} recommendations stored for {users} users in {len(shards)} shards '
+            f'({len(obsolete)} obsolete users cleared) in {elapsed:.1f}s'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from movies.search import refresh_search_documents, BATCH_SIZE
+
+import time
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text and trigram search documents used by /search'
+
+    def add_arguments(self, parser):
+        parser.add_argument('movie_ids', type=int, nargs='*')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        refreshed = refresh_search_documents(options['movie_ids'] or None, batch_size=options['batch_size'])
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Search documents rebuilt for {refreshed} movies in {elapsed:.1f}s'))
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from movies.models import Ratings, MovieListMovies
+
+
+# A user's latest rating of a movie wins, while a list keeps the entry that first added a movie, and so its position
+DUPLICATES = [
+    ('Ratings', Ratings, ['user', 'movie'], [F('updated_at').desc(nulls_last=True), F('id').desc()]),
+    ('List entries', MovieListMovies, ['movie_list', 'movie'], [F('added_at').asc(), F('id').asc()]),
+]
+
+
+def duplicate_ids(model, unique_fields, keep_order):
+    ranked = model.objects.annotate(
+        position=Window(RowNumber(), partition_by=[F(field) for field in unique_fields], order_by=keep_order))
+    return list(ranked.filter(position__gt=1).values_list('id', flat=True))
+
+
+class Command(BaseCommand):
+    help = ('Remove duplicate (user, movie) ratings and (list, movie) entries, '
+            'which the unique constraints on those tables reject')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Only report duplicates, exit non-zero if any')
+
+    def handle(self, *args, **options):
+        found = []
+
+        for name, model, unique_fields, keep_order in DUPLICATES:
+            ids = duplicate_ids(model, unique_fields, keep_order)
+
+            if not ids:
+                self.stdout.write(self.style.SUCCESS(f'{name} have no duplicates'))
+            elif options['check']:
+                found.append(f'{len(ids)} duplicate {name.lower()}: {ids[:20]}')
+            else:
+                # Plain SQL, so neither delete signals nor the counter columns they update are needed yet,
+                # and this can run before the migration adding the constraints
+                with connection.cursor() as cursor:
+                    cursor.execute(f'DELETE FROM {model._meta.db_table} WHERE id = ANY(%s)', [ids])
+                self.stdout.write(self.style.SUCCESS(f'{name}: removed {len(ids)} duplicates'))
+
+                if model is Ratings:
+                    self.stdout.write('Run sync_counters once migrated, to recompute the rating summaries')
+
+        if found:
+            raise CommandError('\n'.join(found))
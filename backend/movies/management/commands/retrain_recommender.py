@@ -0,0 +1,82 @@
+from django.core.management import call_command
+from django.db import close_old_connections
+
+from movies.management.commands.train_recommender import Command as TrainCommand
+from movies.models import Ratings
+from movies.recommender.factorization import factorization_model
+
+from datetime import datetime, timezone
+import time
+
+
+class Command(TrainCommand):
+    help = ('Retrain and publish the factorization model when enough ratings changed or it got too old. '
+            'With --loop, keeps checking every --interval seconds')
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--min-new-ratings', type=int, default=1000,
+                            help='Ratings created or edited since the served version was trained')
+        parser.add_argument('--max-age', type=int, default=24 * 60 * 60,
+                            help='Seconds after which the served version is retrained regardless')
+        parser.add_argument('--loop', action='store_true')
+        parser.add_argument('--interval', type=int, default=300)
+        parser.add_argument('--similarity-interval', type=int, default=0,
+                            help='With --loop, also rebuild the movie similarity index every this many seconds')
+
+    def handle(self, *args, **options):
+        if options['rollback'] or options['unpin']:
+            return super().handle(*args, **options)
+
+        if not options['loop']:
+            self.retrain_if_due(options)
+            return
+
+        similarity_built_at = time.monotonic()
+
+        while True:
+            try:
+                self.retrain_if_due(options)
+
+                if options['similarity_interval'] and time.monotonic() - similarity_built_at >= options['similarity_interval']:
+                    call_command('build_movie_similarity', stdout=self.stdout)
+                    similarity_built_at = time.monotonic()
+            except Exception as error:
+                # A failed run (database restart, full disk) is retried on the next check instead of ending the loop
+                self.stderr.write(f'Retraining failed: {error!r}')
+            finally:
+                close_old_connections()
+
+            time.sleep(options['interval'])
+
+    def retrain_if_due(self, options):
+        current = factorization_model.registry.current()
+
+        if current and current.get('pinned'):
+            self.stdout.write(f'Version {current["version"]} was rolled back to and is pinned, '
+                              f'run train_recommender --unpin to resume retraining')
+            return None
+
+        reason = self.retrain_reason(current, options)
+
+        if reason is None:
+            self.stdout.write('Served model is up to date')
+            return None
+
+        self.stdout.write(f'Retraining: {reason}')
+        return self.train(options)
+
+    def retrain_reason(self, current, options):
+        if current is None:
+            return 'no model published yet'
+
+        age = time.time() - current['trained_at']
+        if age >= options['max_age']:
+            return f'version {current["version"]} is {age / 3600:.1f} hours old'
+
+        trained_at = datetime.fromtimestamp(current['trained_at'], tz=timezone.utc)
+        new_ratings = Ratings.objects.filter(updated_at__gt=trained_at).count()
+        if new_ratings >= options['min_new_ratings']:
+            return f'{new_ratings} ratings changed since version {current["version"]}'
+
+        return None
@@ -1,21 +1,104 @@
 from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
+from django.db import connection, transaction
 
 from movies.models import Movie, Genre, MoviesGenres
 from movies.models import Person, MoviesDirectors, MoviesActors
 from movies.models import OscarCategory, OscarWinsMovie, OscarWinsPerson
+from movies.search import deferred_search_updates, refresh_search_documents
+from movies.counters import sync_oscar_win_counts
+from movies.cache import bump_catalog_generation
 
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 import csv
+import time
+
+
+DATA_FILES = {
+    'movie': 'movies/data/movies.csv',
+    'genre': 'movies/data/genres.csv',
+    'movies_genres': 'movies/data/movies_genres.csv',
+    'oscar_categories': 'movies/data/oscar_categories.csv',
+    'oscar_wins_movie': 'movies/data/oscar_wins_movies.csv',
+    'people': 'movies/data/people.csv',
+    'movies_actors': 'movies/data/movies_actors.csv',
+    'movies_directors': 'movies/data/movies_directors.csv',
+    'oscar_wins_person': 'movies/data/oscar_wins_people.csv',
+}
+
+# Tables within a level only reference tables of earlier levels, so each level can be loaded in parallel
+BULK_LEVELS = [
+    ['movie', 'genre', 'oscar_categories', 'people'],
+    ['movies_genres', 'oscar_wins_movie', 'movies_actors', 'movies_directors', 'oscar_wins_person'],
+]
 
 
 class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument('model_name', type=str)
         parser.add_argument('file_path', type=str, nargs='?')
+        parser.add_argument('--bulk', action='store_true', help='Stream CSV rows into the database in batches')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--workers', type=int, default=4, help='Tables loaded in parallel in bulk mode')
 
     def handle(self, *args, **options):
-        file_path = options['file_path']
-        model_name = options['model_name']
+        with deferred_search_updates():
+            if options['bulk']:
+                self.bulk_seed(options['model_name'], options['file_path'], options['batch_size'], options['workers'])
+            else:
+                self.seed(options['model_name'], options['file_path'])
+
+        bump_catalog_generation()
+
+    def bulk_seed(self, model_name, file_path, batch_size, workers):
+        if model_name == 'all':
+            levels = BULK_LEVELS
+        elif model_name not in BULK_ROWS:
+            self.stdout.write(self.style.ERROR(f'Unknown model name {model_name}.'))
+            return
+        else:
+            levels = [[model_name]]
+
+        for level in levels:
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+                futures = {
+                    name: executor.submit(Command.bulk_load_table, name, file_path or DATA_FILES[name], batch_size)
+                    for name in level
+                }
+
+            for name, future in futures.items():
+                rows, elapsed = future.result()
+                self.stdout.write(f'{name}: {rows} rows in {elapsed:.2f}s ({rows / max(elapsed, 1e-9):.0f} rows/sec)')
+
+        refresh_search_documents()
+        sync_oscar_win_counts()
 
+        self.stdout.write(self.style.SUCCESS(f'{model_name} seeded successfully'))
+
+    @staticmethod
+    def bulk_load_table(model_name, file_path, batch_size):
+        model, build = BULK_ROWS[model_name]
+        started = time.perf_counter()
+        rows = 0
+
+        try:
+            with open(file_path, 'r', encoding='utf-8', newline='') as file, transaction.atomic():
+                reader = csv.DictReader(file)
+
+                while batch := list(islice(reader, batch_size)):
+                    model.objects.bulk_create([build(row) for row in batch], batch_size=batch_size)
+                    rows += len(batch)
+
+                with connection.cursor() as cursor:
+                    for sql in connection.ops.sequence_reset_sql(no_style(), [model]):
+                        cursor.execute(sql)
+        finally:
+            connection.close()
+
+        return rows, time.perf_counter() - started
+
+    def seed(self, model_name, file_path):
         if model_name == 'all':
             Command.seed_all()
         else:
@@ -165,13 +248,50 @@ class Command(BaseCommand):
 
     @staticmethod
     def seed_all():
-        Command.seed_movie('movies/data/movies.csv')
-        Command.seed_genre('movies/data/genres.csv')
-        Command.seed_movies_genres('movies/data/movies_genres.csv')
-        Command.seed_oscar_categories('movies/data/oscar_categories.csv')
-        Command.seed_oscar_wins_movie('movies/data/oscar_wins_movies.csv')
-        Command.seed_people('movies/data/people.csv')
-        Command.seed_movies_actors('movies/data/movies_actors.csv')
-        Command.seed_movies_directors('movies/data/movies_directors.csv')
-        Command.seed_oscar_wins_person('movies/data/oscar_wins_people.csv')
+        Command.seed_movie(DATA_FILES['movie'])
+        Command.seed_genre(DATA_FILES['genre'])
+        Command.seed_movies_genres(DATA_FILES['movies_genres'])
+        Command.seed_oscar_categories(DATA_FILES['oscar_categories'])
+        Command.seed_oscar_wins_movie(DATA_FILES['oscar_wins_movie'])
+        Command.seed_people(DATA_FILES['people'])
+        Command.seed_movies_actors(DATA_FILES['movies_actors'])
+        Command.seed_movies_directors(DATA_FILES['movies_directors'])
+        Command.seed_oscar_wins_person(DATA_FILES['oscar_wins_person'])
+
+
+BULK_ROWS = {
+    'movie': (Movie, lambda row: Movie(id=int(row['movie_id']),
+                                       release_year=int(row['year']),
+                                       title=row['title'],
+                                       tagline=row['tagline'],
+                                       runtime=int(row['runtime']),
+                                       budget=int(row['budget']),
+                                       revenue=int(row['revenue']),
+                                       overview=row['overview'])),
+    'genre': (Genre, lambda row: Genre(id=int(row['genre_id']), name=row['genre'])),
+    'movies_genres': (MoviesGenres, lambda row: MoviesGenres(movie_id=int(row['movie_id']),
+                                                             genre_id=int(row['genre_id']))),
+    'oscar_categories': (OscarCategory, lambda row: OscarCategory(id=int(row['category_id']),
+                                                                  name=row['category_name'])),
+    'oscar_wins_movie': (OscarWinsMovie, lambda row: OscarWinsMovie(movie_id=int(row['movie_id']),
+                                                                    category_id=int(row['category_id']),
+                                                                    year=int(row['year_ceremony']),
+                                                                    ceremony=int(row['ceremony']))),
+    'people': (Person, lambda row: Person(id=int(row['person_id']),
+                                          first_name=row['first_name'],
+                                          last_name=row['last_name'],
+                                          birthday=row['birthday'] or None,
+                                          place_of_birth=row['place_of_birth'],
+                                          biography=row['biography'])),
+    'movies_actors': (MoviesActors, lambda row: MoviesActors(movie_id=int(row['movie_id']),
+                                                             actor_id=int(row['actor_id']),
+                                                             character=row['character'])),
+    'movies_directors': (MoviesDirectors, lambda row: MoviesDirectors(movie_id=int(row['movie_id']),
+                                                                      director_id=int(row['director_id']))),
+    'oscar_wins_person': (OscarWinsPerson, lambda row: OscarWinsPerson(person_id=int(row['person_id']),
+                                                                       category_id=int(row['category_id']),
+                                                                       movie_id=int(row['movie_id']),
+                                                                       year=int(row['year_ceremony']),
+                                                                       ceremony=int(row['ceremony']))),
+}
 
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from movies.counters import stale_oscar_win_counts, sync_oscar_win_counts
+from movies.counters import stale_rating_summaries, sync_rating_summaries
+from movies.counters import stale_comment_counts, sync_comment_counts
+
+
+COUNTERS = [
+    ('Oscar win counters', stale_oscar_win_counts, sync_oscar_win_counts),
+    ('Rating summaries', stale_rating_summaries, sync_rating_summaries),
+    ('Comment counters', stale_comment_counts, sync_comment_counts),
+]
+
+
+class Command(BaseCommand):
+    help = 'Verify denormalized counters against their source tables and repair the ones that drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Only report drifted counters, exit non-zero if any')
+
+    def handle(self, *args, **options):
+        drifted = []
+
+        for name, find_stale, sync in COUNTERS:
+            stale_movie_ids = find_stale()
+
+            if not stale_movie_ids:
+                self.stdout.write(self.style.SUCCESS(f'{name} are up to date'))
+            elif options['check']:
+                drifted.append(f'{name} drifted for {len(stale_movie_ids)} movies: {stale_movie_ids[:20]}')
+            else:
+                sync(stale_movie_ids)
+                self.stdout.write(self.style.SUCCESS(f'{name} repaired for {len(stale_movie_ids)} movies'))
+
+        if drifted:
+            raise CommandError('\n'.join(drifted))
@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from movies.recommender.factorization import ALGORITHMS, factorization_model, train_factorization
+
+import time
+
+
+class Command(BaseCommand):
+    help = 'Train and publish the matrix factorization model served by /profile/{user_id}/recommendation?mode=svd'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--algorithm', choices=ALGORITHMS, default='svd')
+        parser.add_argument('--factors', type=int, default=100)
+        parser.add_argument('--epochs', type=int, default=20)
+        parser.add_argument('--lr', type=float, default=0.005)
+        parser.add_argument('--reg', type=float, default=0.02)
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--rollback', action='store_true',
+                            help='Serve the previously published version again instead of training, and pin it so '
+                                 'retrain_recommender leaves it served')
+        parser.add_argument('--unpin', action='store_true', help='Let retrain_recommender replace a rolled back version')
+
+    def handle(self, *args, **options):
+        registry = factorization_model.registry
+
+        if options['rollback']:
+            entry = registry.rollback()
+
+            if entry is None:
+                raise CommandError('No previous model version to roll back to')
+
+            self.stdout.write(self.style.SUCCESS(f"Rolled back to model version {entry['version']}, pinned until --unpin"))
+            return
+
+        if options['unpin']:
+            entry = registry.unpin()
+
+            if entry is None:
+                raise CommandError('The served model version is not pinned')
+
+            self.stdout.write(self.style.SUCCESS(f"Unpinned model version {entry['version']}"))
+            return
+
+        self.train(options)
+
+    def train(self, options):
+        started = time.perf_counter()
+
+        artifact = train_factorization(options['algorithm'], options['factors'], options['epochs'],
+                                       options['lr'], options['reg'], options['seed'])
+
+        if artifact is None:
+            self.stdout.write(self.style.ERROR('No ratings found.'))
+            return None
+
+        entry = factorization_model.registry.publish(artifact)
+
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Model version {entry['version']} trained on {artifact['ratings_count']} ratings of "
+            f"{len(artifact['user_ids'])} users and {len(artifact['movie_ids'])} movies in {elapsed:.1f}s"))
+
+        return entry
@@ -0,0 +1,261 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.decorators import sync_and_async_middleware
+
+from asgiref.sync import iscoroutinefunction
+
+from contextlib import contextmanager
+from pathlib import Path
+import atexit
+import bisect
+import ipaddress
+import json
+import os
+import threading
+import time
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram:
+    __slots__ = ('counts', 'total')
+
+    def __init__(self, counts=None, total=0.0):
+        # One count per bucket plus the +Inf overflow, stored non-cumulative
+        self.counts = counts or [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = total
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.total += seconds
+
+    def merge(self, other):
+        self.counts = [mine + theirs for mine, theirs in zip(self.counts, other.counts)]
+        self.total += other.total
+
+
+class Metrics:
+    """Request and recommender metrics of this process.
+
+    With a directory set, a background thread dumps this process' state there every flush_interval seconds,
+    and collect() sums the live state with the dumps of the other workers.
+    """
+
+    def __init__(self, directory=None, flush_interval=5.0):
+        self.directory = Path(directory) if directory else None
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.latency = {}
+        self.recommender = {}
+        self.in_flight = 0
+        self.flusher_pid = None
+
+    def request_started(self):
+        if self.directory is not None and self.flusher_pid != os.getpid():
+            self.start_flusher()
+
+        with self.lock:
+            self.in_flight += 1
+
+    def request_finished(self, route, method, status, seconds):
+        with self.lock:
+            self.in_flight -= 1
+            self.requests[(route, method, str(status))] = self.requests.get((route, method, str(status)), 0) + 1
+            self.latency.setdefault((route, method), Histogram()).observe(seconds)
+
+    @contextmanager
+    def recommender_timer(self, recommender):
+        started = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.recommender.setdefault((recommender,), Histogram()).observe(time.perf_counter() - started)
+
+    def state(self):
+        with self.lock:
+            return {
+                'requests': [[list(labels), count] for labels, count in self.requests.items()],
+                'latency': [[list(labels), histogram.counts, histogram.total] for labels, histogram in self.latency.items()],
+                'recommender': [[list(labels), histogram.counts, histogram.total]
+                                for labels, histogram in self.recommender.items()],
+                'in_flight': self.in_flight,
+            }
+
+    def start_flusher(self):
+        # Started lazily in each worker, since server processes fork after the module is imported
+        with self.lock:
+            if self.flusher_pid == os.getpid():
+                return
+            self.flusher_pid = os.getpid()
+
+        threading.Thread(target=self.flush_periodically, name='metrics-flusher', daemon=True).start()
+        atexit.register(self.flush)
+
+    def flush_periodically(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        path = self.directory / f'{os.getpid()}.json'
+        temporary = self.directory / f'{os.getpid()}.tmp'
+        temporary.write_text(json.dumps(self.state()))
+        os.replace(temporary, path)
+
+    def collect(self):
+        """This process' live state plus the last dump of every other worker, summed."""
+        states = [self.state()]
+
+        if self.directory is not None:
+            for path in self.directory.glob('*.json'):
+                if not path.stem.isdigit() or int(path.stem) == os.getpid():
+                    continue
+
+                try:
+                    state = json.loads(path.read_text())
+                except (OSError, ValueError):
+                    continue
+
+                # Counters of exited workers still count, their in-flight requests do not
+                if not process_alive(int(path.stem)):
+                    state['in_flight'] = 0
+
+                states.append(state)
+
+        requests, latency, recommender, in_flight = {}, {}, {}, 0
+
+        for state in states:
+            for labels, count in state['requests']:
+                requests[tuple(labels)] = requests.get(tuple(labels), 0) + count
+
+            for merged, rows in ((latency, state['latency']), (recommender, state['recommender'])):
+                for labels, counts, total in rows:
+                    merged.setdefault(tuple(labels), Histogram()).merge(Histogram(counts, total))
+
+            in_flight += state['in_flight']
+
+        return requests, latency, recommender, in_flight
+
+    def render(self):
+        requests, latency, recommender, in_flight = self.collect()
+
+        lines = [
+            '# HELP http_requests_total Requests handled, by route, method and status code.',
+            '# TYPE http_requests_total counter',
+        ]
+        for (route, method, status), count in sorted(requests.items()):
+            lines.append(f'http_requests_total{{{labels(route=route, method=method, status=status)}}} {count}')
+
+        lines += [
+            '# HELP http_requests_in_flight Requests being handled.',
+            '# TYPE http_requests_in_flight gauge',
+            f'http_requests_in_flight {in_flight}',
+        ]
+
+        lines += render_histogram('http_request_duration_seconds', 'Request latency, by route and method.',
+                                  latency, ('route', 'method'))
+        lines += render_histogram('recommender_compute_seconds', 'Recommendation compute time, by recommender.',
+                                  recommender, ('recommender',))
+
+        return '\n'.join(lines) + '\n'
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+
+    return True
+
+
+def labels(**values):
+    return ','.join(f'{name}="{escape(value)}"' for name, value in values.items())
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def render_histogram(name, description, histograms, label_names):
+    lines = [f'# HELP {name} {description}', f'# TYPE {name} histogram']
+
+    for label_values, histogram in sorted(histograms.items()):
+        series = labels(**dict(zip(label_names, label_values)))
+        cumulative = 0
+
+        for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{series},le="{bound}"}} {cumulative}')
+
+        lines.append(f'{name}_sum{{{series}}} {histogram.total}')
+        lines.append(f'{name}_count{{{series}}} {cumulative}')
+
+    return lines
+
+
+metrics = Metrics(getattr(settings, 'METRICS_DIR', None), getattr(settings, 'METRICS_FLUSH_INTERVAL', 5.0))
+
+
+def request_route(request):
+    match = getattr(request, 'resolver_match', None)
+    # Unresolved paths share one label, so scanners cannot blow up the series count
+    return match.route if match else 'unmatched'
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    """Counts requests by route, method and status, and records their latency."""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            started = time.perf_counter()
+            metrics.request_started()
+            status = 500
+
+            try:
+                response = await get_response(request)
+                status = response.status_code
+                return response
+            finally:
+                metrics.request_finished(request_route(request), request.method, status, time.perf_counter() - started)
+    else:
+        def middleware(request):
+            started = time.perf_counter()
+            metrics.request_started()
+            status = 500
+
+            try:
+                response = get_response(request)
+                status = response.status_code
+                return response
+            finally:
+                metrics.request_finished(request_route(request), request.method, status, time.perf_counter() - started)
+
+    return middleware
+
+
+def metrics_allowed(address):
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+
+    allowed = getattr(settings, 'METRICS_ALLOWED_IPS', ['127.0.0.1', '::1'])
+    return any(address in ipaddress.ip_network(network.strip(), strict=False) for network in allowed if network.strip())
+
+
+def metrics_view(request):
+    if not metrics_allowed(request.META.get('REMOTE_ADDR', '')):
+        return HttpResponseForbidden()
+
+    return HttpResponse(metrics.render(), content_type=CONTENT_TYPE)
@@ -1,4 +1,7 @@
 from django.db import models
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator, MaxValueValidator, MinLengthValidator, MaxLengthValidator
 from datetime import date
 from django.contrib.auth.models import User, AbstractUser
@@ -16,6 +19,16 @@ class Movie(models.Model):
     budget = models.PositiveIntegerField(validators=[MinValueValidator(0)], null=True, blank=True)
     revenue = models.PositiveBigIntegerField(validators=[MinValueValidator(0)], null=True, blank=True)
     overview = models.TextField(null=True)
+    num_oscar_wins = models.PositiveIntegerField(default=0, editable=False)
+    num_ratings = models.PositiveIntegerField(default=0, editable=False)
+    ratings_sum = models.PositiveIntegerField(default=0, editable=False)
+    num_ratings_1 = models.PositiveIntegerField(default=0, editable=False)
+    num_ratings_2 = models.PositiveIntegerField(default=0, editable=False)
+    num_ratings_3 = models.PositiveIntegerField(default=0, editable=False)
+    num_ratings_4 = models.PositiveIntegerField(default=0, editable=False)
+    num_ratings_5 = models.PositiveIntegerField(default=0, editable=False)
+    average_rating = models.FloatField(default=0, editable=False)
+    num_comments = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True, null=True)
     updated_at = models.DateTimeField(auto_now=True, null=True)
 
@@ -27,6 +40,12 @@ class Movie(models.Model):
     comments_by_profiles = models.ManyToManyField('User', through='Comments', related_name='comments_on_movies')
     ratings_by_profiles = models.ManyToManyField('User', through='Ratings', related_name='ratings_on_movies')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-num_oscar_wins', '-release_year', '-id'], name='movie_oscar_wins_year_idx'),
+            models.Index(fields=['-average_rating', '-num_ratings', '-id'], name='movie_average_rating_idx'),
+        ]
+
     def __str__(self):
         return f'{self.title}'
 
@@ -51,6 +70,12 @@ class MoviesGenres(models.Model):
     class Meta:
         verbose_name = 'Movie Genre Relation'
         verbose_name_plural = 'Movies Genres Relations'
+        indexes = [
+            models.Index(fields=['genre', 'movie'], name='movies_genres_genre_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['movie', 'genre'], name='movies_genres_uniq'),
+        ]
 
     def __str__(self):
         return f'{self.id}'
@@ -86,6 +111,12 @@ class MoviesDirectors(models.Model):
     class Meta:
         verbose_name = 'Movie Director Relation'
         verbose_name_plural = 'Movies Directors Relations'
+        indexes = [
+            models.Index(fields=['director', 'movie'], name='movies_directors_director_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['movie', 'director'], name='movies_directors_uniq'),
+        ]
 
     def __str__(self):
         return f'{self.id} {self.movie} {self.director}'
@@ -102,6 +133,10 @@ class MoviesActors(models.Model):
     class Meta:
         verbose_name = 'Movie Actor Relation'
         verbose_name_plural = 'Movies Actors Relations'
+        # Not unique, one actor can play several characters of a movie
+        indexes = [
+            models.Index(fields=['actor', 'movie'], name='movies_actors_actor_idx'),
+        ]
 
     def __str__(self):
         return f'{self.id} {self.movie} {self.actor} {self.character}'
@@ -134,6 +169,10 @@ class OscarWinsMovie(models.Model):
     class Meta:
         verbose_name = 'Oscar Wins Movie Relation'
         verbose_name_plural = 'Oscar Wins Movies Relations'
+        indexes = [
+            models.Index(fields=['ceremony', 'category'], name='oscar_wins_movie_ceremony_idx'),
+            models.Index(fields=['year'], name='oscar_wins_movie_year_idx'),
+        ]
 
     def __str__(self):
         return f'{self.id}: {self.movie} category {self.category}'
@@ -153,6 +192,13 @@ class OscarWinsPerson(models.Model):
     class Meta:
         verbose_name = 'Oscar Wins Person Relation'
         verbose_name_plural = 'Oscar Wins People Relations'
+        indexes = [
+            models.Index(fields=['movie', 'category'], name='oscar_wins_person_movie_idx'),
+            models.Index(fields=['person', 'year'], name='oscar_wins_person_year_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['person', 'movie', 'category'], name='oscar_wins_person_uniq'),
+        ]
 
     def __str__(self):
         return f'{self.id} {self.person} {self.movie} {self.category} {self.year} {self.ceremony}'
@@ -181,6 +227,9 @@ class Comments(models.Model):
 
     class Meta:
         verbose_name_plural = 'Comments'
+        indexes = [
+            models.Index(fields=['movie', '-created_at', '-id'], name='comment_movie_created_idx'),
+        ]
 
     def __str__(self):
         return f'{self.id}'
@@ -196,6 +245,9 @@ class Ratings(models.Model):
 
     class Meta:
         verbose_name_plural = 'Ratings'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'movie'], name='ratings_user_movie_uniq'),
+        ]
 
     def __str__(self):
         return f'{self.id}'
@@ -227,6 +279,83 @@ class MovieListMovies(models.Model):
     class Meta:
         verbose_name = 'Movies Lists Relation'
         verbose_name_plural = 'Movies Lists Relations'
+        indexes = [
+            models.Index(fields=['movie_list', 'added_at'], name='movie_list_added_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['movie_list', 'movie'], name='movie_list_movies_uniq'),
+        ]
 
     def __str__(self):
         return f'{self.movie_list} - {self.movie}'
+
+
+class MovieSimilarity(models.Model):
+    id = models.AutoField(primary_key=True)
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='similar_movies')
+    similar_movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Movie Similarity'
+        verbose_name_plural = 'Movie Similarities'
+        constraints = [
+            models.UniqueConstraint(fields=['movie', 'rank'], name='movie_similarity_movie_rank_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.movie} ~ {self.similar_movie} ({self.score:.3f})'
+
+
+class MovieSearchDocument(models.Model):
+    movie = models.OneToOneField(Movie, on_delete=models.CASCADE, primary_key=True, related_name='search_document')
+    title = models.CharField(max_length=80)
+    people = models.TextField(blank=True, default='')
+    document = models.TextField(blank=True, default='')
+    vector = SearchVectorField(null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Movie Search Document'
+        verbose_name_plural = 'Movie Search Documents'
+        indexes = [
+            GinIndex(fields=['vector'], name='movie_search_vector_gin'),
+            GinIndex(fields=['document'], name='movie_search_document_trgm', opclasses=['gin_trgm_ops']),
+        ]
+
+    def __str__(self):
+        return f'{self.movie_id}: {self.title}'
+
+
+class UserRecommendation(models.Model):
+    id = models.AutoField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recommendations')
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    estimated_rating = models.FloatField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'User Recommendation'
+        verbose_name_plural = 'User Recommendations'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'rank'], name='user_recommendation_user_rank_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.user} -> {self.movie} ({self.estimated_rating:.2f})'
+
+
+class UserNeighborhood(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='neighborhood')
+    neighbor_ids = ArrayField(models.IntegerField(), default=list)
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'User Neighborhood'
+        verbose_name_plural = 'User Neighborhoods'
+
+    def __str__(self):
+        return f'{self.user} ({len(self.neighbor_ids)} neighbors)'
@@ -0,0 +1,85 @@
+from django.contrib.postgres.expressions import ArraySubquery
+from django.db.models import F, JSONField, OuterRef, Subquery
+from django.db.models.functions import JSONObject
+from django.http import Http404
+from django.shortcuts import aget_object_or_404
+
+from movies.models import Movie, MoviesGenres, MoviesActors, MoviesDirectors, OscarWinsMovie, OscarWinsPerson
+from movies.schemas import (MoviePageSchema, GenreSchema, ActorSchemaForMovies, DirectorSchemaForMovies,
+                            OscarWinsMovieSchema, PersonSchemaForMovies, rating_summary)
+
+
+def related_rows(queryset, **fields):
+    return ArraySubquery(queryset.filter(movie=OuterRef('pk')).order_by('id').values(row=JSONObject(**fields)))
+
+
+def movie_page_queryset():
+    """Movies annotated with every relation of the detail page as JSON arrays, so a page is one query."""
+    return Movie.objects.annotate(
+        genre_rows=related_rows(MoviesGenres.objects, id='genre_id', name='genre__name'),
+        actor_rows=related_rows(MoviesActors.objects, id='actor_id', first_name='actor__first_name',
+                                last_name='actor__last_name', character='character'),
+        director_rows=related_rows(MoviesDirectors.objects, id='director_id', first_name='director__first_name',
+                                   last_name='director__last_name'),
+        win_rows=related_rows(OscarWinsMovie.objects, id='id', category_id='category_id', category='category__name',
+                              year='year', ceremony='ceremony'),
+        person_win_rows=related_rows(OscarWinsPerson.objects, category_id='category_id', id='person_id',
+                                     first_name='person__first_name', last_name='person__last_name'),
+    )
+
+
+def build_movie_page(movie):
+    winners = {}
+    for person in movie.person_win_rows:
+        winners.setdefault(person.pop('category_id'), PersonSchemaForMovies(**person))
+
+    return MoviePageSchema(
+        id=movie.id,
+        release_year=movie.release_year,
+        title=movie.title,
+        tagline=movie.tagline,
+        runtime=movie.runtime,
+        budget=movie.budget,
+        revenue=movie.revenue,
+        overview=movie.overview,
+        genres=[GenreSchema(**genre) for genre in movie.genre_rows],
+        actors=[ActorSchemaForMovies(**actor) for actor in movie.actor_rows],
+        directors=[DirectorSchemaForMovies(**director) for director in movie.director_rows],
+        movie_oscar_wins=[
+            OscarWinsMovieSchema(
+                id=win['id'],
+                category=win['category'],
+                year=win['year'],
+                ceremony=win['ceremony'],
+                person=winners.get(win['category_id'])
+            )
+            for win in movie.win_rows
+        ],
+        rating=rating_summary(movie),
+    )
+
+
+async def aget_movie_page(movie_id):
+    return build_movie_page(await aget_object_or_404(movie_page_queryset(), id=movie_id))
+
+
+def oscar_wins_queryset():
+    """Oscar wins with category, movie title and the winning person (if any) joined into each row."""
+    winner = OscarWinsPerson.objects.filter(movie=OuterRef('movie'), category=OuterRef('category')).order_by('id').values(
+        row=JSONObject(id='person_id', first_name='person__first_name', last_name='person__last_name'))[:1]
+
+    return OscarWinsMovie.objects.annotate(
+        category_name=F('category__name'),
+        movie_title=F('movie__title'),
+        winner=Subquery(winner, output_field=JSONField()),
+    )
+
+
+def get_ceremony_page(ceremony):
+    wins = list(oscar_wins_queryset().filter(ceremony=ceremony).order_by('category_id', 'id'))
+
+    if not wins:
+        raise Http404(f'Ceremony {ceremony} not found')
+
+    # Left unvalidated: the response schema resolves each win's category and person from the annotations
+    return {'ceremony': ceremony, 'year': wins[0].year, 'wins': wins}
@@ -0,0 +1,156 @@
+from django.db.models import Q
+
+from ninja import Field, Schema
+from ninja.errors import HttpError
+from ninja.pagination import PageNumberPagination, make_response_paginated, paginate as ninja_paginate
+from ninja.utils import contribute_operation_args, contribute_operation_callback
+
+from functools import partial, wraps
+from typing import Any, List, Optional
+import asyncio
+import base64
+import json
+
+
+class KeysetPagination(PageNumberPagination):
+    """Page number pagination with an opt-in keyset (cursor) mode.
+
+    Passing `cursor` (empty for the first page) switches to seeking past the last row of the previous page
+    on the queryset ordering, so every page costs the same as the first one. The opaque cursor of the next
+    page is returned as `next`, and the total `count` is only computed on request with `with_count`.
+    """
+
+    class Input(Schema):
+        page: int = Field(1, ge=1)
+        cursor: Optional[str] = None
+        with_count: bool = False
+
+    class Output(Schema):
+        items: List[Any]
+        count: Optional[int] = None
+        next: Optional[str] = None
+
+    def paginate_queryset(self, queryset, pagination, **params):
+        if pagination.cursor is None:
+            return super().paginate_queryset(stable_ordering(queryset), pagination, **params)
+
+        ordering, page = self._seek(queryset, pagination.cursor)
+
+        return {
+            **self._keyset_page(list(page), ordering),
+            "count": self._items_count(queryset) if pagination.with_count else None,
+        }
+
+    async def apaginate_queryset(self, queryset, pagination, **params):
+        if pagination.cursor is None:
+            offset = (pagination.page - 1) * self.page_size
+            return {
+                "items": [item async for item in stable_ordering(queryset)[offset:offset + self.page_size]],
+                "count": await queryset.acount(),
+            }
+
+        ordering, page = self._seek(queryset, pagination.cursor)
+
+        return {
+            **self._keyset_page([item async for item in page], ordering),
+            "count": await queryset.acount() if pagination.with_count else None,
+        }
+
+    def _seek(self, queryset, cursor):
+        ordering = keyset_ordering(queryset)
+        page = queryset.order_by(*ordering)
+
+        if cursor:
+            page = page.filter(seek_filter(ordering, decode_cursor(cursor, len(ordering))))
+
+        return ordering, page[:self.page_size + 1]
+
+    def _keyset_page(self, items, ordering):
+        next_cursor = None
+
+        if len(items) > self.page_size:
+            items = items[:self.page_size]
+            next_cursor = encode_cursor([getattr(items[-1], field.lstrip('-')) for field in ordering])
+
+        return {"items": items, "next": next_cursor}
+
+
+def paginate(pagination_class, **paginator_params):
+    """ninja's paginate decorator, extended to coroutine views through the paginator's apaginate_queryset."""
+    def decorator(func):
+        if not asyncio.iscoroutinefunction(func):
+            return ninja_paginate(pagination_class, **paginator_params)(func)
+
+        paginator = pagination_class(**paginator_params)
+
+        @wraps(func)
+        async def view_with_pagination(request, **kwargs):
+            pagination_params = kwargs.pop("ninja_pagination")
+            items = await func(request, **kwargs)
+            return await paginator.apaginate_queryset(items, pagination=pagination_params, request=request, **kwargs)
+
+        contribute_operation_args(view_with_pagination, "ninja_pagination", paginator.Input, paginator.InputSource)
+        contribute_operation_callback(view_with_pagination, partial(make_response_paginated, paginator))
+        return view_with_pagination
+
+    return decorator
+
+
+def paged_schema(item_schema):
+    return type(f'Paged{item_schema.__name__}', (KeysetPagination.Output,), {'__annotations__': {'items': List[item_schema]}})
+
+
+def keyset_ordering(queryset):
+    ordering = list(queryset.query.order_by)
+
+    if not ordering or not all(isinstance(field, str) for field in ordering):
+        raise ValueError('Keyset pagination needs a queryset ordered by field names')
+
+    if ordering[-1].lstrip('-') not in ('id', 'pk'):
+        ordering.append('-id' if ordering[-1].startswith('-') else 'id')
+
+    return ordering
+
+
+def stable_ordering(queryset):
+    """The queryset with the id tiebreaker that cursors seek on appended to its ordering.
+
+    Offset pages then neither skip nor repeat tied rows, and list rows in cursor order. Querysets ordered by
+    expressions are returned as they are.
+    """
+    try:
+        return queryset.order_by(*keyset_ordering(queryset))
+    except ValueError:
+        return queryset
+
+
+def seek_filter(ordering, values):
+    """Rows strictly after `values` in `ordering`: (a > x) OR (a = x AND b > y) OR ..."""
+    condition = Q()
+    equal = {}
+
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition |= Q(**equal, **{f'{name}__{lookup}': value})
+        equal[name] = value
+
+    return condition
+
+
+def encode_cursor(values):
+    # Dates go out as full ISO strings, the lookups parse them back without losing microseconds
+    data = json.dumps(values, separators=(',', ':'), default=lambda value: value.isoformat())
+    return base64.urlsafe_b64encode(data.encode()).decode()
+
+
+def decode_cursor(cursor, length):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise HttpError(400, "Invalid cursor")
+
+    if not isinstance(values, list) or len(values) != length:
+        raise HttpError(400, "Invalid cursor")
+
+    return values
@@ -0,0 +1,74 @@
+import json
+
+
+EXPLAIN = 'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) '
+
+
+def explain(connection, sql, params):
+    """Run a statement under EXPLAIN (ANALYZE, BUFFERS) and return its JSON plan document."""
+    with connection.cursor() as cursor:
+        cursor.execute(EXPLAIN + sql, params)
+        document = cursor.fetchone()[0]
+
+    # psycopg decodes json columns, other drivers hand back the text
+    return (json.loads(document) if isinstance(document, str) else document)[0]
+
+
+def plan_nodes(node, stops_early=False):
+    """Yield (node, stops_early) over a plan tree.
+
+    Nodes below a Limit, a merge join or a semi / anti join can stop before returning all the rows they
+    were estimated to return, so returning fewer than estimated is no estimate miss for them.
+    """
+    yield node, stops_early
+
+    stops_early = (stops_early or node['Node Type'] in ('Limit', 'Merge Join')
+                   or node.get('Join Type') in ('Semi', 'Anti'))
+
+    for child in node.get('Plans', []):
+        yield from plan_nodes(child, stops_early)
+
+
+def node_label(node):
+    relation = node.get('Relation Name')
+    return f"{node['Node Type']} on {relation}" if relation else node['Node Type']
+
+
+def plan_findings(document, min_rows=1000, estimate_factor=10.0):
+    """Filtering or repeated sequential scans reading at least min_rows rows per loop, and nodes whose row
+    estimate is off by estimate_factor.
+
+    A scan of a whole table without a filter, run once, is what reading that table takes, and small tables are
+    cheaper to scan than to index, however often, hence the floor on rows scanned per loop. Estimates are per
+    loop too, and nodes that never ran or return few rows either way are left alone.
+    """
+    findings = []
+
+    for node, stops_early in plan_nodes(document['Plan']):
+        loops = node.get('Actual Loops', 0)
+
+        if not loops:
+            continue
+
+        actual = node['Actual Rows']
+
+        if node['Node Type'] == 'Seq Scan' and ('Filter' in node or loops > 1):
+            scanned = actual + node.get('Rows Removed by Filter', 0)
+
+            if scanned >= min_rows:
+                each = f' in each of {loops} loops' if loops > 1 else ''
+                findings.append(f'{node_label(node)} read {scanned:.0f} rows{each}')
+
+        planned = node['Plan Rows']
+        larger, smaller = max(actual, planned), max(min(actual, planned), 1)
+
+        if larger >= min_rows / 10 and larger / smaller >= estimate_factor and not (stops_early and actual < planned):
+            findings.append(f'{node_label(node)} estimated {planned:.0f} rows, returned {actual:.0f}')
+
+    return findings
+
+
+def plan_summary(document):
+    plan = document['Plan']
+    hit, read = plan.get('Shared Hit Blocks', 0), plan.get('Shared Read Blocks', 0)
+    return f"{document['Execution Time']:.2f} ms, {hit} shared blocks hit, {read} read"
@@ -0,0 +1,13 @@
+"""Recommendation models.
+
+Their numpy / scipy / scikit-learn stack is only imported by code serving or building recommendations, so process
+startup, management commands and every other request do not pay for it.
+"""
+
+import sys
+
+
+def loaded_rating_matrix():
+    """This process' rating matrix if something imported it, None otherwise, as there is nothing to keep up to date."""
+    module = sys.modules.get('movies.recommender.ratings')
+    return module.rating_matrix if module is not None else None
@@ -0,0 +1,93 @@
+from django.db import transaction
+from django.db.models import Max
+from django.utils.timezone import now
+
+from movies.models import Ratings, UserNeighborhood, UserRecommendation
+from movies.recommender.ratings import rating_matrix
+
+from collections import defaultdict
+from datetime import datetime, timezone
+
+
+def users_to_process(changed_only=False):
+    """Ids of the users to compute recommendations for, and of users whose stored ones are obsolete.
+
+    With changed_only, only users never processed, or whose own or stored neighbors' ratings changed since
+    their recommendations were computed. Deleted ratings go unnoticed until the next full run.
+    """
+    last_rated = dict(Ratings.objects.order_by().values('user_id').annotate(last=Max('updated_at'))
+                      .values_list('user_id', 'last'))
+    stored = {user_id: (computed_at, neighbor_ids)
+              for user_id, computed_at, neighbor_ids in UserNeighborhood.objects.values_list('user_id', 'computed_at', 'neighbor_ids')}
+
+    obsolete = [user_id for user_id in stored if user_id not in last_rated]
+
+    if not changed_only:
+        return sorted(last_rated), obsolete
+
+    never = datetime.min.replace(tzinfo=timezone.utc)
+
+    def changed(user_id):
+        if user_id not in stored:
+            return True
+
+        computed_at, neighbor_ids = stored[user_id]
+        return any((last_rated.get(other) or never) > computed_at for other in (user_id, *neighbor_ids))
+
+    return [user_id for user_id in sorted(last_rated) if changed(user_id)], obsolete
+
+
+def delete_recommendations(user_ids):
+    with transaction.atomic():
+        UserRecommendation.objects.filter(user_id__in=user_ids).delete()
+        UserNeighborhood.objects.filter(user_id__in=user_ids).delete()
+
+
+snapshot = {}
+
+
+def load_ratings_snapshot():
+    # Taken before the load, so ratings written meanwhile count as changed on the next --changed-only run
+    snapshot['taken_at'] = now()
+    rating_matrix.load()
+
+
+def compute_shard(user_ids, n_neighbors, limit):
+    """Compute and store the recommendations of a shard of users, returning (users, recommendations) written."""
+    results = {
+        user_id: rating_matrix.recommend_with_neighbors(user_id, n_neighbors, limit)
+        for user_id in user_ids if rating_matrix.has_user(user_id)
+    }
+
+    write_recommendations(results, snapshot['taken_at'])
+
+    return len(results), sum(len(recommendations) for recommendations, _ in results.values())
+
+
+def write_recommendations(results, computed_at):
+    """Upsert {user_id: (recommendations, neighbor_ids)} over the users' stored rows in one transaction."""
+    with transaction.atomic():
+        UserRecommendation.objects.bulk_create(
+            [
+                UserRecommendation(user_id=user_id, movie_id=movie_id, rank=rank, estimated_rating=estimate,
+                                   computed_at=computed_at)
+                for user_id, (recommendations, _) in results.items()
+                for rank, (movie_id, estimate) in enumerate(recommendations, start=1)
+            ],
+            update_conflicts=True, unique_fields=['user', 'rank'],
+            update_fields=['movie', 'estimated_rating', 'computed_at'],
+        )
+
+        # Ranks past a user's new list length are leftovers of a longer previous list
+        users_by_length = defaultdict(list)
+        for user_id, (recommendations, _) in results.items():
+            users_by_length[len(recommendations)].append(user_id)
+
+        for length, user_ids in users_by_length.items():
+            UserRecommendation.objects.filter(user_id__in=user_ids, rank__gt=length).delete()
+
+        UserNeighborhood.objects.bulk_create(
+            [UserNeighborhood(user_id=user_id, neighbor_ids=neighbor_ids, computed_at=computed_at)
+             for user_id, (_, neighbor_ids) in results.items()],
+            update_conflicts=True, unique_fields=['user'], update_fields=['neighbor_ids', 'computed_at'],
+        )
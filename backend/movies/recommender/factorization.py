@@ -0,0 +1,193 @@
+from django.conf import settings
+
+from movies.models import Ratings
+from movies.recommender.registry import ModelRegistry
+
+import numpy as np
+import threading
+import time
+
+
+ALGORITHMS = ('svd', 'svdpp')
+
+RATING_SCALE = (1, 5)
+
+
+def train_factorization(algorithm='svd', n_factors=100, n_epochs=20, lr_all=0.005, reg_all=0.02, random_state=None):
+    """Fit a surprise SVD / SVD++ model on every stored rating and export it as a plain array artifact.
+
+    surprise is only needed here, serving the artifact takes numpy alone.
+    """
+    from surprise import SVD, SVDpp, Dataset, Reader
+    import pandas as pd
+
+    # Taken before the read, so ratings written during it and the fit count as rated since training
+    trained_at = time.time()
+    rows = list(Ratings.objects.values_list('user_id', 'movie_id', 'rating'))
+
+    if not rows:
+        return None
+
+    ratings = pd.DataFrame(rows, columns=['user_id', 'movie_id', 'rating'])
+    trainset = Dataset.load_from_df(ratings, Reader(rating_scale=RATING_SCALE)).build_full_trainset()
+
+    model_class = SVDpp if algorithm == 'svdpp' else SVD
+    model = model_class(n_factors=n_factors, n_epochs=n_epochs, lr_all=lr_all, reg_all=reg_all,
+                        random_state=random_state)
+    model.fit(trainset)
+
+    user_factors = np.array(model.pu, dtype=np.float64)
+
+    if algorithm == 'svdpp':
+        # SVD++ users are pu plus the normalized sum of the implicit factors of their rated items,
+        # folded in once here so serving stays a single dot product
+        for inner_user, user_ratings in trainset.ur.items():
+            items = [inner_item for inner_item, _ in user_ratings]
+            user_factors[inner_user] += model.yj[items].sum(axis=0) / np.sqrt(len(items))
+
+    return {
+        'algorithm': algorithm,
+        'trained_at': trained_at,
+        'ratings_count': len(rows),
+        'reg': reg_all,
+        'global_mean': float(trainset.global_mean),
+        'user_ids': np.array([trainset.to_raw_uid(inner) for inner in range(trainset.n_users)], dtype=np.int64),
+        'movie_ids': np.array([trainset.to_raw_iid(inner) for inner in range(trainset.n_items)], dtype=np.int64),
+        'user_bias': np.array(model.bu, dtype=np.float64),
+        'item_bias': np.array(model.bi, dtype=np.float64),
+        'user_factors': user_factors,
+        'item_factors': np.array(model.qi, dtype=np.float64),
+    }
+
+
+class FactorizationModel:
+    """A trained factorization served from memory: every movie of a user is scored with one dot product."""
+
+    def __init__(self, artifact, version=None):
+        self.version = version
+        self.algorithm = artifact['algorithm']
+        self.trained_at = artifact['trained_at']
+        self.reg = artifact['reg']
+        self.global_mean = artifact['global_mean']
+        self.user_bias = artifact['user_bias']
+        self.item_bias = artifact['item_bias']
+        self.user_factors = artifact['user_factors']
+        self.item_factors = artifact['item_factors']
+        self.movie_ids = artifact['movie_ids']
+        self.user_index = {int(user_id): row for row, user_id in enumerate(artifact['user_ids'])}
+        self.movie_index = {int(movie_id): col for col, movie_id in enumerate(self.movie_ids)}
+
+    def fold_in(self, ratings):
+        """Bias and factors of a user from their (movie_id, rating) pairs, the item side held fixed.
+
+        A ridge regression over the user's rated movies, so ratings made after training count without
+        retraining the model.
+        """
+        cols = [self.movie_index[movie_id] for movie_id, _ in ratings if movie_id in self.movie_index]
+
+        if not cols:
+            return None
+
+        targets = np.array([rating for movie_id, rating in ratings if movie_id in self.movie_index], dtype=np.float64)
+        targets -= self.global_mean + self.item_bias[cols]
+
+        features = np.hstack([self.item_factors[cols], np.ones((len(cols), 1))])
+        gram = features.T @ features + self.reg * len(cols) * np.eye(features.shape[1])
+        solution = np.linalg.solve(gram, features.T @ targets)
+
+        return solution[-1], solution[:-1]
+
+    def user_vector(self, user_id, ratings, rated_since_training):
+        row = self.user_index.get(user_id)
+
+        if row is not None and not rated_since_training:
+            return self.user_bias[row], self.user_factors[row]
+
+        return self.fold_in(ratings)
+
+    def recommend(self, user_id, ratings, rated_since_training=False, limit=20):
+        """Top (movie_id, estimate) pairs among the movies the user has not rated."""
+        vector = self.user_vector(user_id, ratings, rated_since_training)
+
+        if vector is None:
+            return []
+
+        user_bias, user_factors = vector
+        scores = self.global_mean + user_bias + self.item_bias + self.item_factors @ user_factors
+
+        rated = [self.movie_index[movie_id] for movie_id, _ in ratings if movie_id in self.movie_index]
+        scores[rated] = -np.inf
+
+        limit = min(limit, len(scores) - len(rated))
+        if limit <= 0:
+            return []
+
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.lexsort((self.movie_ids[top], -scores[top]))]
+
+        return list(zip(self.movie_ids[top].tolist(), np.clip(scores[top], *RATING_SCALE).tolist()))
+
+
+class FactorizationStore:
+    """The model version published in the registry, loaded once per process.
+
+    Every reload_interval seconds the manifest is checked. A newer (or rolled back) version is loaded on a
+    background thread while requests keep being served by the current model, then swapped in by a single
+    reference assignment.
+    """
+
+    def __init__(self, registry, reload_interval=30):
+        self.registry = registry
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._model = None
+        self._version = None
+        self._checked_at = None
+        self._loading = False
+
+    def get(self):
+        if self._checked_at is None or time.monotonic() - self._checked_at >= self.reload_interval:
+            self.refresh()
+
+        return self._model
+
+    def refresh(self):
+        with self._lock:
+            if self._loading or (self._checked_at is not None
+                                 and time.monotonic() - self._checked_at < self.reload_interval):
+                return
+
+            self._checked_at = time.monotonic()
+            entry = self.registry.current()
+
+            if entry is None or entry['version'] == self._version:
+                return
+
+            if self._model is not None:
+                self._loading = True
+                threading.Thread(target=self._load, args=(entry,), name='recommender-reload', daemon=True).start()
+                return
+
+            # Nothing to serve yet, so the first load happens in the request
+            self._swap(entry)
+
+    def _load(self, entry):
+        try:
+            self._swap(entry)
+        finally:
+            self._loading = False
+
+    def _swap(self, entry):
+        model = FactorizationModel(self.registry.load(entry), entry['version'])
+        self._model, self._version = model, entry['version']
+
+    def set_model(self, model):
+        with self._lock:
+            self._model = model
+            self._version = model.version if model else None
+
+
+factorization_model = FactorizationStore(
+    ModelRegistry(settings.RECOMMENDER_MODEL_DIR, settings.RECOMMENDER_KEEP_VERSIONS),
+    settings.RECOMMENDER_RELOAD_INTERVAL,
+)
@@ -0,0 +1,232 @@
+from django.conf import settings
+
+from movies.models import Ratings
+
+from scipy import sparse
+import numpy as np
+import threading
+import time
+
+
+DEFAULT_NEIGHBORS = 10
+DEFAULT_RECOMMENDATIONS = 20
+
+
+class RatingMatrix:
+    """In-memory CSR user-item rating matrix answering kNN queries with sparse math.
+
+    Writes to already stored cells are applied to the CSR data array in place. New cells go to a small
+    pending buffer, folded into the matrix by the next query or once it grows past `max_pending`, so a
+    single write never pays for rebuilding the whole matrix. A zero value means "not rated".
+
+    Past `max_age` the matrix is reloaded on a background thread while queries keep using the current one.
+    Writes made meanwhile are replayed onto the new matrix before it is swapped in.
+    """
+
+    def __init__(self, max_pending=1000, max_age=None):
+        self.max_pending = max_pending
+        self.max_age = max_age
+        self._lock = threading.RLock()
+        self._loaded_at = None
+        self._replay = None
+
+    @property
+    def loaded(self):
+        return self._loaded_at is not None
+
+    def load(self):
+        state = self._read_state()
+        with self._lock:
+            self._install(state)
+
+    def _read_state(self):
+        rows = np.array(list(Ratings.objects.values_list('user_id', 'movie_id', 'rating')), dtype=np.int64).reshape(-1, 3)
+
+        user_ids = np.unique(rows[:, 0]).tolist()
+        movie_ids = np.unique(rows[:, 1]).tolist()
+
+        user_rows = np.searchsorted(user_ids, rows[:, 0])
+        movie_cols = np.searchsorted(movie_ids, rows[:, 1])
+
+        matrix = sparse.csr_matrix((rows[:, 2].astype(np.float64), (user_rows, movie_cols)),
+                                   shape=(len(user_ids), len(movie_ids)))
+        matrix.sum_duplicates()
+
+        return user_ids, movie_ids, matrix
+
+    def _install(self, state):
+        self.user_ids, self.movie_ids, self._matrix = state
+        self.user_index = {user_id: row for row, user_id in enumerate(self.user_ids)}
+        self.movie_index = {movie_id: col for col, movie_id in enumerate(self.movie_ids)}
+        self._pending = {}
+        self._sq_norms = np.asarray(self._matrix.multiply(self._matrix).sum(axis=1)).ravel()
+        self._loaded_at = time.monotonic()
+
+    def ensure_loaded(self):
+        with self._lock:
+            if not self.loaded:
+                self.load()
+            elif (self.max_age is not None and self._replay is None
+                  and time.monotonic() - self._loaded_at > self.max_age):
+                self._replay = []
+                threading.Thread(target=self._reload, name='rating-matrix-reload', daemon=True).start()
+
+    def _reload(self):
+        from django.db import connection
+
+        try:
+            state = self._read_state()
+
+            with self._lock:
+                replay, self._replay = self._replay, None
+                self._install(state)
+
+                for user_id, movie_id, rating in replay:
+                    if rating:
+                        self.set_rating(user_id, movie_id, rating)
+                    else:
+                        self.remove_rating(user_id, movie_id)
+        finally:
+            # Keep serving the current matrix if the load failed, the next expired query retries it
+            with self._lock:
+                if self._replay is not None:
+                    self._replay = None
+                    self._loaded_at = time.monotonic()
+            connection.close()
+
+    def set_rating(self, user_id, movie_id, rating):
+        with self._lock:
+            if not self.loaded:
+                return
+
+            if self._replay is not None:
+                self._replay.append((user_id, movie_id, rating))
+
+            row = self._user_row(user_id)
+            col = self._movie_col(movie_id)
+            old_rating = self._set_cell(row, col, float(rating))
+            self._sq_norms[row] += float(rating) ** 2 - old_rating ** 2
+
+    def remove_rating(self, user_id, movie_id):
+        with self._lock:
+            if not self.loaded:
+                return
+
+            if self._replay is not None:
+                self._replay.append((user_id, movie_id, None))
+
+            if user_id not in self.user_index or movie_id not in self.movie_index:
+                return
+
+            row = self.user_index[user_id]
+            old_rating = self._set_cell(row, self.movie_index[movie_id], 0.0)
+            self._sq_norms[row] -= old_rating ** 2
+
+    def has_ratings(self):
+        self.ensure_loaded()
+        with self._lock:
+            return bool((self._sq_norms > 0).any())
+
+    def has_user(self, user_id):
+        self.ensure_loaded()
+        with self._lock:
+            return user_id in self.user_index and self._sq_norms[self.user_index[user_id]] > 0
+
+    def nearest_users(self, user_id, n_neighbors=DEFAULT_NEIGHBORS):
+        """Rows of the n_neighbors users closest to user_id by Euclidean distance, the user included."""
+        self.ensure_loaded()
+        with self._lock:
+            matrix = self._current_matrix()
+            row = self.user_index[user_id]
+
+            user_vector = matrix.getrow(row).toarray().ravel()
+            sq_distances = self._sq_norms + self._sq_norms[row] - 2 * (matrix @ user_vector)
+            sq_distances[self._sq_norms == 0] = np.inf
+            sq_distances[row] = 0
+
+            n_neighbors = min(n_neighbors, len(sq_distances))
+            neighbors = np.argpartition(sq_distances, n_neighbors - 1)[:n_neighbors]
+
+            return neighbors[np.argsort(sq_distances[neighbors], kind='stable')], matrix
+
+    def recommend(self, user_id, n_neighbors=DEFAULT_NEIGHBORS, limit=DEFAULT_RECOMMENDATIONS):
+        """Movies the user has not rated, scored by the mean rating of their nearest neighbors."""
+        return self.recommend_with_neighbors(user_id, n_neighbors, limit)[0]
+
+    def recommend_with_neighbors(self, user_id, n_neighbors=DEFAULT_NEIGHBORS, limit=DEFAULT_RECOMMENDATIONS):
+        """recommend(), plus the ids of the other users the estimates were drawn from."""
+        self.ensure_loaded()
+        with self._lock:
+            n_users = int((self._sq_norms > 0).sum())
+            n_neighbors = max(1, min(n_neighbors, n_users // 2))
+
+            neighbors, matrix = self.nearest_users(user_id, n_neighbors)
+            neighbor_ratings = matrix[neighbors]
+
+            rating_sums = np.asarray(neighbor_ratings.sum(axis=0)).ravel()
+            rating_counts = np.asarray((neighbor_ratings > 0).sum(axis=0)).ravel()
+
+            user_rated = matrix.getrow(self.user_index[user_id]).toarray().ravel() > 0
+            candidates = np.flatnonzero((rating_counts > 0) & ~user_rated)
+
+            neighbor_ids = [self.user_ids[neighbor] for neighbor in neighbors if self.user_ids[neighbor] != user_id]
+
+            if not candidates.size:
+                return [], neighbor_ids
+
+            estimates = rating_sums[candidates] / rating_counts[candidates]
+            order = np.lexsort((candidates, -estimates))[:limit]
+
+            return [(self.movie_ids[candidates[i]], float(estimates[i])) for i in order], neighbor_ids
+
+    def _user_row(self, user_id):
+        if user_id not in self.user_index:
+            self.user_index[user_id] = len(self.user_ids)
+            self.user_ids.append(user_id)
+            self._sq_norms = np.append(self._sq_norms, 0.0)
+        return self.user_index[user_id]
+
+    def _movie_col(self, movie_id):
+        if movie_id not in self.movie_index:
+            self.movie_index[movie_id] = len(self.movie_ids)
+            self.movie_ids.append(movie_id)
+        return self.movie_index[movie_id]
+
+    def _set_cell(self, row, col, value):
+        """Store value at (row, col) and return the previous value."""
+        if row < self._matrix.shape[0] and col < self._matrix.shape[1]:
+            start, end = self._matrix.indptr[row], self._matrix.indptr[row + 1]
+            position = start + np.searchsorted(self._matrix.indices[start:end], col)
+
+            if position < end and self._matrix.indices[position] == col:
+                old_value = float(self._matrix.data[position])
+                self._matrix.data[position] = value
+                return old_value
+
+        old_value = self._pending.pop((row, col), 0.0)
+        if value:
+            self._pending[(row, col)] = value
+            if len(self._pending) > self.max_pending:
+                self._current_matrix()
+
+        return old_value
+
+    def _current_matrix(self):
+        """The matrix with the pending buffer folded in, once per batch of writes rather than once per query."""
+        shape = (len(self.user_ids), len(self.movie_ids))
+        if self._matrix.shape != shape:
+            self._matrix.resize(shape)
+
+        if self._pending:
+            (rows, cols), values = zip(*self._pending.keys()), list(self._pending.values())
+            delta = sparse.csr_matrix((values, (rows, cols)), shape=shape)
+
+            self._matrix = self._matrix + delta
+            self._matrix.eliminate_zeros()
+            self._matrix.sort_indices()
+            self._pending = {}
+
+        return self._matrix
+
+
+rating_matrix = RatingMatrix(max_age=getattr(settings, 'RATING_MATRIX_MAX_AGE', 300))
@@ -0,0 +1,104 @@
+from pathlib import Path
+import joblib
+import json
+import os
+import time
+
+
+MANIFEST = 'manifest.json'
+
+
+def replace_file(path, write):
+    """Write through a temporary file renamed over path, so readers see the old or the new file, never a partial one."""
+    temporary = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    write(temporary)
+    os.replace(temporary, path)
+
+
+def version_entry(entry):
+    """A manifest entry without the keys describing the manifest rather than its version."""
+    return {key: value for key, value in entry.items() if key not in ('previous', 'pinned')}
+
+
+class ModelRegistry:
+    """Versioned model artifacts in one directory, shared by the trainer and every worker.
+
+    manifest.json names the served version, the one it replaced and whether a rollback pinned it. Publishing
+    or rolling back only rewrites the manifest, which workers poll to swap models.
+    """
+
+    def __init__(self, directory, keep=3):
+        self.directory = Path(directory)
+        self.keep = keep
+
+    def current(self):
+        try:
+            return json.loads((self.directory / MANIFEST).read_text())
+        except (OSError, ValueError):
+            return None
+
+    def load(self, entry):
+        return joblib.load(self.directory / entry['file'])
+
+    def publish(self, artifact):
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        base = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime(artifact['trained_at']))}-{artifact['algorithm']}"
+        version, suffix = base, 1
+        while (self.directory / f'{version}.joblib').exists():
+            suffix += 1
+            version = f'{base}.{suffix}'
+
+        replace_file(self.directory / f'{version}.joblib', lambda path: joblib.dump(artifact, path))
+
+        entry = {
+            'version': version,
+            'file': f'{version}.joblib',
+            'algorithm': artifact['algorithm'],
+            'trained_at': artifact['trained_at'],
+            'ratings_count': artifact['ratings_count'],
+        }
+        self.write_manifest(entry, self.current())
+        self.prune()
+
+        return entry
+
+    def rollback(self):
+        """Serve the previous version again, keeping the rolled back one as previous so it can be restored.
+
+        The restored version is pinned, so scheduled retraining leaves it served until unpin() or a new publish.
+        """
+        current = self.current()
+
+        if not current or not current.get('previous'):
+            return None
+
+        self.write_manifest(current['previous'], current, pinned=True)
+        return current['previous']
+
+    def unpin(self):
+        current = self.current()
+
+        if not current or not current.get('pinned'):
+            return None
+
+        self.write_manifest(current, current.get('previous'))
+        return current
+
+    def write_manifest(self, entry, previous, pinned=False):
+        manifest = {**version_entry(entry), 'previous': version_entry(previous) if previous else None}
+        if pinned:
+            manifest['pinned'] = True
+
+        manifest = json.dumps(manifest, indent=2)
+        replace_file(self.directory / MANIFEST, lambda path: path.write_text(manifest))
+
+    def prune(self):
+        current = self.current() or {}
+        protected = {current.get('file'), (current.get('previous') or {}).get('file')}
+
+        versions = sorted(self.directory.glob('*.joblib'), key=lambda path: path.stat().st_mtime, reverse=True)
+
+        for path in versions[self.keep:]:
+            if path.name not in protected:
+                path.unlink(missing_ok=True)
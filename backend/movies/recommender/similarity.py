@@ -0,0 +1,86 @@
+from movies.models import Movie, MoviesActors, MoviesDirectors, MoviesGenres
+
+import numpy as np
+
+
+DEFAULT_TOP_K = 10
+DEFAULT_CHUNK_SIZE = 500
+
+
+def load_movie_soups():
+    """Return movie ids and their "soup" of cast, director and genre tokens, ordered by id."""
+    movie_ids = list(Movie.objects.order_by('id').values_list('id', flat=True))
+    soups = {movie_id: [] for movie_id in movie_ids}
+
+    for movie_id, first_name, last_name in MoviesActors.objects.values_list(
+            'movie_id', 'actor__first_name', 'actor__last_name'):
+        soups[movie_id].append(f"{first_name}{last_name or ''}")
+
+    for movie_id, first_name, last_name in MoviesDirectors.objects.values_list(
+            'movie_id', 'director__first_name', 'director__last_name'):
+        soups[movie_id].append(f"{first_name}{last_name or ''}")
+
+    for movie_id, genre_name in MoviesGenres.objects.values_list('movie_id', 'genre__name'):
+        soups[movie_id].append(genre_name.replace(" ", ""))
+
+    return movie_ids, [' '.join(soups[movie_id]) for movie_id in movie_ids]
+
+
+def build_feature_matrix(soups):
+    """Vectorize soups into a sparse matrix with L2-normalized rows, so a dot product is a cosine similarity."""
+    from sklearn.feature_extraction.text import CountVectorizer
+    from sklearn.preprocessing import normalize
+
+    count = CountVectorizer(stop_words='english', min_df=1)
+    count_matrix = count.fit_transform(soups).astype(np.float32)
+    return normalize(count_matrix, norm='l2', copy=False).tocsr()
+
+
+def top_k_neighbors(scores, offset, top_k):
+    """Pick the top_k highest scoring columns per row of a dense score block, skipping each row's own movie."""
+    n_rows, n_cols = scores.shape
+    rows = np.arange(n_rows)
+    scores[rows, offset + rows] = -np.inf
+
+    k = min(top_k, n_cols - 1)
+    if k <= 0:
+        return np.empty((n_rows, 0), dtype=np.intp), np.empty((n_rows, 0), dtype=scores.dtype)
+
+    candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.lexsort((candidates, -candidate_scores), axis=1)
+
+    return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidate_scores, order, axis=1)
+
+
+def iter_similarity_index(feature_matrix, top_k=DEFAULT_TOP_K, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield (row, neighbor rows, scores) for every movie, computing the similarity matrix one block of rows at a time.
+
+    Only a chunk_size x N dense block is held in memory at once, instead of the full N x N matrix.
+    """
+    transposed = feature_matrix.T.tocsc()
+    n_movies = feature_matrix.shape[0]
+
+    for start in range(0, n_movies, chunk_size):
+        stop = min(start + chunk_size, n_movies)
+        block = (feature_matrix[start:stop] @ transposed).toarray()
+        neighbors, scores = top_k_neighbors(block, start, top_k)
+
+        for row in range(stop - start):
+            yield start + row, neighbors[row], scores[row]
+
+
+def compute_similar_movies(movie_id, top_k=DEFAULT_TOP_K):
+    """Score a single movie against the catalog, for movies added after the index was last built."""
+    movie_ids, soups = load_movie_soups()
+
+    try:
+        row = movie_ids.index(movie_id)
+    except ValueError:
+        return []
+
+    feature_matrix = build_feature_matrix(soups)
+    block = (feature_matrix[row] @ feature_matrix.T).toarray()
+    neighbors, scores = top_k_neighbors(block, row, top_k)
+
+    return [(movie_ids[neighbor], float(score)) for neighbor, score in zip(neighbors[0], scores[0])]
@@ -0,0 +1,164 @@
+from django.conf import settings
+
+from movies.models import Movie
+from movies.recommender.registry import replace_file
+
+from pathlib import Path
+import joblib
+import numpy as np
+import os
+import scipy.sparse
+import threading
+import time
+
+
+MATRIX_FILE = 'text_matrix.npz'
+MOVIE_IDS_FILE = 'text_movie_ids.npy'
+VECTORIZER_FILE = 'text_vectorizer.joblib'
+
+
+def load_movie_texts():
+    """Return movie ids and their overview followed by their tagline, ordered by id."""
+    rows = Movie.objects.order_by('id').values_list('id', 'overview', 'tagline')
+    return [movie_id for movie_id, _, _ in rows], [f"{overview or ''} {tagline or ''}" for _, overview, tagline in rows]
+
+
+def build_text_matrix(texts):
+    """TF-IDF vectorize texts into a sparse matrix with L2-normalized rows, returned with the fitted vectorizer."""
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    vectorizer = TfidfVectorizer(stop_words='english', sublinear_tf=True, max_df=0.5, dtype=np.float32)
+    return vectorizer.fit_transform(texts).tocsr(), vectorizer
+
+
+def save_text_index(directory, movie_ids, matrix, vectorizer):
+    """Write the document matrix as .npz, its movie ids as .npy and the vectorizer with joblib.
+
+    The vectorizer is kept apart, as unpickling it imports scikit-learn, which serving indexed movies does not
+    need. The matrix is written last, since its modification time is what tells workers to reload.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    replace_file(directory / VECTORIZER_FILE, lambda path: joblib.dump(vectorizer, path))
+    replace_file(directory / MOVIE_IDS_FILE, lambda path: save_with(np.save, path, np.array(movie_ids, dtype=np.int64)))
+    replace_file(directory / MATRIX_FILE, lambda path: save_with(scipy.sparse.save_npz, path, matrix))
+
+
+def save_with(save, path, array):
+    # Through a file object, since numpy and scipy append their extension to file names without it
+    with open(path, 'wb') as file:
+        save(file, array)
+
+
+class TextIndex:
+    """The TF-IDF document matrix, scoring one movie against the catalog with a sparse row times matrix product."""
+
+    def __init__(self, movie_ids, matrix, modified_at, vectorizer_path=None):
+        self.movie_ids = movie_ids
+        self.matrix = matrix
+        self.modified_at = modified_at
+        self.vectorizer_path = vectorizer_path
+        self._vectorizer = None
+        self.row_index = {int(movie_id): row for row, movie_id in enumerate(movie_ids)}
+
+    def vectorizer(self):
+        """The fitted vectorizer, loaded the first time a movie added since the build is scored."""
+        if self._vectorizer is None and self.vectorizer_path is not None:
+            vectorizer = joblib.load(self.vectorizer_path)
+            # A rebuild may have replaced the file since the matrix was loaded, until the store reloads it
+            if len(vectorizer.vocabulary_) == self.matrix.shape[1]:
+                self._vectorizer = vectorizer
+
+        return self._vectorizer
+
+    def scores(self, movie_id, text=None):
+        """Cosine similarity of a movie to every indexed movie, vectorizing text for movies added since the build."""
+        row = self.row_index.get(movie_id)
+
+        if row is not None:
+            vector = self.matrix[row]
+        elif text is not None and self.vectorizer() is not None:
+            vector = self.vectorizer().transform([text])
+        else:
+            return None
+
+        # The CSR matrix times the densified row, which beats a sparse by sparse product at these sizes
+        return self.matrix @ vector.toarray().ravel()
+
+    def blend(self, scores, metadata_scores, text_weight):
+        """Weighted sum of text scores and {movie_id: score} metadata scores.
+
+        Only the metadata top-K of a movie is stored, so movies outside it count as scoring 0 on metadata.
+        """
+        blended = scores * text_weight
+
+        for movie_id, score in metadata_scores.items():
+            row = self.row_index.get(movie_id)
+            if row is not None:
+                blended[row] += (1 - text_weight) * score
+
+        return blended
+
+    def top(self, movie_id, scores, top_k):
+        """The top_k (movie_id, score) pairs of positive scores, skipping the movie itself. Overwrites its score."""
+        row = self.row_index.get(movie_id)
+        if row is not None:
+            scores[row] = -np.inf
+
+        k = min(top_k, len(scores) - (row is not None))
+        if k <= 0:
+            return []
+
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.lexsort((self.movie_ids[top], -scores[top]))]
+
+        return [(int(self.movie_ids[col]), float(scores[col])) for col in top if scores[col] > 0]
+
+
+class TextIndexStore:
+    """The text index saved in MOVIE_TEXT_INDEX_DIR, loaded on first use.
+
+    Every reload_interval seconds the matrix file's modification time is checked, so a rebuild by
+    build_movie_similarity reaches every worker without a restart.
+    """
+
+    def __init__(self, reload_interval=30):
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._index = None
+        self._checked_at = None
+
+    def get(self):
+        if self._checked_at is not None and time.monotonic() - self._checked_at < self.reload_interval:
+            return self._index
+
+        with self._lock:
+            if self._checked_at is None or time.monotonic() - self._checked_at >= self.reload_interval:
+                self._index = self.load(self._index)
+                self._checked_at = time.monotonic()
+
+        return self._index
+
+    def load(self, current):
+        directory = Path(settings.MOVIE_TEXT_INDEX_DIR)
+
+        try:
+            modified_at = os.stat(directory / MATRIX_FILE).st_mtime
+        except OSError:
+            return None
+
+        if current is not None and current.modified_at == modified_at:
+            return current
+
+        matrix = scipy.sparse.load_npz(directory / MATRIX_FILE).tocsr()
+
+        return TextIndex(np.load(directory / MOVIE_IDS_FILE), matrix, modified_at, directory / VECTORIZER_FILE)
+
+    def clear(self):
+        with self._lock:
+            self._index = None
+            self._checked_at = None
+
+
+text_index = TextIndexStore(settings.RECOMMENDER_RELOAD_INTERVAL)
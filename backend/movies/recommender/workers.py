@@ -0,0 +1,18 @@
+"""Process pool entry points of build_user_recommendations.
+
+Spawned workers import this module before Django is set up, so models are only imported once it is.
+"""
+
+import django
+
+
+def setup_worker():
+    django.setup()
+
+    from movies.recommender.batch import load_ratings_snapshot
+    load_ratings_snapshot()
+
+
+def compute_shard(user_ids, n_neighbors, limit):
+    from movies.recommender.batch import compute_shard
+    return compute_shard(user_ids, n_neighbors, limit)
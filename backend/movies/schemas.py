@@ -44,6 +44,25 @@ class OscarWinsMovieSchema(Schema):
     person: Optional[PersonSchemaForMovies]
 
 
+class OscarWinSchema(OscarWinsMovieSchema):
+    movie_id: int
+    movie_title: str
+
+    @staticmethod
+    def resolve_category(obj):
+        return obj.category_name
+
+    @staticmethod
+    def resolve_person(obj):
+        return obj.winner
+
+
+class CeremonySchema(Schema):
+    ceremony: int
+    year: int
+    wins: list[OscarWinSchema]
+
+
 class ActorSchemaForMovies(Schema):
     id: int
     first_name: str
@@ -63,6 +82,14 @@ class ActorFilmographySchema(Schema):
     release_year: int
 
 
+class PersonListSchema(ModelSchema):
+    class Meta:
+        model = Person
+        fields = ('id', 'first_name', 'last_name', 'birthday', 'place_of_birth')
+
+    birthday: Optional[date]
+
+
 class PersonSchema(ModelSchema):
     class Meta:
         model = Person
@@ -73,6 +100,20 @@ class PersonSchema(ModelSchema):
     oscar_wins: list[OscarWinsPersonSchema] = []
 
 
+class RatingSummarySchema(Schema):
+    count: int
+    average: Optional[float] = None
+    histogram: dict[int, int]
+
+
+def rating_summary(movie):
+    return RatingSummarySchema(
+        count=movie.num_ratings,
+        average=round(movie.average_rating, 2) if movie.num_ratings else None,
+        histogram={value: getattr(movie, f'num_ratings_{value}') for value in range(1, 6)},
+    )
+
+
 class MoviePageSchema(ModelSchema):
     class Meta:
         model = Movie
@@ -85,6 +126,7 @@ class MoviePageSchema(ModelSchema):
     revenue: int = None
     overview: str
     movie_oscar_wins: list[OscarWinsMovieSchema] = []
+    rating: RatingSummarySchema
     
 
 class MovieListSchema(ModelSchema):
@@ -96,6 +138,11 @@ class MovieListSchema(ModelSchema):
     directors: list[PersonSchemaForMovies]
     actors: list[PersonSchemaForMovies]
     overview: str
+    rating: RatingSummarySchema
+
+    @staticmethod
+    def resolve_rating(obj):
+        return rating_summary(obj)
 
 
 class RecommendedMoviesSchema(Schema):
@@ -180,6 +227,25 @@ class RatingEditSchema(Schema):
     rating: int
 
 
+class RatingBatchItem(Schema):
+    movie_id: int
+    rating: int
+
+
+class RatingBatchSchema(Schema):
+    ratings: list[RatingBatchItem]
+
+
+class BatchItemResult(Schema):
+    movie_id: int
+    status: str
+    error: Optional[str] = None
+
+
+class BatchResultSchema(Schema):
+    results: list[BatchItemResult]
+
+
 class MovieInList(Schema):
     id: int
     title: str
@@ -195,6 +261,8 @@ class ListedMoviesSchema(Schema):
     name: str
     description: str
     movies: list[MovieInList]
+    count: Optional[int] = None
+    next: Optional[str] = None
 
 
 class MovieListsSchema(Schema):
@@ -219,3 +287,7 @@ class ListUpdateSchema(Schema):
 class AddMovieToList(Schema):
     list_id: int
     movie_id: int
+
+
+class ListMoviesBatchSchema(Schema):
+    movie_ids: list[int]
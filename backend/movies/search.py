@@ -0,0 +1,102 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+from django.db.models import F, Q, FloatField
+from django.db.models.functions import Cast
+
+from movies.models import Movie, MoviesActors, MoviesDirectors, MovieSearchDocument
+
+from contextlib import contextmanager
+import threading
+
+
+SEARCH_CONFIG = 'simple'
+BATCH_SIZE = 500
+
+_deferred = threading.local()
+
+
+def build_search_documents(movie_ids):
+    titles = dict(Movie.objects.filter(id__in=movie_ids).values_list('id', 'title'))
+    people = {movie_id: [] for movie_id in titles}
+
+    for movie_id, first_name, last_name in MoviesDirectors.objects.filter(movie_id__in=titles).values_list(
+            'movie_id', 'director__first_name', 'director__last_name').order_by('id'):
+        people[movie_id].append(f"{first_name} {last_name or ''}".strip())
+
+    for movie_id, first_name, last_name in MoviesActors.objects.filter(movie_id__in=titles).values_list(
+            'movie_id', 'actor__first_name', 'actor__last_name').order_by('id'):
+        people[movie_id].append(f"{first_name} {last_name or ''}".strip())
+
+    return [
+        MovieSearchDocument(
+            movie_id=movie_id,
+            title=title,
+            people=' '.join(people[movie_id]),
+            document=' '.join([title] + people[movie_id]).lower()
+        )
+        for movie_id, title in titles.items()
+    ]
+
+
+def refresh_search_documents(movie_ids=None, batch_size=BATCH_SIZE):
+    """Rebuild the search documents of the given movies, or of the whole catalog when movie_ids is None."""
+    if movie_ids is None:
+        movie_ids = list(Movie.objects.order_by('id').values_list('id', flat=True))
+    else:
+        movie_ids = sorted(set(movie_ids))
+
+    if getattr(_deferred, 'movie_ids', None) is not None:
+        _deferred.movie_ids.update(movie_ids)
+        return 0
+
+    for start in range(0, len(movie_ids), batch_size):
+        batch = movie_ids[start:start + batch_size]
+
+        MovieSearchDocument.objects.bulk_create(build_search_documents(batch), update_conflicts=True,
+                                                unique_fields=['movie'], update_fields=['title', 'people', 'document', 'updated_at'])
+        MovieSearchDocument.objects.filter(movie_id__in=batch).update(
+            vector=SearchVector('title', weight='A', config=SEARCH_CONFIG) +
+            SearchVector('people', weight='B', config=SEARCH_CONFIG)
+        )
+
+    return len(movie_ids)
+
+
+@contextmanager
+def deferred_search_updates():
+    """Collect search document refreshes issued inside the block and run them once, in batches, on exit."""
+    if getattr(_deferred, 'movie_ids', None) is not None:
+        yield
+        return
+
+    _deferred.movie_ids = set()
+    try:
+        yield
+    finally:
+        movie_ids, _deferred.movie_ids = _deferred.movie_ids, None
+
+    refresh_search_documents(movie_ids)
+
+
+def search_movies(queryset, query):
+    """Filter a Movie queryset by full-text match, substring or trigram similarity, annotated for relevance."""
+    search_query = SearchQuery(query, search_type='websearch', config=SEARCH_CONFIG)
+
+    # Relevance is cast to double precision so that values round-trip exactly through keyset cursors
+    return queryset.annotate(
+        rank=Cast(SearchRank(F('search_document__vector'), search_query), FloatField()),
+        similarity=Cast(TrigramWordSimilarity(query, 'search_document__document'), FloatField()),
+    ).filter(movie_ids_matching(query, search_query))
+
+
+def movie_ids_matching(query, search_query):
+    """A Q of the movies matching any branch of the search.
+
+    Each branch is its own SELECT, so each uses its GIN index. Postgres cannot combine them as one OR
+    predicate and scans every search document instead.
+    """
+    documents = MovieSearchDocument.objects.values_list('movie_id', flat=True)
+
+    return Q(id__in=documents.filter(vector=search_query).union(
+        documents.filter(document__contains=query.lower()),
+        documents.filter(document__trigram_word_similar=query),
+    ))
@@ -0,0 +1,166 @@
+from django.db import connections, transaction
+from django.db.models import QuerySet
+from django.db.backends.signals import connection_created
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed, pre_migrate
+from django.dispatch import receiver
+
+from movies.models import Movie, Genre, MoviesGenres, Person, MoviesActors, MoviesDirectors
+from movies.models import OscarCategory, OscarWinsMovie, OscarWinsPerson, Ratings, Comments
+from movies.cache import bump_catalog_generation, ratings_changed
+from movies.counters import adjust_comment_count, adjust_oscar_wins, adjust_rating_summaries
+from movies.instrumentation import install_query_recorder
+from movies.recommender import loaded_rating_matrix
+from movies.search import refresh_search_documents
+
+
+@receiver(pre_migrate)
+def create_postgres_extensions(sender, using, **kwargs):
+    if sender.name != 'movies' or connections[using].vendor != 'postgresql':
+        return
+
+    with connections[using].cursor() as cursor:
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+
+@receiver(connection_created)
+def record_connection_queries(sender, connection, **kwargs):
+    install_query_recorder(connection)
+
+
+CATALOG_MODELS = [Movie, Genre, MoviesGenres, Person, MoviesActors, MoviesDirectors,
+                  OscarCategory, OscarWinsMovie, OscarWinsPerson]
+
+
+def catalog_changed(sender, **kwargs):
+    transaction.on_commit(bump_catalog_generation)
+
+
+for catalog_model in CATALOG_MODELS:
+    post_save.connect(catalog_changed, sender=catalog_model, dispatch_uid=f'catalog_saved_{catalog_model.__name__}')
+    post_delete.connect(catalog_changed, sender=catalog_model, dispatch_uid=f'catalog_deleted_{catalog_model.__name__}')
+    m2m_changed.connect(catalog_changed, sender=catalog_model, dispatch_uid=f'catalog_m2m_{catalog_model.__name__}')
+
+
+@receiver(pre_save, sender=Ratings)
+def rating_saving(sender, instance, raw=False, **kwargs):
+    if not raw and instance.pk:
+        instance._previous = sender.objects.filter(pk=instance.pk).values_list('movie_id', 'rating').first()
+
+
+@receiver(post_save, sender=Ratings)
+def rating_saved(sender, instance, created, raw=False, **kwargs):
+    previous_movie_id, previous_rating = getattr(instance, '_previous', None) or (None, None)
+
+    rating_matrix = loaded_rating_matrix()
+    if rating_matrix is not None:
+        def update_matrix(user_id=instance.user_id, movie_id=instance.movie_id, rating=instance.rating):
+            if previous_movie_id is not None and previous_movie_id != movie_id:
+                rating_matrix.remove_rating(user_id, previous_movie_id)
+            rating_matrix.set_rating(user_id, movie_id, rating)
+
+        transaction.on_commit(update_matrix)
+
+    if raw:
+        return
+
+    if created or previous_movie_id is None:
+        adjust_rating_summaries({instance.movie_id: (None, instance.rating)})
+    elif previous_movie_id != instance.movie_id:
+        adjust_rating_summaries({previous_movie_id: (previous_rating, None), instance.movie_id: (None, instance.rating)})
+    else:
+        adjust_rating_summaries({instance.movie_id: (previous_rating, instance.rating)})
+
+    transaction.on_commit(ratings_changed)
+
+
+@receiver(post_delete, sender=Ratings)
+def rating_deleted(sender, instance, **kwargs):
+    rating_matrix = loaded_rating_matrix()
+    if rating_matrix is not None:
+        transaction.on_commit(lambda: rating_matrix.remove_rating(instance.user_id, instance.movie_id))
+    adjust_rating_summaries({instance.movie_id: (instance.rating, None)})
+    transaction.on_commit(ratings_changed)
+
+
+@receiver(pre_save, sender=OscarWinsMovie)
+def oscar_win_saving(sender, instance, raw=False, **kwargs):
+    if not raw and instance.pk:
+        instance._previous_movie_id = sender.objects.filter(pk=instance.pk).values_list('movie_id', flat=True).first()
+
+
+@receiver(post_save, sender=OscarWinsMovie)
+def oscar_win_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+
+    previous_movie_id = getattr(instance, '_previous_movie_id', None)
+
+    if created:
+        adjust_oscar_wins(instance.movie_id, 1)
+    elif previous_movie_id is not None and previous_movie_id != instance.movie_id:
+        adjust_oscar_wins(previous_movie_id, -1)
+        adjust_oscar_wins(instance.movie_id, 1)
+
+
+@receiver(post_delete, sender=OscarWinsMovie)
+def oscar_win_deleted(sender, instance, **kwargs):
+    adjust_oscar_wins(instance.movie_id, -1)
+
+
+# Comments never move to another movie, so only creation and deletion change a count
+@receiver(post_save, sender=Comments)
+def comment_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        adjust_comment_count(instance.movie_id, 1)
+
+
+@receiver(post_delete, sender=Comments)
+def comment_deleted(sender, instance, **kwargs):
+    adjust_comment_count(instance.movie_id, -1)
+
+
+@receiver(post_save, sender=Movie)
+def movie_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_search_documents([instance.id])
+
+
+@receiver(post_save, sender=Person)
+def person_saved(sender, instance, created, raw=False, **kwargs):
+    if created or raw:
+        return
+
+    movie_ids = set(MoviesActors.objects.filter(actor=instance).values_list('movie_id', flat=True))
+    movie_ids.update(MoviesDirectors.objects.filter(director=instance).values_list('movie_id', flat=True))
+    refresh_search_documents(movie_ids)
+
+
+def deleting_movies(origin):
+    return isinstance(origin, Movie) or (isinstance(origin, QuerySet) and origin.model is Movie)
+
+
+@receiver(post_save, sender=MoviesActors)
+@receiver(post_save, sender=MoviesDirectors)
+@receiver(post_delete, sender=MoviesActors)
+@receiver(post_delete, sender=MoviesDirectors)
+def movie_credit_changed(sender, instance, raw=False, origin=None, **kwargs):
+    # Credits deleted along with their movie would otherwise insert the search document the cascade just removed
+    if not raw and not deleting_movies(origin):
+        refresh_search_documents([instance.movie_id])
+
+
+@receiver(m2m_changed, sender=MoviesActors)
+@receiver(m2m_changed, sender=MoviesDirectors)
+def movie_credits_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            refresh_search_documents([instance.pk])
+        return
+
+    if action == 'pre_clear':
+        person_field = 'actor' if sender is MoviesActors else 'director'
+        instance._cleared_movie_ids = set(sender.objects.filter(**{person_field: instance}).values_list('movie_id', flat=True))
+    elif action == 'post_clear':
+        refresh_search_documents(getattr(instance, '_cleared_movie_ids', ()))
+    elif action in ('post_add', 'post_remove'):
+        refresh_search_documents(pk_set)
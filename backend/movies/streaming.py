@@ -0,0 +1,31 @@
+from django.core.serializers.json import DjangoJSONEncoder
+
+import json
+
+
+def stream_ndjson(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+def stream_json_array(rows):
+    separator = '['
+    for row in rows:
+        yield separator + json.dumps(row, cls=DjangoJSONEncoder)
+        separator = ','
+
+    yield '[]' if separator == '[' else ']'
+
+
+async def astream_ndjson(rows):
+    async for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+async def astream_json_array(rows):
+    separator = '['
+    async for row in rows:
+        yield separator + json.dumps(row, cls=DjangoJSONEncoder)
+        separator = ','
+
+    yield '[]' if separator == '[' else ']'
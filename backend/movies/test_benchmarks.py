@@ -0,0 +1,422 @@
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from movies.api import app
+from movies.counters import sync_comment_counts, sync_oscar_win_counts, sync_rating_summaries
+from movies.models import Movie, Genre, MoviesGenres, Person, MoviesActors, MoviesDirectors
+from movies.models import OscarCategory, OscarWinsMovie, OscarWinsPerson
+from movies.models import User, Comments, Ratings, MovieList, MovieListMovies
+from movies.models import UserNeighborhood, UserRecommendation
+from movies.recommender.factorization import FactorizationModel, factorization_model, train_factorization
+from movies.recommender.ratings import rating_matrix
+from movies.recommender.text import text_index
+from movies.search import refresh_search_documents
+
+from collections import namedtuple
+from pathlib import Path
+import gc
+import io
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+# Run with BENCHMARK_UPDATE_BASELINE=1 to accept the current numbers as the new baseline
+BASELINE_PATH = Path(__file__).with_name('benchmark_baseline.json')
+REPORT_PATH = os.environ.get('BENCHMARK_REPORT')
+UPDATE_BASELINE = os.environ.get('BENCHMARK_UPDATE_BASELINE') == '1'
+
+SCALE = int(os.environ.get('BENCHMARK_SCALE', 1))
+ITERATIONS = int(os.environ.get('BENCHMARK_ITERATIONS', 20))
+
+# Latency baselines are machine dependent, so they only fail well past the stored p95
+LATENCY_TOLERANCE = float(os.environ.get('BENCHMARK_LATENCY_TOLERANCE', 3.0))
+LATENCY_SLACK_MS = 5.0
+
+PASSWORD = 'Benchmark-pass-2024'
+
+IMPORT_BASELINE_PATH = Path(__file__).with_name('import_time_baseline.json')
+IMPORT_TIME_TOLERANCE = float(os.environ.get('BENCHMARK_IMPORT_TIME_TOLERANCE', 1.5))
+IMPORT_TIME_SLACK_MS = 100.0
+IMPORT_RUNS = 3
+
+# Only recommendation code needs these, startup must not import them
+STARTUP_FORBIDDEN_MODULES = ('numpy', 'scipy', 'sklearn', 'pandas', 'django_pandas', 'joblib', 'surprise')
+
+STARTUP_COMMANDS = {
+    # A web worker: the WSGI application with its URLconf, and so movies.api, loaded
+    'web': ['-c', 'from movies_web.wsgi import application; from django.urls import get_resolver; '
+                  'get_resolver().url_patterns'],
+    'manage_check': ['manage.py', 'check'],
+}
+
+PLOT_WORDS = ('war', 'love', 'family', 'journey', 'city', 'murder', 'detective', 'space', 'king', 'island', 'escape',
+              'revenge', 'school', 'music', 'dream', 'ship', 'secret', 'prison', 'desert', 'robot', 'heist', 'storm',
+              'village', 'spy', 'wedding', 'ghost', 'river', 'empire', 'soldier', 'orphan')
+
+Endpoint = namedtuple('Endpoint', ['name', 'method', 'path', 'body', 'setup'], defaults=[None, None])
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def seed_catalog(scale):
+    """A synthetic catalog shaped like movies/data/*.csv: credits, genres, Oscar wins, users and their activity."""
+    rng = random.Random(1928)
+    # A generator of its own, so plots do not shift the rest of the seeded catalog
+    plots = random.Random(1929)
+    movie_count, person_count, user_count = 100 * scale, 400 * scale, 20 * scale
+
+    genres = Genre.objects.bulk_create(Genre(name=f'Genre {i}') for i in range(10))
+    categories = OscarCategory.objects.bulk_create(OscarCategory(name=f'Category {i}') for i in range(8))
+    people = Person.objects.bulk_create(
+        Person(first_name=f'First{i}', last_name=f'Last{i}', birthday=None, place_of_birth='Somewhere',
+               biography='Biography') for i in range(person_count))
+    movies = Movie.objects.bulk_create(
+        Movie(title=f'Movie {i}', release_year=1928 + i % 90, runtime=80 + i % 90, budget=1000 * i, revenue=2000 * i,
+              tagline='Tagline', overview=' '.join(plots.sample(PLOT_WORDS, 8))) for i in range(movie_count))
+
+    MoviesGenres.objects.bulk_create(
+        MoviesGenres(movie=movie, genre=genre) for movie in movies for genre in rng.sample(genres, 2))
+    MoviesDirectors.objects.bulk_create(MoviesDirectors(movie=movie, director=rng.choice(people)) for movie in movies)
+    MoviesActors.objects.bulk_create(
+        MoviesActors(movie=movie, actor=actor, character='Character') for movie in movies for actor in rng.sample(people, 8))
+
+    wins = []
+    for ceremony, movie in enumerate(movies[::3], start=1):
+        for category in rng.sample(categories, rng.randint(1, 3)):
+            wins.append(OscarWinsMovie(movie=movie, category=category, year=movie.release_year, ceremony=ceremony))
+    OscarWinsMovie.objects.bulk_create(wins)
+    OscarWinsPerson.objects.bulk_create(
+        OscarWinsPerson(person=rng.choice(people), movie=win.movie, category=win.category, year=win.year,
+                        ceremony=win.ceremony) for win in wins[::2])
+
+    users = [User.objects.create_user(username=f'user{i}', email=f'user{i}@example.com', password=PASSWORD)
+             for i in range(user_count)]
+    Ratings.objects.bulk_create(
+        Ratings(user=user, movie=movie, rating=rng.randint(1, 5)) for user in users for movie in rng.sample(movies, 15))
+    Comments.objects.bulk_create(
+        Comments(user=rng.choice(users), movie=movie, comment='A comment') for movie in movies[:20] for _ in range(5))
+
+    for user in users:
+        movie_list = MovieList.objects.create(name=f'List of {user.username}', description='Description', user=user)
+        MovieListMovies.objects.bulk_create(
+            MovieListMovies(movie_list=movie_list, movie=movie) for movie in rng.sample(movies, 10))
+
+    refresh_search_documents()
+    sync_oscar_win_counts()
+    sync_rating_summaries()
+    sync_comment_counts()
+    call_command('build_movie_similarity', stdout=io.StringIO())
+
+    return movies, users
+
+
+# Password hashing would dominate /login and /register, and it is not what this suite guards
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class EndpointBenchmarkTests(TestCase):
+    """Every api.py route, timed through the test client with its SQL queries counted.
+
+    Fails when an endpoint runs more queries than its baseline in benchmark_baseline.json, or when its
+    p95 latency grows past LATENCY_TOLERANCE times the baseline. Set BENCHMARK_REPORT to a path to get a
+    JSON report of the run, BENCHMARK_SCALE to grow the synthetic catalog.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        text_index_dir = cls.enterClassContext(tempfile.TemporaryDirectory())
+        cls.enterClassContext(override_settings(MOVIE_TEXT_INDEX_DIR=text_index_dir))
+        cls.addClassCleanup(text_index.clear)
+
+        movies, users = seed_catalog(SCALE)
+
+        cls.movie = movies[0]
+        cls.batch_movie_ids = [movie.id for movie in movies[:50]]
+        cls.user = users[0]
+        cls.user.is_staff = True
+        cls.user.save()
+
+        cls.person = MoviesActors.objects.filter(movie=cls.movie).first().actor
+        cls.movie_list = MovieList.objects.get(user=cls.user)
+        cls.rating = Ratings.objects.filter(user=cls.user).first()
+        cls.comment = Comments.objects.filter(movie=cls.movie).first()
+
+        rating_matrix.load()
+
+        call_command('build_user_recommendations', workers=1, stdout=io.StringIO())
+        # Never processed by the batch job, so its recommendations are computed live
+        cls.unprocessed_user = users[1]
+        UserRecommendation.objects.filter(user=cls.unprocessed_user).delete()
+        UserNeighborhood.objects.filter(user=cls.unprocessed_user).delete()
+
+        factorization_model.set_model(FactorizationModel(train_factorization(n_factors=20, random_state=0)))
+        cls.addClassCleanup(factorization_model.set_model, None)
+
+    def endpoints(self):
+        movie_id, user_id, list_id = self.movie.id, self.user.id, self.movie_list.id
+
+        def new_comment():
+            return {'comment_id': Comments.objects.create(user=self.user, movie=self.movie, comment='Temporary').id}
+
+        def unrated_movie():
+            Ratings.objects.filter(user=self.user, movie=self.movie).delete()
+            return {}
+
+        def new_rating():
+            Ratings.objects.filter(user=self.user, movie=self.movie).delete()
+            return {'rating_id': Ratings.objects.create(user=self.user, movie=self.movie, rating=3).id}
+
+        def new_list():
+            return {'list_id': MovieList.objects.create(name='Temporary', description='', user=self.user).id}
+
+        def unlisted_movie():
+            MovieListMovies.objects.filter(movie_list=self.movie_list, movie=self.movie).delete()
+            return {}
+
+        def listed_movie():
+            MovieListMovies.objects.get_or_create(movie_list=self.movie_list, movie=self.movie)
+            return {}
+
+        def unlisted_batch():
+            MovieListMovies.objects.filter(movie_list=self.movie_list, movie_id__in=self.batch_movie_ids).delete()
+            return {}
+
+        def new_username():
+            return {'username': f'new{User.objects.count()}'}
+
+        return [
+            Endpoint('movies', 'GET', '/api/movies'),
+            Endpoint('movies_cursor', 'GET', '/api/movies?cursor='),
+            Endpoint('movies_by_rating', 'GET', '/api/movies?sort=rating&cursor='),
+            Endpoint('movie', 'GET', f'/api/movies/{movie_id}'),
+            Endpoint('genres', 'GET', '/api/genres'),
+            Endpoint('genre', 'GET', f'/api/genres/{MoviesGenres.objects.first().genre_id}'),
+            Endpoint('people', 'GET', '/api/people?has_oscar=true'),
+            Endpoint('people_stream', 'GET', '/api/people/stream'),
+            Endpoint('person', 'GET', f'/api/people/{self.person.id}'),
+            Endpoint('oscar_wins', 'GET', '/api/oscar_wins'),
+            Endpoint('ceremony', 'GET', '/api/ceremonies/1'),
+            Endpoint('search', 'GET', '/api/search?query=movie%201'),
+            Endpoint('search_filters', 'GET', f'/api/search?genre={MoviesGenres.objects.first().genre_id}&start_year=1950'),
+            Endpoint('me', 'GET', '/api/me'),
+            Endpoint('login', 'POST', '/api/login', {'username': self.user.username, 'password': PASSWORD}),
+            Endpoint('logout', 'POST', '/api/logout'),
+            Endpoint('register', 'POST', '/api/register',
+                     lambda username: {'username': username, 'password': PASSWORD, 'email': f'{username}@example.com'},
+                     new_username),
+            Endpoint('set_cookie', 'GET', '/api/set-cookie'),
+            Endpoint('profile', 'GET', f'/api/profile/{user_id}'),
+            Endpoint('profile_edit', 'PUT', f'/api/profile/{user_id}',
+                     {'first_name': None, 'last_name': None, 'current_password': None, 'new_password': None,
+                      'new_password_repeat': None, 'bio': 'Bio'}),
+            Endpoint('comments', 'GET', f'/api/movies/{self.comment.movie_id}/comments'),
+            Endpoint('comments_page', 'GET', f'/api/movies/{self.comment.movie_id}/comments?cursor='),
+            Endpoint('comment_add', 'POST', f'/api/movies/{movie_id}/comments',
+                     {'movie_id': movie_id, 'user_id': user_id, 'comment': 'Benchmark'}),
+            Endpoint('comment_delete', 'DELETE', f'/api/movies/{movie_id}/comments/{{comment_id}}', setup=new_comment),
+            Endpoint('comment_edit', 'PUT', f'/api/movies/{self.comment.movie_id}/comments/{self.comment.id}',
+                     {'comment': 'Edited'}),
+            Endpoint('rating', 'GET', f'/api/movies/{self.rating.movie_id}/ratings/{user_id}'),
+            Endpoint('rating_add', 'POST', f'/api/movies/{movie_id}/ratings', {'user_id': user_id, 'rating': 4},
+                     unrated_movie),
+            Endpoint('rating_edit', 'PUT', f'/api/movies/{self.rating.movie_id}/ratings/{self.rating.id}/update',
+                     {'rating': 5}),
+            Endpoint('rating_batch', 'POST', '/api/ratings/batch',
+                     {'ratings': [{'movie_id': batch_movie_id, 'rating': 4} for batch_movie_id in self.batch_movie_ids]}),
+            Endpoint('rating_delete', 'DELETE', f'/api/movies/{movie_id}/ratings/{{rating_id}}/delete', setup=new_rating),
+            Endpoint('movie_recommendation', 'GET', f'/api/movies/{movie_id}/recommendation'),
+            Endpoint('movie_recommendation_text', 'GET', f'/api/movies/{movie_id}/recommendation?mode=text'),
+            Endpoint('movie_recommendation_blend', 'GET', f'/api/movies/{movie_id}/recommendation?mode=blend'),
+            Endpoint('user_recommendation', 'GET', f'/api/profile/{user_id}/recommendation'),
+            Endpoint('user_recommendation_live', 'GET', f'/api/profile/{self.unprocessed_user.id}/recommendation'),
+            Endpoint('user_recommendation_svd', 'GET', f'/api/profile/{user_id}/recommendation?mode=svd'),
+            Endpoint('lists', 'GET', f'/api/profile/{user_id}/lists'),
+            Endpoint('list', 'GET', f'/api/lists/{list_id}'),
+            Endpoint('list_page', 'GET', f'/api/lists/{list_id}?sort=-year&cursor='),
+            Endpoint('list_create', 'POST', f'/api/profile/{user_id}/lists/',
+                     {'name': 'Benchmark', 'description': 'Description', 'user': user_id}),
+            Endpoint('list_edit', 'PUT', f'/api/profile/{user_id}/lists/{list_id}/update',
+                     {'name': 'Renamed', 'description': 'Described'}),
+            Endpoint('list_delete', 'DELETE', f'/api/profile/{user_id}/lists/{{list_id}}/delete', setup=new_list),
+            Endpoint('list_add', 'POST', f'/api/profile/{user_id}/lists/{list_id}/add/{movie_id}',
+                     {'list_id': list_id, 'movie_id': movie_id}, unlisted_movie),
+            Endpoint('list_remove', 'DELETE', f'/api/lists/{list_id}/remove/{movie_id}', setup=listed_movie),
+            Endpoint('list_batch_add', 'POST', f'/api/lists/{list_id}/movies/batch',
+                     {'movie_ids': self.batch_movie_ids}, unlisted_batch),
+            Endpoint('db_pool_stats', 'GET', '/api/stats/db_pool'),
+            Endpoint('sql_stats', 'GET', '/api/stats/sql'),
+            Endpoint('recommender_stats', 'GET', '/api/stats/recommender'),
+        ]
+
+    def request(self, endpoint):
+        params = endpoint.setup() if endpoint.setup else {}
+        body = endpoint.body(**params) if callable(endpoint.body) else endpoint.body
+
+        self.client.force_login(self.user)
+        cache.clear()
+
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = self.client.generic(endpoint.method, endpoint.path.format(**params),
+                                           json.dumps(body) if body is not None else '', content_type='application/json')
+
+            if response.streaming:
+                b''.join(response.streaming_content)
+
+            elapsed = time.perf_counter() - started
+
+        if response.status_code >= 400:
+            self.fail(f'{endpoint.name}: {response.status_code} {response.content[:200]}')
+        return elapsed * 1000, len(queries)
+
+    def measure(self, endpoint):
+        # One unmeasured request first, so lazily loaded state is not charged to the endpoint
+        self.request(endpoint)
+
+        # A full collection pauses ~100 ms on this heap and lands on a random request, so like timeit GC is off here
+        gc.collect()
+        gc.disable()
+        try:
+            timings, query_counts = zip(*(self.request(endpoint) for _ in range(ITERATIONS)))
+        finally:
+            gc.enable()
+
+        return {
+            'method': endpoint.method,
+            'path': endpoint.path,
+            'queries': max(query_counts),
+            'p50_ms': round(statistics.median(timings), 3),
+            'p95_ms': round(percentile(timings, 0.95), 3),
+            'p99_ms': round(percentile(timings, 0.99), 3),
+        }
+
+    def test_every_route_is_benchmarked(self):
+        routes = {
+            (method, f'/api{path}')
+            for _, router in app._routers
+            for path, path_view in router.path_operations.items()
+            for operation in path_view.operations
+            for method in operation.methods
+        }
+        covered = [(endpoint.method, endpoint.path.split('?')[0].split('/')) for endpoint in self.endpoints()]
+
+        def benchmarked(method, path):
+            parts = path.split('/')
+            return any(method == covered_method and len(parts) == len(covered_parts) and
+                       all(part.startswith('{') or part == covered_part for part, covered_part in zip(parts, covered_parts))
+                       for covered_method, covered_parts in covered)
+
+        missing = {route for route in routes if not benchmarked(*route)}
+        self.assertFalse(missing, f'Routes without a benchmark: {sorted(missing)}')
+
+    def test_query_plan_audit(self):
+        # The seeded catalog is too small for sequential scans to matter, so this guards the audit itself
+        # running over every default path
+        output = io.StringIO()
+        call_command('audit_query_plans', analyze=True, stdout=output)
+
+        self.assertIn('no findings', output.getvalue())
+        self.assertNotIn('HTTP', output.getvalue())
+
+    def test_endpoints_within_baseline(self):
+        report = {endpoint.name: self.measure(endpoint) for endpoint in self.endpoints()}
+
+        if REPORT_PATH:
+            Path(REPORT_PATH).write_text(json.dumps({
+                'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'scale': SCALE,
+                'iterations': ITERATIONS,
+                'endpoints': report,
+            }, indent=2))
+
+        if UPDATE_BASELINE:
+            BASELINE_PATH.write_text(json.dumps(
+                {name: {'queries': result['queries'], 'p95_ms': result['p95_ms']} for name, result in report.items()},
+                indent=2, sort_keys=True) + '\n')
+            return
+
+        baseline = json.loads(BASELINE_PATH.read_text()) if BASELINE_PATH.exists() else {}
+        regressions = []
+
+        for name, result in report.items():
+            expected = baseline.get(name)
+
+            if expected is None:
+                regressions.append(f'{name}: no baseline')
+                continue
+
+            if result['queries'] > expected['queries']:
+                regressions.append(f"{name}: {result['queries']} queries, baseline {expected['queries']}")
+
+            if result['p95_ms'] > expected['p95_ms'] * LATENCY_TOLERANCE + LATENCY_SLACK_MS:
+                regressions.append(f"{name}: p95 {result['p95_ms']:.1f} ms, baseline {expected['p95_ms']:.1f} ms")
+
+        self.assertFalse(regressions, 'Endpoint regressions:\n' + '\n'.join(regressions))
+
+
+class StartupImportBudgetTests(SimpleTestCase):
+    """Cold startup of a web worker and of manage.py check, measured with python -X importtime.
+
+    Fails when startup imports one of STARTUP_FORBIDDEN_MODULES, or when its total import time grows past
+    IMPORT_TIME_TOLERANCE times the baseline in import_time_baseline.json. BENCHMARK_UPDATE_BASELINE
+    rewrites that baseline too.
+    """
+
+    def import_times(self, arguments):
+        """Self import time in ms by module, of the fastest of IMPORT_RUNS fresh interpreters."""
+        runs = []
+
+        for _ in range(IMPORT_RUNS):
+            process = subprocess.run([sys.executable, '-X', 'importtime', *arguments], capture_output=True, text=True,
+                                     cwd=Path(__file__).resolve().parent.parent, check=True)
+            times = {}
+
+            for line in process.stderr.splitlines():
+                if not line.startswith('import time:') or 'self [us]' in line:
+                    continue
+
+                self_us, _, module = line[len('import time:'):].split('|')
+                times[module.strip()] = int(self_us) / 1000
+
+            runs.append(times)
+
+        return min(runs, key=lambda times: sum(times.values()))
+
+    def test_startup_within_budget(self):
+        report = {}
+        violations = []
+
+        for name, arguments in STARTUP_COMMANDS.items():
+            times = self.import_times(arguments)
+            report[name] = {'import_ms': round(sum(times.values()), 1), 'modules': len(times)}
+
+            forbidden = sorted({module.split('.')[0] for module in times} & set(STARTUP_FORBIDDEN_MODULES))
+            if forbidden:
+                violations.append(f"{name}: imports {', '.join(forbidden)}")
+
+        if UPDATE_BASELINE:
+            IMPORT_BASELINE_PATH.write_text(json.dumps(report, indent=2, sort_keys=True) + '\n')
+            return
+
+        baseline = json.loads(IMPORT_BASELINE_PATH.read_text()) if IMPORT_BASELINE_PATH.exists() else {}
+
+        for name, result in report.items():
+            expected = baseline.get(name)
+
+            if expected is None:
+                violations.append(f'{name}: no baseline')
+            elif result['import_ms'] > expected['import_ms'] * IMPORT_TIME_TOLERANCE + IMPORT_TIME_SLACK_MS:
+                violations.append(f"{name}: {result['import_ms']:.0f} ms of imports ({result['modules']} modules), "
+                                  f"baseline {expected['import_ms']:.0f} ms ({expected['modules']} modules)")
+
+        self.assertFalse(violations, 'Startup regressions:\n' + '\n'.join(violations))
@@ -1,3 +1,1082 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.management import call_command, CommandError
+from django.contrib.admin.sites import site
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
-# Create your tests here.
+from movies.models import Movie, Genre, MoviesGenres, Person, MoviesActors, MoviesDirectors
+from movies.models import OscarCategory, OscarWinsMovie, OscarWinsPerson
+from movies.models import User, Ratings, MovieList, MovieListMovies
+from movies.models import UserNeighborhood, UserRecommendation, Comments, MovieSimilarity, MovieSearchDocument
+from movies.api import MOVIE_ORDERINGS, comment_pagination, list_pagination
+from movies.admin import MovieAdmin
+from movies.counters import adjust_rating_summaries, stale_comment_counts, stale_oscar_win_counts, stale_rating_summaries
+from movies.counters import sync_comment_counts, sync_rating_summaries
+from movies.instrumentation import statement_table
+from movies.metrics import LATENCY_BUCKETS, Metrics
+from movies.management.commands.seed import BULK_LEVELS, BULK_ROWS, DATA_FILES
+from movies.pagination import KeysetPagination
+from movies.search import search_movies
+from movies.recommender.batch import users_to_process
+from movies.recommender.factorization import FactorizationStore, factorization_model
+from movies.recommender.registry import ModelRegistry
+from movies.recommender.text import text_index
+from movies.recommender.ratings import RatingMatrix, rating_matrix
+
+from psycopg_pool import ConnectionPool
+
+from collections import Counter
+from unittest import mock
+import csv
+import io
+import json
+import math
+import random
+import re
+import tempfile
+import threading
+import time
+
+
+class MoviePageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.movie = Movie.objects.create(id=1, title='The Last Command', release_year=1928, runtime=88,
+                                         budget=0, revenue=0, overview='Overview')
+        actor = Person.objects.create(id=1, first_name='Emil', last_name='Jannings', birthday=None)
+        director = Person.objects.create(id=2, first_name='Josef', last_name='von Sternberg', birthday=None)
+
+        for genre_id, name in enumerate(['Drama', 'War'], start=1):
+            MoviesGenres.objects.create(movie=cls.movie, genre=Genre.objects.create(id=genre_id, name=name))
+
+        MoviesActors.objects.create(movie=cls.movie, actor=actor, character='Gen. Dolgorucki')
+        MoviesDirectors.objects.create(movie=cls.movie, director=director)
+
+        actor_category = OscarCategory.objects.create(id=1, name='Actor')
+        picture_category = OscarCategory.objects.create(id=2, name='Best Picture')
+        OscarWinsMovie.objects.create(movie=cls.movie, category=actor_category, year=1928, ceremony=1)
+        OscarWinsMovie.objects.create(movie=cls.movie, category=picture_category, year=1928, ceremony=1)
+        OscarWinsPerson.objects.create(person=actor, movie=cls.movie, category=actor_category, year=1928, ceremony=1)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_movie_page_is_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/movies/{self.movie.id}')
+
+        self.assertEqual(response.status_code, 200)
+
+        data = response.json()
+        self.assertEqual([genre['name'] for genre in data['genres']], ['Drama', 'War'])
+        self.assertEqual(data['actors'], [{'id': 1, 'first_name': 'Emil', 'last_name': 'Jannings', 'character': 'Gen. Dolgorucki'}])
+        self.assertEqual(data['directors'], [{'id': 2, 'first_name': 'Josef', 'last_name': 'von Sternberg'}])
+        self.assertEqual([(win['category'], win['person'] and win['person']['id']) for win in data['movie_oscar_wins']],
+                         [('Actor', 1), ('Best Picture', None)])
+
+    def test_missing_movie(self):
+        self.assertEqual(self.client.get('/api/movies/404').status_code, 404)
+
+
+class SqlInstrumentationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.movie = Movie.objects.create(title='Sunrise', release_year=1927, runtime=94, budget=0, revenue=0, overview='Overview')
+        cls.staff = User.objects.create_user(username='sql-staff', password='Sql-pass-2024', is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+        # The statement table is per process, start each test from an empty one
+        for attribute in ('statements', 'routes'):
+            patcher = mock.patch.object(statement_table, attribute, {})
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_server_timing_header(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/movies/{self.movie.id}')
+
+        timing = re.fullmatch(r'db;dur=\d+\.\d{2};desc="(\d+) queries", db-slowest;dur=\d+\.\d{2}, total;dur=\d+\.\d{2}',
+                              response['Server-Timing'])
+        self.assertIsNotNone(timing, response['Server-Timing'])
+        self.assertEqual(int(timing.group(1)), len(queries))
+
+        # Served from the catalog cache, so no query and no slowest one
+        response = self.client.get(f'/api/movies/{self.movie.id}')
+        self.assertRegex(response['Server-Timing'], r'^db;dur=0\.00;desc="0 queries", total;dur=\d+\.\d{2}$')
+
+    def test_sql_stats(self):
+        for _ in range(2):
+            cache.clear()
+            self.client.get(f'/api/movies/{self.movie.id}')
+
+        self.client.force_login(self.staff)
+        stats = self.client.get('/api/stats/sql', {'limit': 2}).json()
+
+        route = stats['routes']['api/movies/<movie_id>']
+        self.assertEqual(route['requests'], 2)
+        self.assertEqual(route['queries'], 2)
+        self.assertEqual(len(route['slowest']), 2)
+
+        # Both page loads ran one statement, under one normalized key
+        self.assertEqual(len(stats['statements']), 2)
+        movie_page = next(entry for entry in statement_table.snapshot(50)['statements']
+                          if entry['sql'].startswith('SELECT "movies_movie"."id"'))
+        self.assertEqual(movie_page['calls'], 2)
+        self.assertTrue(movie_page['sql'].endswith('WHERE "movies_movie"."id" = %s LIMIT N'))
+        self.assertAlmostEqual(movie_page['mean_ms'], movie_page['total_ms'] / 2)
+
+        self.client.force_login(User.objects.create_user(username='sql-user', password='Sql-pass-2024'))
+        self.assertEqual(self.client.get('/api/stats/sql').status_code, 403)
+
+
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.movie = Movie.objects.create(title='Sunrise', release_year=1927, runtime=94, budget=0, revenue=0, overview='Overview')
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch('movies.metrics.metrics', Metrics())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_exposition(self):
+        for path in (f'/api/movies/{self.movie.id}', f'/api/movies/{self.movie.id}', '/api/movies/404', '/nowhere'):
+            self.client.get(path)
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+
+        samples = {}
+        for line in response.content.decode().splitlines():
+            if not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                samples[name] = float(value)
+
+        page = 'route="api/movies/<movie_id>",method="GET"'
+        self.assertEqual(samples[f'http_requests_total{{{page},status="200"}}'], 2)
+        self.assertEqual(samples[f'http_requests_total{{{page},status="404"}}'], 1)
+        self.assertEqual(samples['http_requests_total{route="unmatched",method="GET",status="404"}'], 1)
+        # The scrape itself
+        self.assertEqual(samples['http_requests_in_flight'], 1)
+
+        buckets = [samples[f'http_request_duration_seconds_bucket{{{page},le="{bound}"}}']
+                   for bound in LATENCY_BUCKETS + ('+Inf',)]
+        self.assertEqual(buckets, sorted(buckets))
+        self.assertEqual(buckets[-1], 3)
+        self.assertEqual(samples[f'http_request_duration_seconds_count{{{page}}}'], 3)
+        self.assertGreater(samples[f'http_request_duration_seconds_sum{{{page}}}'], 0)
+
+    def test_only_allowed_addresses(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.7').status_code, 403)
+
+        with self.settings(METRICS_ALLOWED_IPS=['10.0.0.0/8']):
+            self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.1.2.3').status_code, 200)
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+
+class OscarWinsPageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.wings = Movie.objects.create(title='Wings', release_year=1927, runtime=144, budget=0, revenue=0, overview='Overview')
+        cls.heaven = Movie.objects.create(title='7th Heaven', release_year=1927, runtime=110, budget=0, revenue=0,
+                                          overview='Overview')
+        cls.broadway = Movie.objects.create(title='The Broadway Melody', release_year=1929, runtime=100, budget=0,
+                                            revenue=0, overview='Overview')
+        cls.borzage = Person.objects.create(first_name='Frank', last_name='Borzage', birthday=None)
+
+        cls.picture = OscarCategory.objects.create(name='Best Picture')
+        cls.directing = OscarCategory.objects.create(name='Directing')
+
+        cls.wins = [
+            OscarWinsMovie.objects.create(movie=cls.wings, category=cls.picture, year=1929, ceremony=1),
+            OscarWinsMovie.objects.create(movie=cls.heaven, category=cls.directing, year=1929, ceremony=1),
+            OscarWinsMovie.objects.create(movie=cls.broadway, category=cls.picture, year=1930, ceremony=2),
+        ]
+        OscarWinsPerson.objects.create(person=cls.borzage, movie=cls.heaven, category=cls.directing, year=1929, ceremony=1)
+
+    def setUp(self):
+        cache.clear()
+
+    def oscar_wins(self, **params):
+        return [win['id'] for win in self.client.get('/api/oscar_wins', params).json()['items']]
+
+    def test_filters(self):
+        first, second, third = (win.id for win in self.wins)
+
+        self.assertEqual(self.oscar_wins(), [first, second, third])
+        self.assertEqual(self.oscar_wins(year_from=1930), [third])
+        self.assertEqual(self.oscar_wins(year_to=1929), [first, second])
+        self.assertEqual(self.oscar_wins(year_from=1929, year_to=1929, category=self.picture.id), [first])
+        self.assertEqual(self.oscar_wins(ceremony=2), [third])
+        self.assertEqual(self.oscar_wins(movie=self.heaven.id), [second])
+        self.assertEqual(self.oscar_wins(year_from=1931), [])
+
+    def test_ceremony_page(self):
+        response = self.client.get('/api/ceremonies/1')
+        self.assertEqual(response.status_code, 200)
+
+        data = response.json()
+        self.assertEqual((data['ceremony'], data['year']), (1, 1929))
+        self.assertEqual(data['wins'], [
+            {'id': self.wins[0].id, 'category': 'Best Picture', 'year': 1929, 'ceremony': 1, 'person': None,
+             'movie_id': self.wings.id, 'movie_title': 'Wings'},
+            {'id': self.wins[1].id, 'category': 'Directing', 'year': 1929, 'ceremony': 1,
+             'person': {'id': self.borzage.id, 'first_name': 'Frank', 'last_name': 'Borzage'},
+             'movie_id': self.heaven.id, 'movie_title': '7th Heaven'},
+        ])
+
+    def test_missing_ceremony(self):
+        self.assertEqual(self.client.get('/api/ceremonies/99').status_code, 404)
+
+
+@override_settings(CATALOG_CACHE_TIMEOUT=1, CATALOG_GENERATION_TIMEOUT=1)
+class PerProcessCatalogCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.movie = Movie.objects.create(title='Wings', release_year=1927, runtime=144, budget=0, revenue=0,
+                                         overview='Overview')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_edits_made_elsewhere_show_once_entries_expire(self):
+        path = f'/api/movies/{self.movie.id}'
+        response = self.client.get(path)
+        etag = response['ETag']
+
+        # Like an edit whose generation bump only reached another worker's cache
+        Movie.objects.filter(id=self.movie.id).update(title='Wings (restored)')
+        self.assertEqual(self.client.get(path, headers={'If-None-Match': etag}).status_code, 304)
+
+        time.sleep(1.1)
+
+        response = self.client.get(path, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['title'], 'Wings (restored)')
+
+
+@override_settings(RATING_CACHE_INTERVAL=1)
+class RatingSummaryCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.movie = Movie.objects.create(title='Sunrise', release_year=1927, runtime=94, budget=0, revenue=0,
+                                         overview='Overview')
+        cls.users = [User.objects.create_user(username=f'user{i}', password='Rating-pass-2024') for i in range(3)]
+
+    def setUp(self):
+        cache.clear()
+
+    def rate(self, user, rating):
+        with self.captureOnCommitCallbacks(execute=True):
+            Ratings.objects.create(user=user, movie=self.movie, rating=rating)
+
+    def page_rating(self):
+        return self.client.get(f'/api/movies/{self.movie.id}').json()['rating']
+
+    def test_ratings_late_in_an_interval_reach_the_cached_page(self):
+        self.rate(self.users[0], 5)
+        self.assertEqual(self.page_rating()['count'], 1)
+
+        # Both land in the interval the first rating bumped, so the cached page may lag until it ends
+        self.rate(self.users[1], 4)
+        self.rate(self.users[2], 3)
+        time.sleep(1.1)
+
+        rating = self.page_rating()
+        self.assertEqual(rating['count'], 3)
+        self.assertEqual(rating['average'], 4.0)
+        self.assertEqual(rating['histogram'], {'1': 0, '2': 0, '3': 1, '4': 1, '5': 1})
+
+
+class DuplicateRatingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.movie = Movie.objects.create(title='Wings', release_year=1927, runtime=144, budget=0, revenue=0,
+                                         overview='Overview')
+        cls.user = User.objects.create_user(username='rater', password='Rating-pass-2024')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_rating_a_movie_twice_is_a_conflict(self):
+        path = f'/api/movies/{self.movie.id}/ratings'
+        body = {'user_id': self.user.id, 'rating': 4}
+
+        self.assertEqual(self.client.post(path, body, content_type='application/json').status_code, 200)
+        self.assertEqual(self.client.post(path, body, content_type='application/json').status_code, 409)
+        self.assertEqual(Ratings.objects.filter(user=self.user, movie=self.movie).count(), 1)
+
+    def test_remove_duplicate_rows(self):
+        # As in a database from before the unique constraints, which this transaction drops
+        with connection.schema_editor() as editor:
+            editor.remove_constraint(Ratings, Ratings._meta.constraints[0])
+            editor.remove_constraint(MovieListMovies, MovieListMovies._meta.constraints[0])
+
+        ratings = Ratings.objects.bulk_create(Ratings(user=self.user, movie=self.movie, rating=rating) for rating in (2, 5, 3))
+        movie_list = MovieList.objects.create(name='Silent', user=self.user)
+        entries = MovieListMovies.objects.bulk_create(MovieListMovies(movie_list=movie_list, movie=self.movie) for _ in range(2))
+
+        with self.assertRaises(CommandError):
+            call_command('remove_duplicate_rows', check=True, stdout=io.StringIO())
+
+        call_command('remove_duplicate_rows', stdout=io.StringIO())
+
+        self.assertEqual(list(Ratings.objects.values_list('id', flat=True)), [ratings[-1].id])
+        self.assertEqual(list(MovieListMovies.objects.values_list('id', flat=True)), [entries[0].id])
+        call_command('remove_duplicate_rows', check=True, stdout=io.StringIO())
+
+
+class PeopleStreamTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Person.objects.bulk_create(Person(first_name=f'First{i}', last_name=f'Last{i}', birthday=None) for i in range(5))
+
+    async def test_asgi_export_streams_asynchronously(self):
+        response = await self.async_client.get('/api/people/stream', {'format': 'json'})
+
+        # An async iterator, which ASGI sends chunk by chunk instead of reading it into a list first
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual([person['first_name'] for person in json.loads(body)], [f'First{i}' for i in range(5)])
+
+    def test_wsgi_export_streams_ndjson(self):
+        response = self.client.get('/api/people/stream')
+
+        self.assertFalse(response.is_async)
+        lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual([json.loads(line)['last_name'] for line in lines], [f'Last{i}' for i in range(5)])
+
+
+class UserRecommendationBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.movies = Movie.objects.bulk_create(
+            Movie(title=f'Movie {i}', release_year=1930 + i, runtime=90, budget=0, revenue=0, overview='Overview')
+            for i in range(6))
+        cls.users = [User.objects.create_user(username=f'viewer{i}', password='Rating-pass-2024') for i in range(5)]
+
+        user_ratings = [{0: 5, 1: 4}, {0: 5, 1: 4, 2: 5, 3: 2}, {0: 4, 2: 3, 4: 5}, {5: 1, 4: 2}]
+        Ratings.objects.bulk_create(
+            Ratings(user=cls.users[user], movie=cls.movies[movie], rating=rating)
+            for user, ratings in enumerate(user_ratings) for movie, rating in ratings.items())
+        sync_rating_summaries()
+
+    def build(self, **options):
+        call_command('build_user_recommendations', workers=1, stdout=io.StringIO(), **options)
+
+    def stored(self, user):
+        return list(UserRecommendation.objects.filter(user=user).order_by('rank').values_list('movie_id', 'estimated_rating'))
+
+    def rate(self, user, movie, rating):
+        with self.captureOnCommitCallbacks(execute=True):
+            Ratings.objects.create(user=user, movie=movie, rating=rating)
+
+    def test_stores_the_live_recommendations(self):
+        self.build()
+
+        for user in self.users[:4]:
+            recommendations, neighbor_ids = rating_matrix.recommend_with_neighbors(user.id)
+            self.assertEqual(self.stored(user), recommendations)
+            self.assertEqual(UserNeighborhood.objects.get(user=user).neighbor_ids, neighbor_ids)
+
+        # Never rated anything, so never stored
+        self.assertFalse(UserNeighborhood.objects.filter(user=self.users[4]).exists())
+
+    def test_changed_only_selects_users_whose_neighborhood_rated(self):
+        self.build()
+        self.assertEqual(users_to_process(changed_only=True), ([], []))
+
+        changed, newcomer, leaver = self.users[3], self.users[4], self.users[0]
+        self.rate(changed, self.movies[0], 3)
+        self.rate(newcomer, self.movies[1], 5)
+        Ratings.objects.filter(user=leaver).delete()
+
+        expected = {changed.id, newcomer.id}
+        expected.update(UserNeighborhood.objects.filter(neighbor_ids__contains=[changed.id]).exclude(user=leaver)
+                        .values_list('user_id', flat=True))
+        user_ids, obsolete = users_to_process(changed_only=True)
+        self.assertEqual(set(user_ids), expected)
+        self.assertEqual(obsolete, [leaver.id])
+
+        computed_at = dict(UserNeighborhood.objects.values_list('user_id', 'computed_at'))
+        self.build(changed_only=True)
+        recomputed = dict(UserNeighborhood.objects.values_list('user_id', 'computed_at'))
+
+        self.assertNotIn(leaver.id, recomputed)
+        self.assertFalse(UserRecommendation.objects.filter(user=leaver).exists())
+        self.assertEqual({user_id for user_id, at in recomputed.items() if at != computed_at.get(user_id)}, expected)
+        self.assertEqual(self.stored(changed), rating_matrix.recommend(changed.id))
+
+    def test_movies_rated_since_the_batch_are_not_served(self):
+        self.build()
+        user = self.users[0]
+        stored_ids = [movie_id for movie_id, _ in self.stored(user)]
+        self.assertGreater(len(stored_ids), 1)
+
+        self.client.force_login(user)
+        self.rate(user, Movie.objects.get(id=stored_ids[0]), 4)
+        response = self.client.get(f'/api/profile/{user.id}/recommendation')
+
+        self.assertEqual([movie['id'] for movie in response.json()], stored_ids[1:])
+
+
+class RecommenderRollbackTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        movies = Movie.objects.bulk_create(
+            Movie(title=f'Movie {i}', release_year=1930 + i, runtime=90, budget=0, revenue=0, overview='Overview')
+            for i in range(4))
+        users = [User.objects.create_user(username=f'critic{i}', password='Rating-pass-2024') for i in range(3)]
+        Ratings.objects.bulk_create(Ratings(user=user, movie=movie, rating=1 + (user.id + movie.id) % 5)
+                                    for user in users for movie in movies)
+
+    def setUp(self):
+        self.registry = ModelRegistry(self.enterContext(tempfile.TemporaryDirectory()))
+        self.enterContext(mock.patch.object(factorization_model, 'registry', self.registry))
+
+    def command(self, name, **options):
+        call_command(name, factors=2, epochs=2, seed=0, stdout=io.StringIO(), **options)
+        return self.registry.current()
+
+    def test_rollback_is_kept_until_unpinned(self):
+        first = self.command('train_recommender')
+        second = self.command('train_recommender')
+        self.assertNotEqual(first['version'], second['version'])
+
+        rolled_back = self.command('train_recommender', rollback=True)
+        self.assertEqual(rolled_back['version'], first['version'])
+        self.assertTrue(rolled_back['pinned'])
+
+        # Past --max-age, so only the pin keeps retraining from replacing the rolled back version
+        self.assertEqual(self.command('retrain_recommender', max_age=0), rolled_back)
+
+        unpinned = self.command('train_recommender', unpin=True)
+        self.assertEqual(unpinned['version'], first['version'])
+        self.assertNotIn('pinned', unpinned)
+
+        retrained = self.command('retrain_recommender', max_age=0)
+        self.assertNotIn(retrained['version'], (first['version'], second['version']))
+        self.assertEqual(retrained['previous']['version'], first['version'])
+
+    def test_fold_in_of_a_new_user(self):
+        self.command('train_recommender')
+        model = FactorizationStore(self.registry).get()
+        movie_ids = model.movie_ids.tolist()
+        new_user = max(model.user_index) + 1
+
+        # Only the rated movies are left out, and estimates stay on the rating scale
+        recommendations = model.recommend(new_user, [(movie_ids[0], 5), (movie_ids[1], 4)], rated_since_training=True)
+        self.assertEqual(sorted(movie_id for movie_id, _ in recommendations), sorted(movie_ids[2:]))
+        self.assertTrue(all(1 <= estimate <= 5 for _, estimate in recommendations))
+
+        # A user rating everything high gets a higher bias than one rating everything low
+        fond, _ = model.fold_in([(movie_id, 5) for movie_id in movie_ids])
+        harsh, _ = model.fold_in([(movie_id, 1) for movie_id in movie_ids])
+        self.assertGreater(fond, harsh)
+
+        # Nothing to fold in from movies the model never saw
+        self.assertIsNone(model.fold_in([(max(movie_ids) + 1, 5)]))
+        self.assertEqual(model.recommend(new_user, [(max(movie_ids) + 1, 5)], rated_since_training=True), [])
+
+    def test_store_swaps_in_a_newly_published_model(self):
+        store = FactorizationStore(self.registry, reload_interval=0)
+        first = self.command('train_recommender')
+
+        # Nothing served yet, so the first load happens in the request
+        self.assertEqual(store.get().version, first['version'])
+
+        second = self.command('train_recommender')
+        loading = threading.Event()
+        finish_loading = threading.Event()
+        load = self.registry.load
+
+        def slow_load(entry):
+            loading.set()
+            finish_loading.wait(5)
+            return load(entry)
+
+        with mock.patch.object(self.registry, 'load', slow_load):
+            # The old model keeps serving while the new one loads in the background
+            self.assertEqual(store.get().version, first['version'])
+            self.assertTrue(loading.wait(5))
+            self.assertEqual(store.get().version, first['version'])
+
+            reload_thread = next(thread for thread in threading.enumerate() if thread.name == 'recommender-reload')
+            finish_loading.set()
+            reload_thread.join(5)
+
+        self.assertEqual(store.get().version, second['version'])
+
+
+class KeysetPaginationTests(TestCase):
+    """Walking the cursors returns every row once, in the order offset paging returns them, ties included."""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Few distinct values, so most rows tie on every sort column but the id
+        cls.movies = Movie.objects.bulk_create(
+            Movie(title=f'Movie {i % 3}', release_year=1930 + i % 4, runtime=90, budget=0, revenue=0, overview='Overview',
+                  num_oscar_wins=i % 3, num_ratings=i % 2, average_rating=(i % 4) / 2)
+            for i in range(23))
+
+        cls.user = User.objects.create_user(username='pager', password='Rating-pass-2024')
+        cls.movie = cls.movies[0]
+        comments = Comments.objects.bulk_create(
+            Comments(user=cls.user, movie=cls.movie, comment=f'Comment {i}') for i in range(23))
+        Comments.objects.filter(id__in=[comment.id for comment in comments[::2]]).update(created_at=comments[0].created_at)
+        sync_comment_counts()
+
+        cls.movie_list = MovieList.objects.create(name='Pages', description='Paged', user=cls.user)
+        entries = MovieListMovies.objects.bulk_create(
+            MovieListMovies(movie_list=cls.movie_list, movie=movie) for movie in cls.movies)
+        MovieListMovies.objects.filter(id__in=[entry.id for entry in entries[1::2]]).update(added_at=entries[1].added_at)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        self.enterContext(mock.patch.object(comment_pagination, 'page_size', 4))
+        self.enterContext(mock.patch.object(list_pagination, 'page_size', 4))
+
+    def walk_cursors(self, path, params=None, items='items'):
+        ids, cursor = [], ''
+        while cursor is not None:
+            data = self.client.get(path, {**(params or {}), 'cursor': cursor}).json()
+            ids += [item['id'] for item in data[items]]
+            cursor = data['next']
+        return ids
+
+    def walk_pages(self, queryset, paginator):
+        ids, page = [], 1
+        while items := paginator.paginate_queryset(queryset, KeysetPagination.Input(page=page))['items']:
+            ids += [item.id for item in items]
+            page += 1
+        return ids
+
+    def assert_walks_match(self, queryset, page_size=4):
+        paginator = KeysetPagination(page_size=page_size)
+        by_offset = self.walk_pages(queryset, paginator)
+
+        by_cursor, cursor = [], ''
+        while cursor is not None:
+            page = paginator.paginate_queryset(queryset, KeysetPagination.Input(cursor=cursor))
+            by_cursor += [item.id for item in page['items']]
+            cursor = page['next']
+
+        self.assertEqual(by_cursor, by_offset)
+        self.assertEqual(sorted(by_cursor), sorted(queryset.values_list('id', flat=True)))
+
+    def test_orderings_with_ties(self):
+        for ordering in [MOVIE_ORDERINGS['oscars'], MOVIE_ORDERINGS['rating'], ('-num_oscar_wins',),
+                         ('release_year', 'title'), ('-average_rating', 'release_year', '-id')]:
+            with self.subTest(ordering=ordering):
+                self.assert_walks_match(Movie.objects.order_by(*ordering))
+
+        self.assert_walks_match(Comments.objects.filter(movie=self.movie).order_by('-created_at'))
+
+    def test_movies_by_rating(self):
+        expected = list(Movie.objects.order_by(*MOVIE_ORDERINGS['rating']).values_list('id', flat=True))
+        self.assertEqual(self.walk_cursors('/api/movies', {'sort': 'rating'}), expected)
+
+    def test_comments_feed(self):
+        expected = list(Comments.objects.filter(movie=self.movie).order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(self.walk_cursors(f'/api/movies/{self.movie.id}/comments'), expected)
+
+    def test_comments_without_cursor_are_the_first_page(self):
+        path = f'/api/movies/{self.movie.id}/comments'
+        first_page = self.client.get(path, {'cursor': ''}).json()['items']
+
+        self.assertEqual(len(first_page), 4)
+        self.assertEqual(self.client.get(path).json(), first_page)
+
+    def test_comments_of_a_missing_movie(self):
+        self.assertEqual(self.client.get('/api/movies/999999/comments').status_code, 404)
+        self.assertEqual(self.client.get('/api/movies/999999/comments', {'cursor': ''}).status_code, 404)
+        self.assertEqual(self.client.get(f'/api/movies/{self.movies[1].id}/comments').json(), [])
+
+    def test_list_sorts(self):
+        entries = MovieListMovies.objects.filter(movie_list=self.movie_list)
+        fields = {'year': 'movie__release_year', 'title': 'movie__title', 'added': 'added_at'}
+
+        for sort in ['year', '-year', 'title', '-title', 'added', '-added']:
+            with self.subTest(sort=sort):
+                field = fields[sort.lstrip('-')]
+                expected = list(entries.order_by(f'-{field}' if sort.startswith('-') else field, 'id')
+                                .values_list('movie_id', flat=True))
+                self.assertEqual(self.walk_cursors(f'/api/lists/{self.movie_list.id}', {'sort': sort}, 'movies'), expected)
+
+
+class CounterTests(TestCase):
+    """The signal-maintained counters on Movie stay equal to a recomputation from their source rows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.movies = Movie.objects.bulk_create(
+            Movie(title=f'Movie {i}', release_year=1930 + i, runtime=90, budget=0, revenue=0, overview='Overview')
+            for i in range(3))
+        cls.users = [User.objects.create_user(username=f'counter{i}', password='Rating-pass-2024') for i in range(3)]
+        cls.category = OscarCategory.objects.create(name='Best Picture')
+
+    def assert_counters_match(self):
+        self.assertEqual(stale_oscar_win_counts(), [])
+        self.assertEqual(stale_rating_summaries(), [])
+        self.assertEqual(stale_comment_counts(), [])
+
+    def rating_summary(self, movie):
+        movie.refresh_from_db()
+        return (movie.num_ratings, movie.ratings_sum, movie.average_rating,
+                [getattr(movie, f'num_ratings_{value}') for value in range(1, 6)])
+
+    def test_oscar_wins(self):
+        first, second = self.movies[:2]
+        wins = [OscarWinsMovie.objects.create(movie=first, category=self.category, year=1930, ceremony=3) for _ in range(2)]
+        self.assert_counters_match()
+
+        wins[0].movie = second
+        wins[0].save()
+        self.assert_counters_match()
+
+        wins[1].delete()
+        self.assert_counters_match()
+        self.assertEqual([Movie.objects.get(id=movie.id).num_oscar_wins for movie in (first, second)], [0, 1])
+
+    def test_rating_summaries(self):
+        first, second, third = self.movies
+        ratings = [Ratings.objects.create(user=user, movie=first, rating=rating) for user, rating in zip(self.users, (5, 3, 4))]
+        self.assert_counters_match()
+        self.assertEqual(self.rating_summary(first), (3, 12, 4.0, [0, 0, 1, 1, 1]))
+
+        ratings[0].rating = 1
+        ratings[0].save()
+        self.assert_counters_match()
+
+        ratings[1].movie = second
+        ratings[1].save()
+        self.assert_counters_match()
+
+        ratings[2].delete()
+        self.assert_counters_match()
+        self.assertEqual(self.rating_summary(first), (1, 1, 1.0, [1, 0, 0, 0, 0]))
+        self.assertEqual(self.rating_summary(second), (1, 3, 3.0, [0, 0, 1, 0, 0]))
+
+        self.client.force_login(self.users[0])
+        response = self.client.post('/api/ratings/batch', {'ratings': [
+            {'movie_id': first.id, 'rating': 4}, {'movie_id': second.id, 'rating': 2},
+            {'movie_id': third.id, 'rating': 5}, {'movie_id': third.id, 'rating': 3},
+        ]}, content_type='application/json')
+
+        self.assertEqual([result['status'] for result in response.json()['results']], ['updated', 'created', 'created'])
+        self.assert_counters_match()
+        self.assertEqual(self.rating_summary(second), (2, 5, 2.5, [0, 1, 1, 0, 0]))
+        self.assertEqual(self.rating_summary(third), (1, 3, 3.0, [0, 0, 1, 0, 0]))
+
+    def test_batch_locks_the_ratings_it_replaces(self):
+        first, second, _ = self.movies
+        Ratings.objects.create(user=self.users[0], movie=first, rating=2)
+        self.client.force_login(self.users[0])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post('/api/ratings/batch', {'ratings': [
+                {'movie_id': first.id, 'rating': 4}, {'movie_id': second.id, 'rating': 2},
+            ]}, content_type='application/json')
+
+        locked = [query['sql'] for query in queries.captured_queries if query['sql'].endswith('FOR UPDATE')]
+        self.assertEqual([sql.split(' FROM ')[1].split()[0] for sql in locked], ['"movies_user"', '"movies_ratings"'])
+        self.assert_counters_match()
+
+    def test_comment_counts(self):
+        movie = self.movies[0]
+        self.client.force_login(self.users[0])
+
+        for text in ('First', 'Second'):
+            comment = {'movie_id': movie.id, 'user_id': self.users[0].id, 'comment': text}
+            response = self.client.post(f'/api/movies/{movie.id}/comments', comment, content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+        self.assert_counters_match()
+
+        self.client.delete(f'/api/movies/{movie.id}/comments/{Comments.objects.filter(movie=movie).first().id}')
+        self.assert_counters_match()
+        self.assertEqual(Movie.objects.get(id=movie.id).num_comments, 1)
+
+    def test_sync_counters_repairs_drift(self):
+        movie = self.movies[0]
+        Ratings.objects.create(user=self.users[0], movie=movie, rating=4)
+        Comments.objects.create(user=self.users[0], movie=movie, comment='Drift')
+        Movie.objects.filter(id=movie.id).update(num_oscar_wins=F('num_oscar_wins') + 2, num_ratings_4=0,
+                                                 num_comments=F('num_comments') + 1)
+
+        with self.assertRaises(CommandError) as raised:
+            call_command('sync_counters', check=True, stdout=io.StringIO())
+        self.assertEqual(str(raised.exception).count(f'[{movie.id}]'), 3)
+
+        call_command('sync_counters', stdout=io.StringIO())
+
+        self.assert_counters_match()
+        call_command('sync_counters', check=True, stdout=io.StringIO())
+
+    def test_admin_save_keeps_counters(self):
+        movie = Movie.objects.get(id=self.movies[0].id)
+        # Ratings made while the change form was open
+        adjust_rating_summaries({movie.id: (None, 5)})
+        Movie.objects.filter(id=movie.id).update(num_oscar_wins=1, num_comments=2)
+
+        movie.title = 'Renamed'
+        MovieAdmin(Movie, site).save_model(None, movie, None, change=True)
+
+        movie.refresh_from_db()
+        self.assertEqual((movie.title, movie.num_ratings, movie.num_ratings_5, movie.num_oscar_wins, movie.num_comments),
+                         ('Renamed', 1, 1, 1, 2))
+
+
+class BulkSeedTests(TransactionTestCase):
+    """Bulk seeding loads tables on worker threads, each committing on its own connection."""
+
+    CSV_ROWS = {
+        'movie': [{'movie_id': movie_id, 'year': 1926 + movie_id, 'title': title, 'tagline': '', 'runtime': 90,
+                   'budget': 0, 'revenue': 0, 'overview': 'Overview'}
+                  for movie_id, title in enumerate(['Sunrise', 'The Crowd', 'Wings', 'Seventh Heaven'], start=1)],
+        'genre': [{'genre_id': 1, 'genre': 'Drama'}, {'genre_id': 2, 'genre': 'War'}],
+        'oscar_categories': [{'category_id': 1, 'category_name': 'Best Picture'},
+                             {'category_id': 2, 'category_name': 'Directing'}],
+        'people': [{'person_id': person_id, 'first_name': first_name, 'last_name': last_name, 'birthday': birthday,
+                    'place_of_birth': '', 'biography': ''}
+                   for person_id, first_name, last_name, birthday in [(1, 'Friedrich', 'Murnau', '1888-12-28'),
+                                                                      (2, 'Janet', 'Gaynor', ''),
+                                                                      (3, 'Frank', 'Borzage', '1894-04-23')]],
+        'movies_genres': [{'movie_id': 1, 'genre_id': 1}, {'movie_id': 2, 'genre_id': 1},
+                          {'movie_id': 3, 'genre_id': 2}, {'movie_id': 4, 'genre_id': 1}],
+        'oscar_wins_movie': [{'movie_id': 1, 'category_id': 1, 'year_ceremony': 1929, 'ceremony': 1},
+                             {'movie_id': 3, 'category_id': 1, 'year_ceremony': 1929, 'ceremony': 1},
+                             {'movie_id': 4, 'category_id': 2, 'year_ceremony': 1929, 'ceremony': 1}],
+        'movies_actors': [{'movie_id': 1, 'actor_id': 2, 'character': 'The Wife'},
+                          {'movie_id': 4, 'actor_id': 2, 'character': 'Diane'}],
+        'movies_directors': [{'movie_id': 1, 'director_id': 1}, {'movie_id': 4, 'director_id': 3}],
+        'oscar_wins_person': [{'person_id': 3, 'movie_id': 4, 'category_id': 2, 'year_ceremony': 1929, 'ceremony': 1}],
+    }
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        data_files = {}
+        for name, rows in self.CSV_ROWS.items():
+            data_files[name] = f'{directory.name}/{name}.csv'
+            with open(data_files[name], 'w', encoding='utf-8', newline='') as file:
+                writer = csv.DictWriter(file, fieldnames=list(rows[0]))
+                writer.writeheader()
+                writer.writerows(rows)
+
+        patcher = mock.patch.dict(DATA_FILES, data_files)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_bulk_seed_loads_every_table(self):
+        output = io.StringIO()
+        call_command('seed', 'all', bulk=True, batch_size=2, workers=2, stdout=output)
+
+        for level in BULK_LEVELS:
+            for name in level:
+                with self.subTest(table=name):
+                    self.assertEqual(BULK_ROWS[name][0].objects.count(), len(self.CSV_ROWS[name]))
+                    self.assertIn(f'{name}: {len(self.CSV_ROWS[name])} rows', output.getvalue())
+
+        connection.check_constraints()
+        self.assertEqual(stale_oscar_win_counts(), [])
+        self.assertEqual(dict(Movie.objects.values_list('id', 'num_oscar_wins')), {1: 1, 2: 0, 3: 1, 4: 1})
+        self.assertEqual(MovieSearchDocument.objects.get(movie_id=4).document, 'seventh heaven frank borzage janet gaynor')
+
+        # Sequences were moved past the loaded ids
+        self.assertEqual(Genre.objects.create(name='Comedy').id, 3)
+
+
+class ConnectionPoolTests(TransactionTestCase):
+    """Requests end by closing their connection, which must hand it back to the pool rather than disconnect."""
+
+    def setUp(self):
+        self.staff = User.objects.create_user(username='pool-staff', password='Pool-pass-2024', is_staff=True)
+        self.client.force_login(self.staff)
+        # The test client keeps connections open across requests, so each one is closed as a finished request would
+        connection.close()
+        connection.pool.wait()
+
+    def test_requests_return_their_connection(self):
+        before = connection.pool_stats()
+
+        with mock.patch.object(ConnectionPool, 'putconn', autospec=True, side_effect=ConnectionPool.putconn) as putconn:
+            for _ in range(5):
+                cache.clear()
+                self.assertEqual(self.client.get('/api/genres').status_code, 200)
+                connection.close()
+
+        after = connection.pool_stats()
+        self.assertEqual(putconn.call_count, 5)
+        self.assertEqual(after['requests'] - before['requests'], 5)
+        self.assertEqual(after['connections_opened'], before['connections_opened'])
+        self.assertEqual(after['in_use'], 0)
+
+    def test_pool_stats_endpoint(self):
+        response = self.client.get('/api/stats/db_pool')
+        self.assertEqual(response.status_code, 200)
+
+        stats = response.json()['default']
+        self.assertEqual(stats['name'], f"default:{connection.settings_dict['NAME']}")
+        self.assertEqual((stats['min_size'], stats['max_size']), (connection.pool.min_size, connection.pool.max_size))
+        # The connection serving the request itself
+        self.assertEqual(stats['in_use'], 1)
+        self.assertEqual(stats['size'], stats['available'] + stats['in_use'])
+        self.assertEqual(stats['errors'], 0)
+
+        self.staff.is_staff = False
+        self.staff.save()
+        self.assertEqual(self.client.get('/api/stats/db_pool').status_code, 403)
+
+
+class SearchDocumentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.sunrise = Movie.objects.create(title='Sunrise', release_year=1927, runtime=94, budget=0, revenue=0,
+                                           overview='Overview')
+        cls.crowd = Movie.objects.create(title='The Crowd', release_year=1928, runtime=98, budget=0, revenue=0,
+                                         overview='Overview')
+        cls.biography = Movie.objects.create(title='Murnau', release_year=1990, runtime=90, budget=0, revenue=0,
+                                             overview='Overview')
+        cls.director = Person.objects.create(first_name='Friedrich', last_name='Murnau', birthday=None)
+        MoviesDirectors.objects.create(movie=cls.sunrise, director=cls.director)
+
+    def search(self, query):
+        return [movie['id'] for movie in self.client.get('/api/search', {'query': query}).json()['items']]
+
+    def test_person_rename_refreshes_documents(self):
+        self.assertEqual(self.search('Friedrich'), [self.sunrise.id])
+
+        self.director.first_name = 'Wilhelm'
+        self.director.save()
+
+        self.assertEqual(self.search('Wilhelm'), [self.sunrise.id])
+        self.assertEqual(self.search('Friedrich'), [])
+
+    def test_new_credit_refreshes_document(self):
+        self.assertEqual(self.search('Vidor'), [])
+
+        vidor = Person.objects.create(first_name='King', last_name='Vidor', birthday=None)
+        MoviesDirectors.objects.create(movie=self.crowd, director=vidor)
+
+        self.assertEqual(self.search('Vidor'), [self.crowd.id])
+
+    def test_deleting_a_movie_with_credits(self):
+        gaynor = Person.objects.create(first_name='Janet', last_name='Gaynor', birthday=None)
+        MoviesActors.objects.create(movie=self.sunrise, actor=gaynor)
+
+        self.sunrise.delete()
+        self.crowd.delete()
+        connection.check_constraints()
+
+        self.assertFalse(Movie.objects.filter(id__in=[self.sunrise.id, self.crowd.id]).exists())
+        self.assertFalse(MovieSearchDocument.objects.filter(movie_id__in=[self.sunrise.id, self.crowd.id]).exists())
+
+    def test_deleting_a_person_refreshes_their_movies(self):
+        self.director.delete()
+        connection.check_constraints()
+
+        self.assertEqual(self.search('Friedrich'), [])
+        self.assertEqual(self.search('Sunrise'), [self.sunrise.id])
+
+    def test_title_match_ranks_above_people_match(self):
+        self.assertEqual(self.search('murnau'), [self.biography.id, self.sunrise.id])
+
+    def test_substring_and_trigram_matches(self):
+        # Not a word of any document, only a substring of one
+        self.assertEqual(self.search('unris'), [self.sunrise.id])
+        # Misspelled, so only trigram similarity matches it
+        self.assertEqual(self.search('Sunrize'), [self.sunrise.id])
+
+    def test_every_branch_uses_an_index(self):
+        # Priced out of the plan, any sequential scan left could not have used the GIN indexes, nor could
+        # a walk of the primary key, which the planner picks over them for a few rows
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('SET LOCAL enable_indexscan = off')
+        plan = search_movies(Movie.objects.all(), 'sunrise').explain()
+
+        self.assertNotIn('Seq Scan on movies_moviesearchdocument', plan)
+        for index in ('movie_search_vector_gin', 'movie_search_document_trgm'):
+            self.assertIn(index, plan)
+
+
+class MovieSimilarityIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(1927)
+        cls.movies = Movie.objects.bulk_create(
+            Movie(title=f'Movie {i}', release_year=1930 + i, runtime=90, budget=0, revenue=0, overview='Overview')
+            for i in range(9))
+        genres = Genre.objects.bulk_create(Genre(name=name) for name in ('Drama', 'Film Noir', 'Musical', 'Western'))
+        people = Person.objects.bulk_create(Person(first_name=f'Anna{i}', last_name=f'Lee{i}', birthday=None)
+                                            for i in range(6))
+
+        MoviesGenres.objects.bulk_create(MoviesGenres(movie=movie, genre=genre)
+                                         for movie in cls.movies for genre in rng.sample(genres, 2))
+        MoviesDirectors.objects.bulk_create(MoviesDirectors(movie=movie, director=rng.choice(people)) for movie in cls.movies)
+        MoviesActors.objects.bulk_create(MoviesActors(movie=movie, actor=actor)
+                                         for movie in cls.movies for actor in rng.sample(people, 3))
+
+    def brute_force_scores(self):
+        """Cosine similarity of every pair of movies, from plain token counts of their cast, director and genres."""
+        tokens = {movie.id: Counter() for movie in self.movies}
+
+        credits = [*MoviesActors.objects.values_list('movie_id', 'actor__first_name', 'actor__last_name'),
+                   *MoviesDirectors.objects.values_list('movie_id', 'director__first_name', 'director__last_name')]
+        for movie_id, first_name, last_name in credits:
+            tokens[movie_id][f'{first_name}{last_name}'.lower()] += 1
+        for movie_id, name in MoviesGenres.objects.values_list('movie_id', 'genre__name'):
+            tokens[movie_id][name.replace(' ', '').lower()] += 1
+
+        def cosine(a, b):
+            dot = sum(count * b[token] for token, count in a.items())
+            return dot / math.sqrt(sum(v * v for v in a.values()) * sum(v * v for v in b.values()))
+
+        return {movie_id: {other: cosine(tokens[movie_id], tokens[other]) for other in tokens if other != movie_id}
+                for movie_id in tokens}
+
+    def test_top_k_matches_brute_force_cosine(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(MOVIE_TEXT_INDEX_DIR=directory):
+            self.addCleanup(text_index.clear)
+            # A chunk smaller than the catalog, so the blocks are stitched together too
+            call_command('build_movie_similarity', top_k=3, chunk_size=4, stdout=io.StringIO())
+
+        expected = self.brute_force_scores()
+
+        for movie in self.movies:
+            stored = list(MovieSimilarity.objects.filter(movie=movie).order_by('rank')
+                          .values_list('similar_movie_id', 'score'))
+            top_scores = sorted(expected[movie.id].values(), reverse=True)[:3]
+
+            with self.subTest(movie=movie.id):
+                self.assertEqual(len(stored), 3)
+                # Scores tied in the brute force may come in any order, so ranks are checked through their scores
+                for (similar_id, score), top_score in zip(stored, top_scores):
+                    self.assertAlmostEqual(score, top_score, places=5)
+                    self.assertAlmostEqual(score, expected[movie.id][similar_id], places=5)
+
+
+class RatingMatrixTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.movies = Movie.objects.bulk_create(
+            Movie(title=f'Movie {i}', release_year=1930 + i, runtime=90, budget=0, revenue=0, overview='Overview')
+            for i in range(5))
+        cls.users = [User.objects.create_user(username=f'matrix{i}', password='Rating-pass-2024') for i in range(4)]
+
+        for user, movie_ratings in zip(cls.users, [{0: 5, 1: 4, 2: 1}, {0: 3, 2: 4}, {1: 2, 3: 5}]):
+            for movie, rating in movie_ratings.items():
+                Ratings.objects.create(user=user, movie=cls.movies[movie], rating=rating)
+
+    def cells(self, matrix):
+        coo = matrix._current_matrix().tocoo()
+        return {(matrix.user_ids[row], matrix.movie_ids[col]): value
+                for row, col, value in zip(coo.row, coo.col, coo.data) if value}
+
+    def assert_matches_fresh_load(self, matrix):
+        fresh = RatingMatrix()
+        fresh.load()
+
+        self.assertEqual(self.cells(matrix), self.cells(fresh))
+        for user in self.users:
+            with self.subTest(user=user.id):
+                self.assertEqual(matrix.has_user(user.id), fresh.has_user(user.id))
+                if fresh.has_user(user.id):
+                    self.assertAlmostEqual(matrix._sq_norms[matrix.user_index[user.id]],
+                                           fresh._sq_norms[fresh.user_index[user.id]])
+                    self.assertEqual(matrix.recommend(user.id), fresh.recommend(user.id))
+
+    def rate(self, matrix, user, movie, rating):
+        Ratings.objects.update_or_create(user=user, movie=movie, defaults={'rating': rating})
+        matrix.set_rating(user.id, movie.id, rating)
+
+    def unrate(self, matrix, user, movie):
+        Ratings.objects.filter(user=user, movie=movie).delete()
+        matrix.remove_rating(user.id, movie.id)
+
+    def test_incremental_updates_match_a_fresh_load(self):
+        matrix = RatingMatrix(max_pending=2)
+        matrix.load()
+        users, movies = self.users, self.movies
+
+        # Stored cells are edited in place
+        self.rate(matrix, users[0], movies[0], 2)
+        self.rate(matrix, users[1], movies[2], 5)
+        self.assert_matches_fresh_load(matrix)
+
+        # New cells, of a new user and a new movie too, wait in the pending buffer until the next query
+        self.rate(matrix, users[1], movies[3], 4)
+        self.rate(matrix, users[3], movies[4], 3)
+        self.assertEqual(len(matrix._pending), 2)
+        self.assert_matches_fresh_load(matrix)
+        self.assertEqual(matrix._pending, {})
+
+        # Overflowing the buffer folds it into the matrix without a query
+        self.rate(matrix, users[2], movies[4], 1)
+        self.rate(matrix, users[2], movies[0], 2)
+        self.rate(matrix, users[3], movies[1], 5)
+        self.assertEqual(matrix._pending, {})
+        self.assert_matches_fresh_load(matrix)
+
+        # Deleting zeroes a stored cell and drops a pending one, rating again restores them
+        self.rate(matrix, users[3], movies[0], 4)
+        self.unrate(matrix, users[0], movies[1])
+        self.unrate(matrix, users[3], movies[0])
+        self.assert_matches_fresh_load(matrix)
+
+        self.rate(matrix, users[0], movies[1], 3)
+        self.unrate(matrix, users[3], movies[4])
+        self.assert_matches_fresh_load(matrix)
+
+    def test_expired_matrix_reloads_in_the_background(self):
+        matrix = RatingMatrix(max_age=60)
+        matrix.load()
+        users, movies = self.users, self.movies
+
+        # Rows written behind the matrix' back only show up after a reload. The test transaction is invisible
+        # to the reload thread's connection, so the table is read up front and handed over once released.
+        Ratings.objects.create(user=users[3], movie=movies[4], rating=2)
+        state = matrix._read_state()
+        reload_started = threading.Event()
+        finish_reload = threading.Event()
+
+        def slow_read_state():
+            reload_started.set()
+            finish_reload.wait(5)
+            return state
+
+        matrix._loaded_at -= 120
+        with mock.patch.object(matrix, '_read_state', slow_read_state):
+            matrix.ensure_loaded()
+            self.assertTrue(reload_started.wait(5))
+
+            # Queries keep using the old matrix while it loads, and writes made meanwhile survive the swap
+            self.assertFalse(matrix.has_user(users[3].id))
+            self.rate(matrix, users[0], movies[0], 1)
+
+            reload_thread = next(thread for thread in threading.enumerate() if thread.name == 'rating-matrix-reload')
+            finish_reload.set()
+            reload_thread.join(5)
+
+        self.assertTrue(matrix.has_user(users[3].id))
+        self.assertIsNone(matrix._replay)
+        self.assert_matches_fresh_load(matrix)
+
+    def test_moving_a_rating_to_another_movie(self):
+        rating_matrix.load()
+        user, movies = self.users[0], self.movies
+
+        rating = Ratings.objects.get(user=user, movie=movies[1])
+        rating.movie = movies[4]
+        with self.captureOnCommitCallbacks(execute=True):
+            rating.save()
+
+        self.assert_matches_fresh_load(rating_matrix)
@@ -0,0 +1,113 @@
+"""
+PostgreSQL backend that checks connections out of a psycopg 3 connection pool.
+
+Configured with a "pool" dict in the database OPTIONS, passed to psycopg_pool.ConnectionPool
+(min_size, max_size, timeout, max_lifetime, max_idle, ...). Django closes the connection at the
+end of every request, which returns it to the pool instead of tearing down the session.
+"""
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.base.base import NO_DB_ALIAS
+from django.db.backends.postgresql import base, creation
+
+from psycopg import IsolationLevel
+from psycopg_pool import ConnectionPool
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Idle pooled sessions on the test database would block DROP DATABASE
+        self.connection.close_pool(test_database_name)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+    _connection_pools = {}
+
+    @property
+    def pool(self):
+        pool_options = self.settings_dict['OPTIONS'].get('pool')
+
+        if self.alias == NO_DB_ALIAS or not pool_options:
+            return None
+
+        if self.settings_dict['CONN_MAX_AGE'] != 0:
+            raise ImproperlyConfigured('Pooled connections require CONN_MAX_AGE = 0')
+
+        # Keyed by database name too, so the test runner's test database never reuses the main pool
+        key = (self.alias, self.settings_dict['NAME'])
+
+        if key not in self._connection_pools:
+            connect_kwargs = self.get_connection_params()
+            connect_kwargs['autocommit'] = True
+
+            pool = ConnectionPool(
+                kwargs=connect_kwargs,
+                open=False,
+                check=ConnectionPool.check_connection if self.settings_dict['CONN_HEALTH_CHECKS'] else None,
+                name=f'{self.alias}:{self.settings_dict["NAME"]}',
+                **pool_options,
+            )
+            # Several threads may race to build the pool, the first one stored wins
+            self._connection_pools.setdefault(key, pool)
+
+        return self._connection_pools[key]
+
+    def pool_stats(self):
+        pool = self.pool
+
+        if pool is None:
+            return None
+
+        stats = pool.get_stats()
+        return {
+            'name': pool.name,
+            'size': stats.get('pool_size', 0),
+            'available': stats.get('pool_available', 0),
+            'in_use': stats.get('pool_size', 0) - stats.get('pool_available', 0),
+            'waiting': stats.get('requests_waiting', 0),
+            'requests': stats.get('requests_num', 0),
+            'requests_queued': stats.get('requests_queued', 0),
+            'wait_ms': stats.get('requests_wait_ms', 0),
+            'errors': stats.get('requests_errors', 0) + stats.get('connections_errors', 0),
+            'connections_opened': stats.get('connections_num', 0),
+            'connections_lost': stats.get('connections_lost', 0),
+            'min_size': pool.min_size,
+            'max_size': pool.max_size,
+        }
+
+    def close_pool(self, database_name=None):
+        pool = self._connection_pools.pop((self.alias, database_name or self.settings_dict['NAME']), None)
+
+        if pool is not None:
+            pool.close()
+
+    def get_connection_params(self):
+        conn_params = super().get_connection_params()
+        conn_params.pop('pool', None)
+        return conn_params
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+
+        if pool is None:
+            return super().get_new_connection(conn_params)
+
+        pool.open()
+        connection = pool.getconn()
+
+        isolation_level = self.settings_dict['OPTIONS'].get('isolation_level')
+        self.isolation_level = IsolationLevel.READ_COMMITTED if isolation_level is None else IsolationLevel(isolation_level)
+        connection.isolation_level = self.isolation_level
+
+        return connection
+
+    def _close(self):
+        if self.connection is None or self.pool is None:
+            return super()._close()
+
+        with self.wrap_database_errors:
+            # The connection's own pool, in case the pool was replaced while it was checked out
+            self.connection._pool.putconn(self.connection)
+            self.connection = None
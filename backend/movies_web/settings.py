@@ -51,7 +51,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'movies.metrics.metrics_middleware',
     'corsheaders.middleware.CorsMiddleware',
+    'movies.instrumentation.sql_instrumentation_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -86,17 +88,68 @@ WSGI_APPLICATION = 'movies_web.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# Connections come from a psycopg 3 pool (movies_web.pooled_postgresql), sized per worker process.
+# Set DB_POOL_MAX_SIZE=0 to connect per request instead.
+
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 10))
+
 DATABASES = {
     'default': {
-        "ENGINE": "django.db.backends.postgresql",
+        "ENGINE": "movies_web.pooled_postgresql",
         "NAME": "",
         "USER": "",
         "PASSWORD": "",
         "HOST": "",
         "PORT": "",
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            "pool": {
+                "min_size": int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+                "max_size": DB_POOL_MAX_SIZE,
+                "timeout": float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+                "max_lifetime": float(os.environ.get('DB_POOL_MAX_LIFETIME', 60 * 30)),
+                "max_idle": float(os.environ.get('DB_POOL_MAX_IDLE', 60 * 5)),
+            },
+        } if DB_POOL_MAX_SIZE else {},
+    }
+}
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# Use a shared backend (memcached, redis) when running several workers, so catalog cache generations are shared
+
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+CACHE_IS_SHARED = CACHE_BACKEND != 'django.core.cache.backends.locmem.LocMemCache'
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
     }
 }
 
+# Normalized SQL statements kept per process for /api/stats/sql
+SQL_STATEMENT_TABLE_SIZE = 500
+
+# Workers of a multi-process deployment dump their metrics into METRICS_DIR every METRICS_FLUSH_INTERVAL
+# seconds, and /metrics sums them. Unset for a single process.
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = 5.0
+
+# Addresses or networks allowed to scrape /metrics, which exposes every route's traffic. Matched against
+# REMOTE_ADDR, so behind a proxy list the proxy's address and keep /metrics off the public site.
+METRICS_ALLOWED_IPS = os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+
+# Seconds a serialized catalog response is kept; entries are invalidated earlier by catalog edits.
+# A per-process cache never sees the generation bumps of other workers, the admin or `seed`, so there
+# both the responses and the generation expire after a short while instead.
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24 if CACHE_IS_SHARED else 30
+CATALOG_GENERATION_TIMEOUT = None if CACHE_IS_SHARED else CATALOG_CACHE_TIMEOUT
+
+# Rating writes invalidate cached catalog responses at most once per this many seconds, so the rating
+# summaries on cached movie pages can lag the ratings by up to this long
+RATING_CACHE_INTERVAL = 60
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -154,3 +207,17 @@ CORS_ALLOWED_ORIGINS = [
 
 CORS_EXPOSE_HEADERS = ['Content-Type', 'X-CSRFToken']
 CORS_ALLOW_CREDENTIALS = True
+
+# Seconds before a worker reloads its in-memory rating matrix, picking up ratings written by other workers
+RATING_MATRIX_MAX_AGE = 300
+
+# Versions of the matrix factorization model published by `manage.py train_recommender` / `retrain_recommender`.
+# Workers check the directory's manifest every RECOMMENDER_RELOAD_INTERVAL seconds and swap to the version it
+# names, so every worker of a deployment must see the same directory.
+RECOMMENDER_MODEL_DIR = os.environ.get('RECOMMENDER_MODEL_DIR', str(BASE_DIR / 'artifacts' / 'recommender'))
+RECOMMENDER_RELOAD_INTERVAL = 30
+RECOMMENDER_KEEP_VERSIONS = 3
+
+# TF-IDF index of movie overviews and taglines written by `manage.py build_movie_similarity`, reloaded by workers
+# within RECOMMENDER_RELOAD_INTERVAL seconds of a rebuild
+MOVIE_TEXT_INDEX_DIR = os.environ.get('MOVIE_TEXT_INDEX_DIR', str(BASE_DIR / 'artifacts' / 'text'))
@@ -17,6 +17,7 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 from movies.api import app
+from movies.metrics import metrics_view
 
 from django.conf import settings
 from django.conf.urls.static import static
@@ -24,4 +25,5 @@ from django.conf.urls.static import static
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', app.urls),
+    path('metrics', metrics_view),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)